@@ -0,0 +1,111 @@
+"""
+邮箱账户配置模块
+单账户模式从环境变量读取，多账户模式从 ACCOUNTS_FILE 指定的 JSON 文件读取
+"""
+
+import json
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+from app.config import config
+
+
+@dataclass(frozen=True)
+class AccountConfig:
+    """单个邮箱账户的收发配置"""
+
+    name: str
+    source_email: str
+    source_password: str
+    target_email: str
+    imap_server: str = "imap.qq.com"
+    imap_port: int = 993
+    smtp_server: str = "smtp.qq.com"
+    smtp_port: int = 465
+    smtp_password: Optional[str] = None
+
+    @property
+    def sender_password(self) -> str:
+        """SMTP授权码，未设置时使用IMAP授权码"""
+        return self.smtp_password or self.source_password
+
+    @classmethod
+    def from_config(cls) -> "AccountConfig":
+        """从全局环境变量配置构建默认账户"""
+        return cls(
+            name="default",
+            source_email=config.SOURCE_EMAIL or "",
+            source_password=config.SOURCE_PASSWORD or "",
+            target_email=config.TARGET_EMAIL or "",
+            imap_server=config.SOURCE_IMAP_SERVER,
+            imap_port=config.SOURCE_IMAP_PORT,
+            smtp_server=config.SMTP_SERVER,
+            smtp_port=config.SMTP_PORT,
+            smtp_password=config.SMTP_PASSWORD,
+        )
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "AccountConfig":
+        """
+        从字典构建账户配置，未填写的服务器配置沿用全局配置
+
+        Args:
+            data: 账户配置字典
+
+        Returns:
+            账户配置
+        """
+        known = {f.name for f in fields(cls)}
+        unknown = set(data) - known
+        if unknown:
+            raise ValueError(f"Unknown account fields: {', '.join(sorted(unknown))}")
+
+        missing = [
+            key
+            for key in ("source_email", "source_password", "target_email")
+            if not data.get(key)
+        ]
+        if missing:
+            raise ValueError(
+                f"Missing required account configuration: {', '.join(missing)}"
+            )
+
+        values: Dict[str, Any] = {
+            "name": data.get("name") or data["source_email"],
+            "imap_server": config.SOURCE_IMAP_SERVER,
+            "imap_port": config.SOURCE_IMAP_PORT,
+            "smtp_server": config.SMTP_SERVER,
+            "smtp_port": config.SMTP_PORT,
+        }
+        values.update(data)
+        values["imap_port"] = int(values["imap_port"])
+        values["smtp_port"] = int(values["smtp_port"])
+        return cls(**values)
+
+
+def load_accounts(path: Union[str, Path]) -> List[AccountConfig]:
+    """
+    读取多账户配置文件
+
+    文件为 JSON 格式，可以是账户列表，也可以是 {"accounts": [...]}。
+
+    Args:
+        path: 配置文件路径
+
+    Returns:
+        账户配置列表
+    """
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get("accounts", [])
+    if not isinstance(data, list) or not data:
+        raise ValueError(f"No accounts configured in {path}")
+
+    accounts = [AccountConfig.from_dict(item) for item in data]
+    names = [account.name for account in accounts]
+    duplicates = {name for name in names if names.count(name) > 1}
+    if duplicates:
+        raise ValueError(f"Duplicate account names: {', '.join(sorted(duplicates))}")
+    return accounts
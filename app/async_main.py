@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+邮件自动转发机器人的 asyncio 引擎
+所有 LLM 调用共享同一个事件循环（Runner.run），IMAP/SMTP 阻塞操作放入线程池执行，
+每封邮件作为一个 asyncio 任务处理，无需为每个请求占用一个线程
+"""
+
+import asyncio
+import signal
+import sys
+import os
+import threading
+from typing import Any, Callable, Optional, Set, TypeVar
+
+# 添加项目根目录到 Python 路径，确保能正确导入模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from .config import config
+from .email_record import EmailRecord
+from .log_policy import log_sampler
+from .mail_fetcher import MailFetcher
+from .mail_sender import MailSender
+from .mail_processor import MailProcessor
+from .mail_handler import handle_email_async
+from .metrics import MetricsServer, start_metrics_server
+from .tracing import start_tracing, tracer
+from .uid_ledger import UidLedger
+from .utils.logger import default_logger as logger
+
+T = TypeVar("T")
+
+
+class AsyncEmailForwarderBot:
+    """基于 asyncio 的邮件自动转发机器人"""
+
+    def __init__(self):
+        """初始化邮件转发机器人"""
+        self.ledger = (
+            UidLedger(
+                config.UID_LEDGER_PATH,
+                max_attempts=config.UID_LEDGER_MAX_ATTEMPTS,
+                retry_delay=config.UID_LEDGER_RETRY_DELAY,
+            )
+            if config.UID_LEDGER
+            else None
+        )
+        self.fetcher = MailFetcher(ledger=self.ledger)
+        self.sender = MailSender()
+        self.processor = MailProcessor()
+
+        self.check_interval = config.CHECK_INTERVAL
+        self.idle_timeout = config.IDLE_TIMEOUT
+        self.max_concurrency = config.ASYNC_LLM_CONCURRENCY
+
+        # 运行状态：asyncio 事件用于协程，线程事件用于打断线程池中的 IDLE
+        self.is_running = False
+        self._stop_event = asyncio.Event()
+        self._thread_stop_event = threading.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.metrics_server: Optional[MetricsServer] = None
+        self._in_flight: Set[int] = set()
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+
+    async def _run_blocking(self, func: Callable[..., T], *args: Any) -> T:
+        """在线程池中执行阻塞的 IMAP/SMTP 操作"""
+        return await asyncio.to_thread(func, *args)
+
+    async def _handle_new_email(self, email_info: EmailRecord) -> None:
+        """
+        处理单封新邮件：LLM → 发送 → 标记已读
+
+        Args:
+            email_info: 邮件记录
+        """
+        await handle_email_async(email_info, self.processor, self.sender, self.fetcher)
+
+    async def _process_and_release(self, email_info: EmailRecord) -> None:
+        """处理邮件并在结束后释放并发名额"""
+        try:
+            await self._handle_new_email(email_info)
+        finally:
+            self._in_flight.discard(email_info.uid)
+            self._slots.release()
+
+    async def _check_new_emails(self) -> None:
+        """检查新邮件，为每封邮件创建处理任务"""
+        try:
+            uids = await self._run_blocking(self.fetcher.search_new_emails)
+            # 没有新邮件的轮询心跳按采样记录
+            if uids or log_sampler.allow("poll"):
+                logger.info(f"Found {len(uids)} new emails")
+
+            # 跳过仍在处理中的邮件
+            uids = [uid for uid in uids if uid not in self._in_flight]
+            if not uids:
+                return
+
+            # 分批获取，处理完一批的并发名额前不会下载下一批
+            chunk_size = max(1, self.fetcher.fetch_chunk_size)
+            for start in range(0, len(uids), chunk_size):
+                raw_emails = await self._run_blocking(
+                    self.fetcher.fetch_emails_by_uids, uids[start : start + chunk_size]
+                )
+
+                for uid, raw_email in raw_emails.items():
+                    if self._stop_event.is_set():
+                        return
+                    email_info = self.fetcher.parse_raw_email(raw_email, uid)
+                    if email_info is None:
+                        continue
+
+                    # 并发名额用尽时在此等待（背压）
+                    await self._slots.acquire()
+                    self._in_flight.add(uid)
+                    logger.info(f"Processing new mail with UID: {uid}")
+                    task = asyncio.create_task(self._process_and_release(email_info))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+        except Exception as e:
+            logger.error(f"Error checking emails: {e}")
+
+    async def _wait_for_new_mail(self, use_idle: bool) -> None:
+        """等待 IDLE 推送或下一个检查间隔"""
+        if use_idle:
+            while not self._stop_event.is_set():
+                try:
+                    if await self._run_blocking(
+                        self.fetcher.wait_for_new_mail,
+                        self.idle_timeout,
+                        self._thread_stop_event,
+                    ):
+                        return
+                except Exception as e:
+                    logger.error(f"Error during IMAP IDLE: {e}")
+                    await self._run_blocking(self.fetcher.disconnect)
+                    break
+
+        try:
+            await asyncio.wait_for(self._stop_event.wait(), self.check_interval)
+        except asyncio.TimeoutError:
+            pass
+
+    async def run(self) -> None:
+        """启动机器人并运行直到收到停止信号"""
+        logger.info("Starting Email Forwarder Bot (asyncio engine)...")
+        self._loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                self._loop.add_signal_handler(signum, self.stop)
+            except (NotImplementedError, RuntimeError):
+                # 非主线程或不支持的平台上无法注册信号处理器
+                pass
+
+        try:
+            logger.info("Testing SMTP connection...")
+            if not await self._run_blocking(self.sender.test_connection):
+                logger.error("SMTP connection test failed, exiting...")
+                return
+
+            self.is_running = True
+            self.metrics_server = start_metrics_server(
+                config.METRICS_HOST, config.METRICS_PORT
+            )
+            start_tracing(config.TRACING, config.TRACE_EXPORTER, config.TRACE_PATH)
+            logger.info("Email Forwarder Bot started successfully!")
+
+            use_idle = config.IMAP_IDLE and await self._run_blocking(
+                self.fetcher.supports_idle
+            )
+            if config.IMAP_IDLE and not use_idle:
+                logger.warning(
+                    "IMAP server does not support IDLE, falling back to polling"
+                )
+
+            while not self._stop_event.is_set():
+                await self._check_new_emails()
+                await self._wait_for_new_mail(use_idle)
+        finally:
+            await self._shutdown()
+
+    def stop(self) -> None:
+        """请求停止机器人（可从其他线程调用）"""
+        logger.info("Stopping Email Forwarder Bot...")
+        self.is_running = False
+        self._thread_stop_event.set()
+        if self._loop is not None and self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._stop_event.set)
+        else:
+            self._stop_event.set()
+
+    async def _shutdown(self) -> None:
+        """等待处理中的邮件完成并关闭连接"""
+        if self._tasks:
+            logger.info(f"Waiting for {len(self._tasks)} emails in progress...")
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self._run_blocking(self.fetcher.disconnect)
+        await self._run_blocking(self.sender.close)
+        await self.processor.aclose()
+        if self.ledger is not None:
+            await self._run_blocking(self.ledger.close)
+        if self.metrics_server is not None:
+            await self._run_blocking(self.metrics_server.close)
+        tracer.close()
+        logger.info("Email Forwarder Bot stopped")
+
+
+def main():
+    """asyncio 引擎入口"""
+    try:
+        asyncio.run(AsyncEmailForwarderBot().run())
+    except Exception as e:
+        print(f"Fatal error in main program: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
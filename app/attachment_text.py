@@ -0,0 +1,189 @@
+"""
+附件文本提取模块
+从聊天工具导出的 .txt / .csv / .html 附件中提取文本，追加到正文后一起交给 LLM。
+每种类型单独限制解码后的字节数，base64 附件只解码上限以内的前缀；
+附件逐个解码、转换为文本后即释放，同一时刻只有一个附件的解码内容在内存中
+"""
+
+import binascii
+import csv
+import io
+import os
+from email.message import Message
+from typing import Dict, Optional, Tuple
+
+from app.config import config
+from app.html_text import html_to_text
+
+# 按扩展名识别的附件类型，优先于 Content-Type（很多客户端把附件标为 octet-stream）
+_EXTENSION_KINDS = {
+    ".txt": "txt",
+    ".log": "txt",
+    ".csv": "csv",
+    ".html": "html",
+    ".htm": "html",
+}
+
+_CONTENT_TYPE_KINDS = {
+    "text/plain": "txt",
+    "text/csv": "csv",
+    "text/comma-separated-values": "csv",
+    "application/csv": "csv",
+    "text/html": "html",
+}
+
+# 附件文本块的标题和截断提示
+ATTACHMENT_HEADER = "[附件: {filename}]"
+TRUNCATED_NOTE = "[附件内容超过大小上限，已截断]"
+
+
+def attachment_kind(filename: str, content_type: str) -> Optional[str]:
+    """
+    判断附件是否为支持提取文本的类型
+
+    Args:
+        filename: 附件文件名
+        content_type: 附件的 Content-Type
+
+    Returns:
+        "txt"、"csv" 或 "html"，不支持时返回None
+    """
+    extension = os.path.splitext(filename.strip().lower())[1]
+    if extension in _EXTENSION_KINDS:
+        return _EXTENSION_KINDS[extension]
+    return _CONTENT_TYPE_KINDS.get(content_type.lower())
+
+
+def attachment_limits() -> Dict[str, int]:
+    """
+    按配置返回各类型附件解码后的字节上限
+
+    Returns:
+        类型 -> 字节上限，未启用附件提取时返回空字典
+    """
+    if not config.ATTACHMENT_TEXT:
+        return {}
+    limits = {
+        "txt": config.ATTACHMENT_TXT_MAX_BYTES,
+        "csv": config.ATTACHMENT_CSV_MAX_BYTES,
+        "html": config.ATTACHMENT_HTML_MAX_BYTES,
+    }
+    return {kind: limit for kind, limit in limits.items() if limit > 0}
+
+
+def encoded_size(decoded_bytes: int, encoding: str) -> int:
+    """
+    估算解码后不超过指定字节数所需下载的编码字节数，用于部分获取
+
+    Args:
+        decoded_bytes: 解码后的字节上限
+        encoding: Content-Transfer-Encoding
+
+    Returns:
+        需要下载的编码字节数
+    """
+    encoding = encoding.lower()
+    if encoding == "base64":
+        # 每行 76 个字符加 CRLF，对应 57 个字节
+        return -(-decoded_bytes // 57) * 78
+    if encoding == "quoted-printable":
+        return decoded_bytes * 3
+    return decoded_bytes
+
+
+def _decode_limited(part: Message, max_bytes: int) -> Tuple[bytes, bool]:
+    """
+    解码附件内容，最多保留 max_bytes 字节
+
+    base64 附件只截取足够长的编码前缀再解码，不会先解码整个附件。
+
+    Returns:
+        (解码后的内容, 是否被截断)
+    """
+    encoding = str(part.get("Content-Transfer-Encoding", "")).strip().lower()
+    payload = part.get_payload()
+    if encoding == "base64" and isinstance(payload, str):
+        # 先按字符截取（包含换行），去掉空白后再对齐到 4 的倍数
+        prefix = payload[: encoded_size(max_bytes + 3, "base64")]
+        encoded = "".join(prefix.split())
+        encoded = encoded[: len(encoded) // 4 * 4]
+        try:
+            data = binascii.a2b_base64(encoded)
+        except binascii.Error:
+            decoded = part.get_payload(decode=True)
+            data = decoded if isinstance(decoded, bytes) else b""
+        truncated = len(data) > max_bytes or len(prefix) < len(payload.rstrip())
+    else:
+        decoded = part.get_payload(decode=True)
+        if not isinstance(decoded, bytes):
+            return b"", False
+        data = decoded
+        truncated = len(data) > max_bytes
+    return data[:max_bytes], truncated
+
+
+def _decode_text(data: bytes, charset: Optional[str]) -> str:
+    """
+    把附件内容解码为文本
+
+    声明了字符集时按声明解码；否则依次尝试 UTF-8（含 BOM）和 GB18030
+    （国内聊天工具导出的文件常用 GBK 编码）。
+    """
+    if charset:
+        try:
+            return data.decode(charset, errors="ignore")
+        except LookupError:
+            pass
+    try:
+        return data.decode("utf-8-sig")
+    except UnicodeDecodeError as e:
+        # 截断可能切开最后一个多字节字符
+        if e.reason == "unexpected end of data":
+            return data[: e.start].decode("utf-8-sig", errors="ignore")
+    return data.decode("gb18030", errors="ignore")
+
+
+def _csv_to_text(text: str) -> str:
+    """把 CSV 的每一行转换为以空格分隔的一行文本，去掉空单元格"""
+    lines = []
+    for row in csv.reader(io.StringIO(text)):
+        cells = [cell.strip() for cell in row if cell.strip()]
+        if cells:
+            lines.append(" ".join(cells))
+    return "\n".join(lines)
+
+
+def extract_attachment_text(
+    part: Message, filename: str, kind: str, max_bytes: int
+) -> str:
+    """
+    提取单个附件的文本
+
+    Args:
+        part: 附件对应的 MIME 部分
+        filename: 附件文件名
+        kind: 附件类型（attachment_kind 的返回值）
+        max_bytes: 解码后的字节上限
+
+    Returns:
+        带标题的附件文本块，附件为空（如部分获取时未下载内容）时返回空字符串
+    """
+    data, truncated = _decode_limited(part, max_bytes)
+    text = _decode_text(data, part.get_content_charset())
+    del data
+    if truncated:
+        # 丢弃截断处不完整的最后一行
+        text = text[: text.rfind("\n") + 1]
+
+    if kind == "csv":
+        text = _csv_to_text(text)
+    elif kind == "html":
+        text = html_to_text(text)
+    text = text.strip()
+    if not text:
+        return ""
+
+    block = f"{ATTACHMENT_HEADER.format(filename=filename)}\n{text}"
+    if truncated:
+        block += f"\n{TRUNCATED_NOTE}"
+    return block
@@ -0,0 +1,212 @@
+"""
+聊天记录分块模块
+估算聊天记录的 token 数，超长时按消息（时间戳）边界切分为多个块，
+各块并发分析后再合并（map-reduce），避免超出模型上下文或单次调用过慢
+"""
+
+import asyncio
+import re
+from typing import Awaitable, Callable, List
+
+from app.rate_limiter import PRIORITY_MAP, PRIORITY_REDUCE, PRIORITY_SINGLE
+
+# 聊天记录中一条消息的开始：行首为日期或时间（微信/QQ 导出格式）
+# 例如 "2024-01-01 10:00"、"2024/1/1 10:00:05"、"10:00:05 张三"、"张三 2024-01-01 10:00"
+_MESSAGE_START = re.compile(
+    r"^\s*(?:\S{1,32}\s+)?(?:\d{4}[-/.年]\d{1,2}[-/.月]\d{1,2}日?|\d{1,2}:\d{2}(?::\d{2})?)"
+)
+
+# CJK 字符（含全角标点），按每字约 1 个 token 估算
+_CJK = re.compile(
+    r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]"
+)
+
+# 其余字符按每 4 个约 1 个 token 估算
+_CHARS_PER_TOKEN = 4
+
+# map 和 reduce 阶段附加在输入前的说明
+MAP_HEADER = (
+    "以下是一份较长聊天记录的第 {index}/{total} 部分，请按要求分析这一部分：\n\n"
+)
+REDUCE_HEADER = (
+    "以下是同一份聊天记录按时间顺序分段分析的结果，请合并为一份完整、不重复的分析：\n\n"
+)
+PART_HEADER = "【第 {index} 部分】\n"
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的 token 数
+
+    不依赖具体模型的分词器：CJK 字符每字计 1 个，其余字符每 4 个计 1 个，
+    对中文聊天记录略偏保守。
+
+    Args:
+        text: 文本
+
+    Returns:
+        估算的 token 数
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + _CHARS_PER_TOKEN - 1) // _CHARS_PER_TOKEN
+
+
+def split_messages(text: str) -> List[str]:
+    """
+    按消息边界拆分聊天记录，每条消息包括时间戳行及其后的续行
+
+    Args:
+        text: 聊天记录文本
+
+    Returns:
+        消息列表，拼接后与原文一致
+    """
+    messages: List[str] = []
+    current: List[str] = []
+    for line in text.splitlines(keepends=True):
+        if current and _MESSAGE_START.match(line):
+            messages.append("".join(current))
+            current = []
+        current.append(line)
+    if current:
+        messages.append("".join(current))
+    return messages
+
+
+def _split_oversized(message: str, max_tokens: int) -> List[str]:
+    """单条消息超过块大小时先按行、再按字符拆分"""
+    pieces: List[str] = []
+    current = ""
+    for line in message.splitlines(keepends=True):
+        while estimate_tokens(line) > max_tokens:
+            # 最坏情况每个字符 1 个 token
+            head, line = line[:max_tokens], line[max_tokens:]
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(head)
+        if current and estimate_tokens(current + line) > max_tokens:
+            pieces.append(current)
+            current = ""
+        current += line
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def chunk_text(text: str, max_tokens: int) -> List[str]:
+    """
+    将聊天记录按消息边界打包为不超过 max_tokens 的块
+
+    Args:
+        text: 聊天记录文本
+        max_tokens: 每块的最大 token 数
+
+    Returns:
+        块列表；文本不超过 max_tokens 时只有一块
+    """
+    max_tokens = max(1, max_tokens)
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+
+    chunks: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+    for message in split_messages(text):
+        tokens = estimate_tokens(message)
+        if tokens > max_tokens:
+            if current:
+                chunks.append("".join(current))
+                current, current_tokens = [], 0
+            chunks.extend(_split_oversized(message, max_tokens))
+            continue
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append("".join(current))
+            current, current_tokens = [], 0
+        current.append(message)
+        current_tokens += tokens
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+
+def build_reduce_input(partials: List[str]) -> str:
+    """将各部分的分析结果按顺序拼接为 reduce 阶段的输入"""
+    parts = [
+        PART_HEADER.format(index=i) + partial.strip()
+        for i, partial in enumerate(partials, 1)
+    ]
+    return REDUCE_HEADER + "\n\n".join(parts)
+
+
+def _group_partials(partials: List[str], max_tokens: int) -> List[List[str]]:
+    """合并输入过长时将部分结果分组，每组不超过 max_tokens（至少两个一组，保证收敛）"""
+    groups: List[List[str]] = []
+    current: List[str] = []
+    current_tokens = 0
+    for partial in partials:
+        tokens = estimate_tokens(partial)
+        if len(current) >= 2 and current_tokens + tokens > max_tokens:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(partial)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+
+async def map_reduce(
+    chunks: List[str],
+    run: Callable[[str, int], Awaitable[str]],
+    max_tokens: int,
+    concurrency: int,
+) -> str:
+    """
+    并发分析每个块，再合并各块的结果
+
+    Args:
+        chunks: chunk_text 得到的块
+        run: 调用 LLM 的协程函数，输入文本和限流优先级（单次、分块或合并调用），返回结果
+        max_tokens: 每次调用输入的最大 token 数，合并输入超过时分层合并
+        concurrency: 同时进行的 LLM 调用数
+
+    Returns:
+        合并后的分析结果
+    """
+    if len(chunks) == 1:
+        return await run(chunks[0], PRIORITY_SINGLE)
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def bounded(text: str, priority: int) -> str:
+        async with semaphore:
+            return await run(text, priority)
+
+    total = len(chunks)
+    partials = list(
+        await asyncio.gather(
+            *(
+                bounded(MAP_HEADER.format(index=i, total=total) + chunk, PRIORITY_MAP)
+                for i, chunk in enumerate(chunks, 1)
+            )
+        )
+    )
+
+    # 部分结果太多时先分组合并，直到能在一次调用中合并
+    while (
+        len(partials) > 2 and estimate_tokens(build_reduce_input(partials)) > max_tokens
+    ):
+        groups = _group_partials(partials, max_tokens)
+        partials = list(
+            await asyncio.gather(
+                *(
+                    bounded(build_reduce_input(group), PRIORITY_REDUCE)
+                    for group in groups
+                )
+            )
+        )
+
+    return await run(build_reduce_input(partials), PRIORITY_REDUCE)
@@ -0,0 +1,243 @@
+"""
+聊天记录预处理模块
+在发送给 LLM 之前压缩转发的聊天记录：去掉转发分隔行、引用的回复、签名、base64 残留和系统消息，
+合并同一发言人的连续消息并省略重复的日期和发言人标识，减少提示词 token 数
+"""
+
+import re
+from dataclasses import dataclass
+from typing import List, Optional
+
+from app.chat_chunker import estimate_tokens
+
+# 转发或引用历史邮件时客户端插入的分隔行，其后是被转发的内容，与
+# response_cache.normalize_text 一样只去掉分隔行本身
+_FORWARD_BANNER = re.compile(
+    r"^(?:-{2,}\s*(?:forwarded message|original message|转发的邮件|原始邮件)\s*-{2,}"
+    r"|on .{1,200} wrote:"
+    r"|在\s*.{1,200}写道[:：])$",
+    re.IGNORECASE,
+)
+
+# 分隔行之后客户端附带的原邮件头（Outlook、Gmail、QQ 邮箱等）
+_FORWARD_HEADER = re.compile(
+    r"^(?:from|sent|date|to|cc|subject|发件人|发送时间|时间|日期|收件人|抄送|主题)\s*[:：]",
+    re.IGNORECASE,
+)
+
+# 签名分隔行（RFC 3676 为 "-- "），只在段落末尾若干行内才视为签名
+_SIGNATURE_DELIMITER = re.compile(r"^-- $")
+_SIGNATURE_MAX_LINES = 10
+
+# 移动端客户端自动添加的签名行
+_CLIENT_SIGNATURE = re.compile(
+    r"^\s*(?:sent from my .{1,40}|发自我的.{1,20}|来自.{1,20}邮箱.{0,10}|发自.{1,10}邮箱大师)\s*$",
+    re.IGNORECASE,
+)
+
+# 引用回复的行首标记
+_QUOTE_PREFIX = re.compile(r"^(?:>\s?)+")
+
+# 整行的 base64 残留（图片、附件内容被粘贴进正文）
+_BASE64_LINE = re.compile(r"^[A-Za-z0-9+/]{60,}={0,2}$")
+
+# 行内的 data URI
+_DATA_URI = re.compile(r"data:[\w/+.-]+;base64,[A-Za-z0-9+/=]{16,}")
+
+# 系统消息中的名称：带引号的昵称，或不含空白和标点的昵称
+_NAME = r'(?:"[^"]{1,32}"|[^\s"，。,.！!？?:：]{1,32})'
+
+# 微信/QQ 导出中的系统消息，整行匹配，避免误删恰好包含这些词语的聊天内容
+_SYSTEM_LINE = re.compile(
+    rf"^(?:{_NAME} ?撤回了一条消息"
+    rf"|{_NAME} ?(?:邀请.{{1,200}}|通过.{{1,40}})?加入了群聊"
+    rf"|{_NAME} ?将.{{1,200}}移出了群聊"
+    rf"|{_NAME} ?修改群名为.{{1,64}}"
+    rf'|(?=.*")(?:{_NAME}|我) ?拍了拍 ?(?:{_NAME}|我|自己)(?:的[^\s，。,.！!？?]{{1,10}})?'
+    r"|你已添加了.{1,64}，现在可以开始聊天了。?"
+    r"|[-—]* ?以下为新消息 ?[-—]*"
+    r"|以上是打招呼的内容"
+    r"|this message was deleted\.?"
+    r"|消息已发出，但被对方拒收了。?)$",
+    re.IGNORECASE,
+)
+
+# 聊天内容行：消息头或 "发言人: 消息"
+_CHAT_LINE = re.compile(r"^[^\s:：>]{1,32}\s*[:：]\s*\S")
+
+# 消息头：日期 时间 发言人（微信导出格式）
+_HEADER = re.compile(
+    r"^(?P<date>\d{4}[-/.]\d{1,2}[-/.]\d{1,2})?\s*"
+    r"(?P<time>\d{1,2}:\d{2}(?::\d{2})?)\s+(?P<speaker>\S.{0,63})$"
+)
+
+# 发言人名称后附带的账号、邮箱等标识，例如 "张三(wxid_abc)"、"张三<zs@qq.com>"
+_SPEAKER_ID = re.compile(r"\s*[(（<\[].*[)）>\]]\s*$")
+
+
+@dataclass(frozen=True)
+class PreprocessResult:
+    """预处理结果及前后的 token 估算"""
+
+    text: str
+    tokens_in: int
+    tokens_out: int
+
+    @property
+    def saved_ratio(self) -> float:
+        """节省的 token 比例"""
+        if not self.tokens_in:
+            return 0.0
+        return 1 - self.tokens_out / self.tokens_in
+
+
+def _split_forwards(lines: List[str]) -> List[List[str]]:
+    """
+    按转发分隔行把正文拆成若干段
+
+    去掉分隔行和紧随其后的原邮件头，分隔行之后被转发的内容全部保留。
+    """
+    segments: List[List[str]] = [[]]
+    in_headers = False
+    for line in lines:
+        plain = _QUOTE_PREFIX.sub("", line).strip()
+        if _FORWARD_BANNER.match(plain):
+            segments.append([])
+            in_headers = True
+            continue
+        if in_headers:
+            if not plain or _FORWARD_HEADER.match(plain):
+                continue
+            in_headers = False
+        segments[-1].append(line)
+    return segments
+
+
+def _is_chat_line(line: str) -> bool:
+    """是否为聊天内容行（消息头或 "发言人: 消息"）"""
+    line = line.strip()
+    return bool(_CHAT_LINE.match(line) or _HEADER.match(line))
+
+
+def _strip_signature(lines: List[str]) -> List[str]:
+    """去掉段落末尾签名分隔行之后的内容，分隔行之后有聊天内容时不视为签名"""
+    for index in range(len(lines) - 1, -1, -1):
+        if len(lines) - index - 1 > _SIGNATURE_MAX_LINES:
+            break
+        if _SIGNATURE_DELIMITER.match(lines[index]):
+            tail = lines[index + 1 :]
+            if any(_is_chat_line(line) for line in tail):
+                break
+            return lines[:index]
+    return lines
+
+
+def _strip_quotes(lines: List[str]) -> List[str]:
+    """
+    去掉引用回复的行
+
+    只有引用之外还有聊天内容时才认为引用行是回复历史并去掉；否则引用的就是
+    被转发的聊天记录，只去掉引用标记，保留内容。
+    """
+    quoted = [bool(_QUOTE_PREFIX.match(line)) for line in lines]
+    has_own_chat = any(
+        not is_quoted and _is_chat_line(line) for line, is_quoted in zip(lines, quoted)
+    )
+    if has_own_chat:
+        return [line for line, is_quoted in zip(lines, quoted) if not is_quoted]
+    return [_QUOTE_PREFIX.sub("", line) for line in lines]
+
+
+def _short_speaker(speaker: str) -> str:
+    """去掉发言人的账号标识"""
+    return _SPEAKER_ID.sub("", speaker) or speaker
+
+
+def _compress_headers(lines: List[str]) -> List[str]:
+    """
+    压缩消息头
+
+    同一天内只在第一条消息头保留日期；同一发言人的连续消息合并到第一条消息头下；
+    发言人首次出现时保留完整标识，之后只用名称。
+    """
+    output: List[str] = []
+    seen_speakers = set()
+    last_date: Optional[str] = None
+    last_speaker: Optional[str] = None
+    for line in lines:
+        match = _HEADER.match(line)
+        if not match:
+            output.append(line)
+            continue
+
+        speaker = match.group("speaker").strip()
+        short = _short_speaker(speaker)
+        date = match.group("date")
+        if short == last_speaker and (date is None or date == last_date):
+            continue
+
+        label = speaker if short not in seen_speakers else short
+        seen_speakers.add(short)
+        last_speaker = short
+        time = match.group("time")
+        if date and date != last_date:
+            output.append(f"{date} {time} {label}")
+            last_date = date
+        else:
+            output.append(f"{time} {label}")
+    return output
+
+
+def _clean_lines(lines: List[str]) -> List[str]:
+    """去掉 base64 残留、系统消息，合并行内空白和连续空行"""
+    output: List[str] = []
+    for line in lines:
+        line = " ".join(_DATA_URI.sub("[数据]", line).split())
+        if _BASE64_LINE.match(line) or _SYSTEM_LINE.match(line):
+            continue
+        if not line and (not output or not output[-1]):
+            continue
+        output.append(line)
+    while output and not output[-1]:
+        output.pop()
+    return output
+
+
+def preprocess_chat(text: str) -> str:
+    """
+    压缩聊天记录文本
+
+    Args:
+        text: 邮件正文（转发的聊天记录）
+
+    Returns:
+        压缩后的文本，聊天内容本身保持不变
+    """
+    lines = [
+        line
+        for segment in _split_forwards(text.splitlines())
+        for line in _strip_signature(segment)
+        if not _CLIENT_SIGNATURE.match(line)
+    ]
+    lines = _strip_quotes(lines)
+    lines = _clean_lines(lines)
+    lines = _compress_headers(lines)
+    return "\n".join(lines)
+
+
+def preprocess_with_stats(text: str) -> PreprocessResult:
+    """
+    压缩聊天记录并估算前后的 token 数
+
+    Args:
+        text: 邮件正文
+
+    Returns:
+        预处理结果
+    """
+    processed = preprocess_chat(text)
+    return PreprocessResult(
+        text=processed,
+        tokens_in=estimate_tokens(text),
+        tokens_out=estimate_tokens(processed),
+    )
@@ -4,6 +4,14 @@ from dotenv import load_dotenv
 from loguru import logger
 
 
+def _env_bool(name: str, default: bool) -> bool:
+    """读取布尔类型的环境变量"""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
 class Config:
     def __init__(self):
         # 从.env文件加载环境变量
@@ -23,6 +31,9 @@ class Config:
         self.SOURCE_EMAIL = os.getenv("SOURCE_EMAIL")
         self.SOURCE_PASSWORD = os.getenv("SOURCE_PASSWORD")  # IMAP授权码
 
+        # 多账户配置文件（JSON），设置后忽略上面的单账户配置
+        self.ACCOUNTS_FILE = os.getenv("ACCOUNTS_FILE", "")
+
         # 目标邮箱配置（用于转发邮件）
         self.TARGET_EMAIL = os.getenv("TARGET_EMAIL")
 
@@ -32,13 +43,139 @@ class Config:
         self.SMTP_PASSWORD = os.getenv(
             "SMTP_PASSWORD"
         )  # SMTP授权码，如果未设置则使用SOURCE_PASSWORD
+        # SMTP连接池大小及空闲连接过期时间（秒）
+        self.SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "2"))
+        self.SMTP_POOL_IDLE_TIMEOUT = float(os.getenv("SMTP_POOL_IDLE_TIMEOUT", "60"))
 
         # 循环检查间隔（秒）
         self.CHECK_INTERVAL = int(os.getenv("CHECK_INTERVAL", "60"))
 
+        # IMAP IDLE 推送配置（服务器不支持 IDLE 时自动回退到轮询）
+        self.IMAP_IDLE = _env_bool("IMAP_IDLE", True)
+        # 重新发起 IDLE 的间隔（秒），需小于服务器约 29 分钟的超时
+        self.IDLE_TIMEOUT = int(os.getenv("IDLE_TIMEOUT", "1500"))
+
+        # IMAP 长连接配置
+        # 连接空闲超过该时间（秒）后先发送 NOOP 探测连接是否存活
+        self.IMAP_NOOP_INTERVAL = int(os.getenv("IMAP_NOOP_INTERVAL", "60"))
+        # 断线重连的最大尝试次数及首次退避时间（秒，之后指数增长）
+        self.IMAP_RECONNECT_RETRIES = int(os.getenv("IMAP_RECONNECT_RETRIES", "5"))
+        self.IMAP_RECONNECT_BACKOFF = float(os.getenv("IMAP_RECONNECT_BACKOFF", "1"))
+
+        # 邮件获取策略：peek（只下载邮件头和正文文本，不下载附件）或 full（完整邮件）
+        self.FETCH_STRATEGY = os.getenv("FETCH_STRATEGY", "peek").lower()
+        # peek 策略下每个正文部分最多下载的字节数
+        self.FETCH_MAX_BYTES = int(os.getenv("FETCH_MAX_BYTES", "262144"))
+        # 积压大量新邮件时每批获取的邮件数
+        self.FETCH_CHUNK_SIZE = int(os.getenv("FETCH_CHUNK_SIZE", "50"))
+
+        # 运行指标：METRICS_PORT 大于 0 时在该端口提供 Prometheus 格式的 /metrics
+        self.METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+        self.METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+        # 链路追踪：每封邮件各阶段的 span（UID、字节数、token数）交给导出器，
+        # jsonl 导出器每个 span 一行写入 TRACE_PATH，也可以配置为 "包.模块:工厂"
+        self.TRACING = _env_bool("TRACING", False)
+        self.TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "jsonl")
+        self.TRACE_PATH = os.getenv("TRACE_PATH", "logs/traces.jsonl")
+
+        # 附件文本提取：聊天工具导出的 .txt/.csv/.html 附件提取文本后追加到正文
+        self.ATTACHMENT_TEXT = _env_bool("ATTACHMENT_TEXT", True)
+        # 各类型附件解码后最多使用的字节数，超出部分截断，0 表示不提取该类型
+        self.ATTACHMENT_TXT_MAX_BYTES = int(
+            os.getenv("ATTACHMENT_TXT_MAX_BYTES", "1048576")
+        )
+        self.ATTACHMENT_CSV_MAX_BYTES = int(
+            os.getenv("ATTACHMENT_CSV_MAX_BYTES", "1048576")
+        )
+        self.ATTACHMENT_HTML_MAX_BYTES = int(
+            os.getenv("ATTACHMENT_HTML_MAX_BYTES", "2097152")
+        )
+
+        # 并发处理配置
+        # 同时进行LLM处理的工作线程数
+        self.LLM_WORKERS = int(os.getenv("LLM_WORKERS", "4"))
+        # 等待LLM处理的邮件队列长度，队列满时暂停获取新邮件
+        self.LLM_QUEUE_SIZE = int(os.getenv("LLM_QUEUE_SIZE", "8"))
+        # 运行引擎：thread（工作线程池）或 async（单事件循环）
+        self.ENGINE = os.getenv("ENGINE", "thread").lower()
+        # async 引擎下同时进行的LLM调用数
+        self.ASYNC_LLM_CONCURRENCY = int(os.getenv("ASYNC_LLM_CONCURRENCY", "16"))
+
+        # 按优先级排列的模型列表（逗号分隔），配置多个时启用多模型路由；为空时使用DeepSeek
+        self.LLM_MODELS = [
+            name.strip()
+            for name in os.getenv("LLM_MODELS", "").split(",")
+            if name.strip()
+        ]
+        # 当前模型超过该时间（秒）未返回时对冲请求下一个模型，0表示按主模型的p95自动确定
+        self.LLM_LATENCY_BUDGET = float(os.getenv("LLM_LATENCY_BUDGET", "30"))
+        # 模型连续失败该次数后熔断，熔断期间（秒）跳过该模型
+        self.LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "3"))
+        self.LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "60"))
+
+        # LLM调用限流：每分钟请求数和token数上限，0表示不限制
+        self.LLM_RPM = float(os.getenv("LLM_RPM", "0"))
+        self.LLM_TPM = float(os.getenv("LLM_TPM", "0"))
+        # 遇到限流错误（429）时的最大重试次数，以及指数退避的初始和最大等待时间（秒）
+        self.LLM_RATE_LIMIT_RETRIES = int(os.getenv("LLM_RATE_LIMIT_RETRIES", "5"))
+        self.LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1"))
+        self.LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "60"))
+
+        # 流式调用LLM（记录首个token耗时，超时时可发送部分结果）
+        self.LLM_STREAMING = _env_bool("LLM_STREAMING", False)
+        # 单封邮件LLM分析的截止时间（秒），超时后发送已生成的部分结果，没有任何输出时稍后重试，0表示不限制
+        self.LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "300"))
+
+        # 发送给LLM前压缩聊天记录（去掉引用、签名、base64残留和系统消息，合并重复的发言人）
+        self.CHAT_PREPROCESS = _env_bool("CHAT_PREPROCESS", True)
+
+        # 超长聊天记录分块：每块的最大token数（估算值），超过时分块并发分析后合并
+        self.LLM_CHUNK_TOKENS = int(os.getenv("LLM_CHUNK_TOKENS", "12000"))
+        # 分块分析时同一封邮件同时进行的LLM调用数
+        self.LLM_MAP_CONCURRENCY = int(os.getenv("LLM_MAP_CONCURRENCY", "4"))
+
+        # LLM响应缓存（相同聊天记录重复发送时直接复用结果）
+        self.RESPONSE_CACHE = _env_bool("RESPONSE_CACHE", True)
+        self.RESPONSE_CACHE_PATH = os.getenv(
+            "RESPONSE_CACHE_PATH", "data/response_cache.sqlite3"
+        )
+        # 缓存有效期（秒），默认7天
+        self.RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "604800"))
+        self.RESPONSE_CACHE_MAX_ENTRIES = int(
+            os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000")
+        )
+
+        # 持久化任务队列（SQLite），LLM和发送阶段由工作线程从队列中取任务，进程重启后继续处理
+        self.JOB_QUEUE = _env_bool("JOB_QUEUE", False)
+        self.JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "data/jobs.sqlite3")
+        # 取出的任务超过该时间（秒）未完成时重新可见，应大于 LLM_DEADLINE
+        self.JOB_VISIBILITY_TIMEOUT = float(os.getenv("JOB_VISIBILITY_TIMEOUT", "900"))
+        # 每个任务的最大尝试次数，超过后进入死信状态
+        self.JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+        # 失败任务第一次重试前的等待时间（秒），之后每次翻倍
+        self.JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "30"))
+
+        # 已处理邮件台账（按 UIDVALIDITY/UID 记录处理状态，增量搜索新邮件）
+        self.UID_LEDGER = _env_bool("UID_LEDGER", True)
+        self.UID_LEDGER_PATH = os.getenv("UID_LEDGER_PATH", "data/uid_ledger.sqlite3")
+        # 每封邮件的最大处理次数，超过后不再处理
+        self.UID_LEDGER_MAX_ATTEMPTS = int(os.getenv("UID_LEDGER_MAX_ATTEMPTS", "5"))
+        # 处理失败的邮件第一次重试前的等待时间（秒），之后每次翻倍
+        self.UID_LEDGER_RETRY_DELAY = float(os.getenv("UID_LEDGER_RETRY_DELAY", "60"))
+
         # 日志配置
         self.LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
         self.LOG_FILE = os.getenv("LOG_FILE", "logs/email_forwarder.log")
+        # 邮件正文和LLM输出的记录方式：summary（长度、哈希和截断预览）或 full（完整内容，仅用于调试）
+        self.LOG_PAYLOADS = os.getenv("LOG_PAYLOADS", "summary").lower()
+        # summary 模式下预览的字符数，0表示不带预览
+        self.LOG_PREVIEW_CHARS = int(os.getenv("LOG_PREVIEW_CHARS", "80"))
+        # 例行日志（轮询心跳、批量获取、解析、发送成功、标记已读等）每 N 次记录一次，1表示全部记录
+        self.LOG_SAMPLE_EVERY = int(os.getenv("LOG_SAMPLE_EVERY", "1"))
+        # 异常日志是否带完整调用栈（backtrace）和变量值（diagnose，可能包含邮件内容）
+        self.LOG_BACKTRACE = _env_bool("LOG_BACKTRACE", False)
+        self.LOG_DIAGNOSE = _env_bool("LOG_DIAGNOSE", False)
 
         # 验证必要配置
         self._validate_config()
@@ -47,6 +184,10 @@ class Config:
         """验证必要配置项"""
         missing_configs = []
 
+        # 多账户模式下账户配置从配置文件读取
+        if self.ACCOUNTS_FILE:
+            return
+
         if not self.SOURCE_EMAIL:
             missing_configs.append("SOURCE_EMAIL")
 
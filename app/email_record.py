@@ -0,0 +1,117 @@
+"""
+邮件记录模块
+流水线各阶段之间传递的不可变邮件记录，头部在首次访问时才解码
+"""
+
+from dataclasses import dataclass, field, fields, replace
+from email.header import decode_header
+from typing import Any, Dict, Optional, Tuple
+
+
+def decode_text_header(value: Any) -> str:
+    """
+    按 RFC 2047 解码主题、收发件人等文本头部
+
+    Args:
+        value: 原始头部值
+
+    Returns:
+        解码后的字符串，未知编码按 UTF-8 处理
+    """
+    if not value:
+        return ""
+    value = str(value)
+    # 绝大多数头部没有编码字，直接返回
+    if "=?" not in value:
+        return value
+    parts = []
+    for part, encoding in decode_header(value):
+        if isinstance(part, bytes):
+            try:
+                part = part.decode(encoding or "utf-8", errors="ignore")
+            except LookupError:
+                part = part.decode("utf-8", errors="ignore")
+        parts.append(part)
+    return "".join(parts)
+
+
+@dataclass(frozen=True, slots=True)
+class Attachment:
+    """附件信息（只记录文件名和类型，不保存内容）"""
+
+    filename: str
+    content_type: str
+
+
+@dataclass(frozen=True, slots=True)
+class EmailRecord:
+    """
+    一封邮件的记录
+
+    记录不可变，处理阶段通过 with_body 等方法返回新副本，多个工作线程可以安全地共享。
+    主题和收发件人保存原始头部，首次访问对应属性时才解码并缓存。
+    """
+
+    body_text: str = ""
+    raw_subject: str = ""
+    raw_sender: str = ""
+    raw_receiver: str = ""
+    date: str = ""
+    attachments: Tuple[Attachment, ...] = ()
+    uid: Optional[int] = None
+    uidvalidity: Optional[int] = None
+    # 多账户模式下的账户名称
+    account: Optional[str] = None
+    # 链路追踪的 trace_id，启用追踪时在解析邮件时分配，不参与比较
+    trace_id: Optional[str] = field(default=None, compare=False)
+    _subject: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+    _sender: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+    _receiver: Optional[str] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+
+    def _decoded(self, cache: str, raw: str) -> str:
+        """读取解码缓存，未缓存时解码原始头部"""
+        value = getattr(self, cache)
+        if value is None:
+            value = decode_text_header(raw)
+            # 缓存字段不参与比较，写入不改变记录的值语义
+            object.__setattr__(self, cache, value)
+        return value
+
+    @property
+    def subject(self) -> str:
+        """解码后的主题"""
+        return self._decoded("_subject", self.raw_subject)
+
+    @property
+    def sender(self) -> str:
+        """解码后的发件人"""
+        return self._decoded("_sender", self.raw_sender)
+
+    @property
+    def receiver(self) -> str:
+        """解码后的收件人"""
+        return self._decoded("_receiver", self.raw_receiver)
+
+    def with_body(self, body_text: str) -> "EmailRecord":
+        """返回替换正文后的副本"""
+        return replace(self, body_text=body_text)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为可 JSON 序列化的字典（用于持久化任务队列），不含解码缓存"""
+        data = {f.name: getattr(self, f.name) for f in fields(self) if f.init}
+        data["attachments"] = [
+            {"filename": a.filename, "content_type": a.content_type}
+            for a in self.attachments
+        ]
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "EmailRecord":
+        """从 to_dict 的结果恢复记录"""
+        data = dict(data)
+        data["attachments"] = tuple(
+            Attachment(**attachment) for attachment in data.get("attachments", ())
+        )
+        return cls(**data)
@@ -0,0 +1,129 @@
+"""
+HTML 转纯文本模块
+基于标准库 html.parser 的流式转换：去掉标签、脚本和样式，块级元素换行，合并空白，
+用于只有 HTML 正文的邮件（如微信、QQ 转发的聊天记录）
+"""
+
+from html.parser import HTMLParser
+from typing import Iterable, Iterator, List
+
+# 内容不属于正文的元素
+_SKIP_TAGS = frozenset({"script", "style", "title", "noscript", "template"})
+
+# 开始或结束时换行的块级元素
+_BLOCK_TAGS = frozenset(
+    {
+        "address",
+        "article",
+        "blockquote",
+        "br",
+        "dd",
+        "div",
+        "dl",
+        "dt",
+        "footer",
+        "h1",
+        "h2",
+        "h3",
+        "h4",
+        "h5",
+        "h6",
+        "header",
+        "hr",
+        "li",
+        "ol",
+        "p",
+        "pre",
+        "section",
+        "table",
+        "td",
+        "th",
+        "tr",
+        "ul",
+    }
+)
+
+
+class HtmlTextExtractor(HTMLParser):
+    """
+    流式 HTML 转文本
+
+    可以分块调用 feed，每个块级元素结束后得到的完整行通过 drain 取出，
+    不需要等整个文档解析完，也不会在内存中保留已经取出的内容。
+    """
+
+    def __init__(self):
+        """初始化转换器，字符引用（&amp; 等）由 HTMLParser 自动解码"""
+        super().__init__(convert_charrefs=True)
+        self._skip_depth = 0
+        self._fragments: List[str] = []
+        self._lines: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        """进入跳过的元素或块级元素"""
+        if tag in _SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in _BLOCK_TAGS:
+            self._break_line()
+
+    def handle_endtag(self, tag):
+        """离开跳过的元素或块级元素"""
+        if tag in _SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in _BLOCK_TAGS:
+            self._break_line()
+
+    def handle_data(self, data):
+        """收集正文文本片段"""
+        if not self._skip_depth:
+            self._fragments.append(data)
+
+    def _break_line(self) -> None:
+        """结束当前行，合并行内空白，丢弃空行"""
+        if not self._fragments:
+            return
+        line = " ".join("".join(self._fragments).split())
+        self._fragments.clear()
+        if line:
+            self._lines.append(line)
+
+    def drain(self) -> List[str]:
+        """取出已经完成的行"""
+        lines, self._lines = self._lines, []
+        return lines
+
+    def close(self) -> None:
+        """结束解析，最后一行也变为完成状态"""
+        super().close()
+        self._break_line()
+
+
+def iter_html_text(chunks: Iterable[str]) -> Iterator[str]:
+    """
+    逐块转换 HTML，每得到一行文本就立即返回
+
+    Args:
+        chunks: HTML 文本块
+
+    Yields:
+        去掉标签并合并空白后的文本行
+    """
+    extractor = HtmlTextExtractor()
+    for chunk in chunks:
+        extractor.feed(chunk)
+        yield from extractor.drain()
+    extractor.close()
+    yield from extractor.drain()
+
+
+def html_to_text(html: str) -> str:
+    """
+    将 HTML 转换为纯文本
+
+    Args:
+        html: HTML 文本
+
+    Returns:
+        每个块级元素一行的纯文本
+    """
+    return "\n".join(iter_html_text((html,)))
@@ -0,0 +1,366 @@
+"""
+持久化任务队列模块
+基于 SQLite（WAL）的本地任务队列，将邮件的获取、LLM 处理和发送解耦为独立的阶段：
+取出的任务在可见性超时内由一个工作线程独占，超时未完成（如进程崩溃）会重新可见；
+失败的任务延迟后重试，超过最大尝试次数进入死信状态；
+每个任务带有所属账户，同一队列中按账户轮转取出，繁忙邮箱不会饿死其他邮箱
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from loguru import logger
+
+# 任务状态
+READY = "ready"  # 等待处理（visible_at 之后可被取出）
+LEASED = "leased"  # 已被工作线程取出，visible_at 为可见性超时的截止时间
+DEAD = "dead"  # 超过最大尝试次数的死信
+
+
+@dataclass(frozen=True)
+class Job:
+    """取出的任务"""
+
+    id: int
+    queue: str
+    key: str
+    payload: Dict[str, Any]
+    attempts: int
+    account: str = ""
+
+
+class JobQueue:
+    """基于 SQLite 的持久化任务队列"""
+
+    def __init__(
+        self,
+        path: str,
+        visibility_timeout: float = 600.0,
+        max_attempts: int = 5,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        初始化任务队列，数据库在首次使用时才打开
+
+        Args:
+            path: SQLite 数据库文件路径，":memory:" 表示仅使用内存
+            visibility_timeout: 取出的任务在该时间（秒）内未完成时重新可见
+            max_attempts: 每个任务的最大尝试次数，超过后进入死信状态
+            clock: 时钟函数，便于测试
+        """
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max(1, max_attempts)
+        self._clock = clock
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        # 每个队列上次取出任务的账户，用于按账户轮转
+        self._last_account: Dict[str, str] = {}
+
+    def _connection(self) -> sqlite3.Connection:
+        """打开数据库并建表"""
+        if self._conn is None:
+            if self.path != ":memory:":
+                Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "queue TEXT NOT NULL, key TEXT NOT NULL, payload TEXT NOT NULL, "
+                "account TEXT NOT NULL DEFAULT '', "
+                "state TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+                "visible_at REAL NOT NULL, last_error TEXT, "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL, "
+                "UNIQUE (queue, key))"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_jobs_ready "
+                "ON jobs (queue, state, visible_at)"
+            )
+            # 旧版本创建的数据库没有 account 列
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "account" not in columns:
+                conn.execute(
+                    "ALTER TABLE jobs ADD COLUMN account TEXT NOT NULL DEFAULT ''"
+                )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_jobs_account "
+                "ON jobs (queue, account, state, visible_at)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_key ON jobs (key)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def enqueue(
+        self,
+        queue: str,
+        key: str,
+        payload: Dict[str, Any],
+        delay: float = 0.0,
+        account: str = "",
+    ) -> bool:
+        """
+        添加任务，同一队列中已有相同键的任务时忽略
+
+        Args:
+            queue: 队列（阶段）名称
+            key: 任务的唯一键
+            payload: 可 JSON 序列化的任务数据
+            delay: 延迟多久（秒）后可被取出
+            account: 任务所属的账户，取出时按账户轮转
+
+        Returns:
+            新添加返回True，已存在返回False
+        """
+        now = self._clock()
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO jobs (queue, key, payload, account, "
+                    "state, visible_at, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        queue,
+                        key,
+                        json.dumps(payload),
+                        account,
+                        READY,
+                        now + delay,
+                        now,
+                        now,
+                    ),
+                )
+            return cursor.rowcount == 1
+
+    def lease(self, queue: str) -> Optional[Job]:
+        """
+        取出一个可见的任务，在可见性超时内由调用方独占
+
+        在有可见任务的账户之间轮转，每个账户内按可见时间先后取出；
+        可见性超时已过的任务（上次取出后未完成）也会被重新取出，
+        这类任务的尝试次数已用完时直接进入死信状态。
+
+        Args:
+            queue: 队列（阶段）名称
+
+        Returns:
+            任务，没有可处理的任务时返回None
+        """
+        with self._lock:
+            conn = self._connection()
+            while True:
+                now = self._clock()
+                accounts = [
+                    row[0]
+                    for row in conn.execute(
+                        "SELECT DISTINCT account FROM jobs "
+                        "WHERE queue = ? AND state IN (?, ?) AND visible_at <= ? "
+                        "ORDER BY account",
+                        (queue, READY, LEASED, now),
+                    )
+                ]
+                if not accounts:
+                    return None
+                last = self._last_account.get(queue)
+                account = accounts[0]
+                if last is not None:
+                    account = next((a for a in accounts if a > last), accounts[0])
+                row = conn.execute(
+                    "SELECT id, key, payload, attempts FROM jobs "
+                    "WHERE queue = ? AND account = ? AND state IN (?, ?) "
+                    "AND visible_at <= ? ORDER BY visible_at, id LIMIT 1",
+                    (queue, account, READY, LEASED, now),
+                ).fetchone()
+                job_id, key, payload, attempts = row
+                with conn:
+                    if attempts >= self.max_attempts:
+                        conn.execute(
+                            "UPDATE jobs SET state = ?, "
+                            "last_error = COALESCE(last_error, ?), updated_at = ? "
+                            "WHERE id = ?",
+                            (DEAD, "visibility timeout expired", now, job_id),
+                        )
+                        logger.warning(
+                            f"Job {queue}/{key} dead-lettered after {attempts} attempts"
+                        )
+                        continue
+                    conn.execute(
+                        "UPDATE jobs SET state = ?, attempts = attempts + 1, "
+                        "visible_at = ?, updated_at = ? WHERE id = ?",
+                        (LEASED, now + self.visibility_timeout, now, job_id),
+                    )
+                self._last_account[queue] = account
+                return Job(
+                    job_id, queue, key, json.loads(payload), attempts + 1, account
+                )
+
+    def complete(
+        self,
+        job: Job,
+        next_queue: Optional[str] = None,
+        payload: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """
+        完成任务，可同时把结果交给下一阶段（在同一个事务中完成，不会丢失或重复）
+
+        Args:
+            job: 取出的任务
+            next_queue: 下一阶段的队列名称
+            payload: 下一阶段的任务数据
+        """
+        now = self._clock()
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                if next_queue is not None:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO jobs (queue, key, payload, account, "
+                        "state, visible_at, created_at, updated_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (
+                            next_queue,
+                            job.key,
+                            json.dumps(payload),
+                            job.account,
+                            READY,
+                            now,
+                            now,
+                            now,
+                        ),
+                    )
+                conn.execute("DELETE FROM jobs WHERE id = ?", (job.id,))
+
+    def fail(self, job: Job, error: str, retry_delay: float) -> bool:
+        """
+        记录任务失败，延迟后重试；尝试次数用完时进入死信状态
+
+        Args:
+            job: 取出的任务
+            error: 错误信息
+            retry_delay: 重试前的等待时间（秒）
+
+        Returns:
+            进入死信状态返回True
+        """
+        now = self._clock()
+        dead = job.attempts >= self.max_attempts
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "UPDATE jobs SET state = ?, visible_at = ?, last_error = ?, "
+                    "updated_at = ? WHERE id = ?",
+                    (DEAD if dead else READY, now + retry_delay, error, now, job.id),
+                )
+        return dead
+
+    def pending(self, queue: str, account: str = "") -> int:
+        """
+        账户在队列中等待处理（未被取出）的任务数
+
+        Args:
+            queue: 队列（阶段）名称
+            account: 账户
+
+        Returns:
+            任务数
+        """
+        with self._lock:
+            row = (
+                self._connection()
+                .execute(
+                    "SELECT COUNT(*) FROM jobs "
+                    "WHERE queue = ? AND account = ? AND state = ?",
+                    (queue, account, READY),
+                )
+                .fetchone()
+            )
+        return row[0]
+
+    def contains(self, key: str) -> bool:
+        """任意阶段（包括死信）中是否存在该键的任务"""
+        with self._lock:
+            row = (
+                self._connection()
+                .execute("SELECT 1 FROM jobs WHERE key = ? LIMIT 1", (key,))
+                .fetchone()
+            )
+        return row is not None
+
+    def dead_letters(self) -> List[Dict[str, Any]]:
+        """
+        列出死信任务
+
+        Returns:
+            每个死信任务的 id、队列、键、尝试次数和最后的错误信息
+        """
+        with self._lock:
+            rows = (
+                self._connection()
+                .execute(
+                    "SELECT id, queue, key, attempts, last_error FROM jobs "
+                    "WHERE state = ? ORDER BY id",
+                    (DEAD,),
+                )
+                .fetchall()
+            )
+        return [
+            {"id": r[0], "queue": r[1], "key": r[2], "attempts": r[3], "error": r[4]}
+            for r in rows
+        ]
+
+    def retry_dead(self, job_id: int) -> bool:
+        """
+        将死信任务重新放回队列，尝试次数清零
+
+        Args:
+            job_id: 任务 id
+
+        Returns:
+            找到并重新入队返回True
+        """
+        now = self._clock()
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                cursor = conn.execute(
+                    "UPDATE jobs SET state = ?, attempts = 0, visible_at = ?, "
+                    "updated_at = ? WHERE id = ? AND state = ?",
+                    (READY, now, now, job_id, DEAD),
+                )
+            return cursor.rowcount == 1
+
+    def counts(self) -> Dict[str, int]:
+        """
+        各状态的任务数
+
+        Returns:
+            以状态为键的任务数
+        """
+        with self._lock:
+            rows = (
+                self._connection()
+                .execute("SELECT state, COUNT(*) FROM jobs GROUP BY state")
+                .fetchall()
+            )
+        counts = {READY: 0, LEASED: 0, DEAD: 0}
+        counts.update(dict(rows))
+        return counts
+
+    def close(self) -> None:
+        """关闭数据库连接"""
+        with self._lock:
+            if self._conn is not None:
+                try:
+                    self._conn.close()
+                except sqlite3.Error as e:
+                    logger.warning(f"Error closing job queue: {e}")
+                self._conn = None
@@ -0,0 +1,214 @@
+"""
+LLM 运行时模块
+常驻后台事件循环和带计时的模型封装：同步调用方共用一个事件循环，
+使 litellm/httpx 的连接池在多封邮件之间保持连接；模型对象只创建一次，
+并记录每次调用在发出模型请求之前花费的时间
+"""
+
+import asyncio
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Coroutine, Dict, Optional
+
+from agents.models.interface import Model
+from agents.models.multi_provider import MultiProvider
+
+from app.metrics import LLM_TOKENS, STAGE_LLM, metrics
+from app.tracing import tracer
+
+# 当前 LLM 调用开始的时间（perf_counter），由调用方在进入 Runner 之前设置
+_call_started: ContextVar[Optional[float]] = ContextVar(
+    "llm_call_started", default=None
+)
+
+
+def mark_call_start() -> None:
+    """记录当前调用的开始时间，模型收到请求时据此计算准备耗时"""
+    _call_started.set(time.perf_counter())
+
+
+class BackgroundLoop:
+    """在后台线程中常驻的事件循环，供同步代码提交协程"""
+
+    def __init__(self, name: str = "llm-loop"):
+        """
+        创建事件循环并启动后台线程
+
+        Args:
+            name: 线程名称
+        """
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        """线程主函数：运行事件循环直到 close"""
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    def run(self, coro: Coroutine[Any, Any, Any], timeout: Optional[float] = None):
+        """
+        在后台事件循环中执行协程并等待结果
+
+        Args:
+            coro: 协程
+            timeout: 等待超时（秒），超时后取消协程
+
+        Returns:
+            协程的返回值
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    @property
+    def closed(self) -> bool:
+        """事件循环是否已关闭"""
+        return self._loop.is_closed()
+
+    def close(self) -> None:
+        """停止事件循环并等待后台线程退出"""
+        if self.closed:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        if not self._loop.is_running():
+            self._loop.close()
+
+
+class TimedModel(Model):
+    """
+    记录调用耗时的模型封装
+
+    底层模型在首次调用时通过 MultiProvider 按名称创建并缓存（此时才需要 API 密钥），
+    之后所有调用共用同一个模型对象及其 HTTP 客户端。
+    """
+
+    def __init__(
+        self,
+        model_name: Optional[str],
+        provider: Any = None,
+        model: Optional[Model] = None,
+    ):
+        """
+        初始化模型封装
+
+        Args:
+            model_name: 模型名称，例如 "litellm/deepseek/deepseek-chat"，None 表示默认模型
+            provider: 模型提供方，默认 MultiProvider
+            model: 已创建的模型（如多模型路由器），提供时不再按名称创建
+        """
+        self.model_name = model_name
+        self._provider = provider or MultiProvider()
+        self._model: Optional[Model] = model
+        self.stats: Dict[str, float] = {
+            "calls": 0,
+            "errors": 0,
+            "setup_seconds": 0.0,
+            "last_setup_seconds": 0.0,
+            "response_seconds": 0.0,
+        }
+
+    @property
+    def model(self) -> Model:
+        """底层模型，首次访问时创建"""
+        if self._model is None:
+            self._model = self._provider.get_model(self.model_name)
+        return self._model
+
+    def _record_setup(self) -> float:
+        """记录从调用开始到模型收到请求的耗时，返回当前时间"""
+        now = time.perf_counter()
+        started = _call_started.get()
+        setup = now - started if started is not None else 0.0
+        self.stats["calls"] += 1
+        self.stats["setup_seconds"] += setup
+        self.stats["last_setup_seconds"] = setup
+        return now
+
+    def _record_response(self, start: float) -> None:
+        """记录一次调用的响应耗时"""
+        elapsed = time.perf_counter() - start
+        self.stats["response_seconds"] += elapsed
+        metrics.observe(STAGE_LLM, elapsed)
+
+    @staticmethod
+    def _record_usage(usage: Any, span: Any) -> None:
+        """记录提供方返回的输入/输出 token 数，同时累加到所在邮件的 LLM span"""
+        if usage is None:
+            return
+        tokens_in = getattr(usage, "input_tokens", 0) or 0
+        tokens_out = getattr(usage, "output_tokens", 0) or 0
+        metrics.inc(LLM_TOKENS, tokens_in, direction="in")
+        metrics.inc(LLM_TOKENS, tokens_out, direction="out")
+        span.add(tokens_in=tokens_in, tokens_out=tokens_out)
+
+    async def get_response(self, *args, **kwargs):
+        """转发到底层模型并记录耗时"""
+        start = self._record_setup()
+        span = tracer.start_span("llm_call", model=self.model_name)
+        try:
+            response = await self.model.get_response(*args, **kwargs)
+        except Exception as e:
+            self.stats["errors"] += 1
+            span.end(e)
+            raise
+        finally:
+            self._record_response(start)
+        if metrics.enabled or tracer.enabled:
+            self._record_usage(getattr(response, "usage", None), span)
+        span.end()
+        return response
+
+    def stream_response(self, *args, **kwargs) -> AsyncIterator[Any]:
+        """转发到底层模型的流式接口并记录耗时"""
+        return self._stream(args, kwargs)
+
+    async def _stream(self, args, kwargs) -> AsyncIterator[Any]:
+        start = self._record_setup()
+        # 异步生成器可能在不同的上下文中被迭代，span 不设为当前 span
+        span = tracer.start_span("llm_call", model=self.model_name, streaming=True)
+        error: Optional[BaseException] = None
+        try:
+            async for event in self.model.stream_response(*args, **kwargs):
+                # 流式响应的用量在最后的 response.completed 事件中
+                if (metrics.enabled or tracer.enabled) and getattr(
+                    event, "type", None
+                ) == "response.completed":
+                    self._record_usage(
+                        getattr(getattr(event, "response", None), "usage", None), span
+                    )
+                yield event
+        except Exception as e:
+            self.stats["errors"] += 1
+            error = e
+            raise
+        finally:
+            self._record_response(start)
+            span.end(error)
+
+    async def close(self) -> None:
+        """关闭底层模型持有的客户端"""
+        close = getattr(self._model, "close", None)
+        if close is not None:
+            await close()
+
+    def summary(self) -> Dict[str, float]:
+        """
+        汇总调用耗时
+
+        Returns:
+            调用次数、错误数、平均准备耗时和平均响应耗时（秒）
+        """
+        calls = self.stats["calls"] or 1
+        return {
+            "calls": self.stats["calls"],
+            "errors": self.stats["errors"],
+            "avg_setup_seconds": self.stats["setup_seconds"] / calls,
+            "last_setup_seconds": self.stats["last_setup_seconds"],
+            "avg_response_seconds": self.stats["response_seconds"] / calls,
+        }
@@ -0,0 +1,92 @@
+"""
+日志策略模块
+邮件正文和LLM输出默认只记录长度、哈希和截断的预览，不写入完整内容，避免数 MB 的
+聊天记录占满日志队列、轮转文件和压缩；每封邮件都会出现的例行日志可按 1/N 采样
+"""
+
+import hashlib
+import json
+import threading
+from typing import Dict, Optional
+
+from app.config import config
+
+# LOG_PAYLOADS 的取值
+PAYLOADS_SUMMARY = "summary"
+PAYLOADS_FULL = "full"
+
+
+def summarize_text(text: Optional[str], preview_chars: int = 80) -> str:
+    """
+    生成文本的定长摘要
+
+    Args:
+        text: 文本
+        preview_chars: 预览的字符数，0表示不带预览
+
+    Returns:
+        形如 chars=.. bytes=.. sha1=.. preview="..." 的摘要，换行等字符转义
+    """
+    if text is None:
+        return "none"
+    data = text.encode("utf-8", "replace")
+    # 哈希只用于比对日志中的同一内容，选用有硬件加速的 SHA-1，取前12位
+    digest = hashlib.sha1(data).hexdigest()[:12]
+    summary = f"chars={len(text)} bytes={len(data)} sha1={digest}"
+    if preview_chars > 0:
+        preview = json.dumps(text[:preview_chars], ensure_ascii=False)
+        summary += f" preview={preview}"
+        if len(text) > preview_chars:
+            summary += "…"
+    return summary
+
+
+def describe_payload(text: Optional[str]) -> str:
+    """
+    按 LOG_PAYLOADS 配置返回要写入日志的内容
+
+    Args:
+        text: 邮件正文或LLM输出
+
+    Returns:
+        full 模式下为原文，否则为摘要（见 summarize_text）
+    """
+    if config.LOG_PAYLOADS == PAYLOADS_FULL:
+        return str(text)
+    return summarize_text(text, config.LOG_PREVIEW_CHARS)
+
+
+class LogSampler:
+    """按键对高频日志采样，每个键的第 1、N+1、2N+1…… 次放行"""
+
+    def __init__(self, every: int = 1):
+        """
+        初始化采样器
+
+        Args:
+            every: 每 N 次记录一次，小于等于1时全部记录
+        """
+        self.every = every
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def allow(self, key: str) -> bool:
+        """
+        判断本次是否记录
+
+        Args:
+            key: 日志类别
+
+        Returns:
+            需要记录返回True
+        """
+        if self.every <= 1:
+            return True
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+        return count % self.every == 0
+
+
+# 全局采样器，用于轮询心跳、批量获取、解析、发送和标记已读等每封邮件都有的例行日志
+log_sampler = LogSampler(config.LOG_SAMPLE_EVERY)
@@ -1,206 +1,733 @@
 import ssl
-from typing import Any, Dict, List, Optional, Union
-from email.message import Message
-from email.header import decode_header
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import replace
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
 import email
 
 from loguru import logger
 from imapclient import IMAPClient  # type: ignore
 
+from app.accounts import AccountConfig
+from app.attachment_text import attachment_kind, attachment_limits, encoded_size
 from app.config import config
+from app.email_record import EmailRecord, decode_text_header
+from app.log_policy import log_sampler
+from app.mail_parser import parse_email
+from app.metrics import (
+    STAGE_IMAP_FETCH,
+    STAGE_IMAP_SEARCH,
+    STAGE_MARK_READ,
+    STAGE_PARSE,
+    metrics,
+)
+from app.tracing import new_trace_id, tracer
+from app.uid_ledger import UidLedger
+
+# 单次 idle_check 的最长阻塞时间（秒），用于及时响应停止信号
+IDLE_CHECK_INTERVAL = 1.0
+
+# 有其他线程等待使用连接时，进入 IDLE 前让出连接的轮询间隔（秒）
+IDLE_YIELD_INTERVAL = 0.01
+
+# 部分获取时只下载这些类型的正文，其余部分（附件、图片等）只下载 MIME 头；
+# 有 text/plain 正文时不下载 HTML 副本。支持提取文本的附件按类型的上限下载前缀
+PEEK_BODY_TYPES = ("text/plain", "text/html")
+
+T = TypeVar("T")
+
+
+def _atom(value: Any) -> str:
+    """把 BODYSTRUCTURE 中的字节串转成小写字符串"""
+    if isinstance(value, bytes):
+        return value.decode("ascii", errors="ignore").lower()
+    return str(value or "").lower()
+
+
+def _is_attachment(part: Any) -> bool:
+    """
+    根据 BODYSTRUCTURE 判断单个部分是否为附件
+
+    disposition 的位置取决于类型：text 有行数字段，message/rfc822 有信封、正文和行数字段
+    """
+    main_type = _atom(part[0])
+    index = {"text": 9, "message": 11}.get(main_type, 8)
+    disposition = part[index] if len(part) > index else None
+    return (
+        isinstance(disposition, tuple)
+        and bool(disposition)
+        and _atom(disposition[0]) == "attachment"
+    )
+
+
+def _attachment_name(part: Any) -> str:
+    """从 BODYSTRUCTURE 的 disposition 参数（filename）或类型参数（name）中取附件文件名"""
+    index = {"text": 9, "message": 11}.get(_atom(part[0]), 8)
+    disposition = part[index] if len(part) > index else None
+    candidates = []
+    if isinstance(disposition, tuple) and len(disposition) > 1:
+        candidates.append(disposition[1])
+    candidates.append(part[2])
+    for params in candidates:
+        if not isinstance(params, tuple):
+            continue
+        for key, value in zip(params[::2], params[1::2]):
+            if _atom(key).rstrip("*") in ("filename", "name"):
+                name = (
+                    value.decode("utf-8", errors="ignore")
+                    if isinstance(value, bytes)
+                    else str(value)
+                )
+                return decode_text_header(name) if "=?" in name else name
+    return ""
+
+
+def _walk_sections(
+    structure: Any, attachment_limits: Dict[str, int], prefix: str = ""
+) -> Optional[List[Tuple[str, Optional[str], int]]]:
+    """
+    列出多部分邮件 BODYSTRUCTURE 中的叶子部分
+
+    Returns:
+        (部分编号, 可下载的正文类型, 附件需下载的字节数) 列表，非正文部分的类型为None，
+        不提取文本的附件字节数为0；包含内嵌邮件（message/rfc822）等无法按部分重建的
+        结构时返回None
+    """
+    sections: List[Tuple[str, Optional[str], int]] = []
+    for index, part in enumerate(structure[0], 1):
+        section = f"{prefix}{index}"
+        if isinstance(part[0], list):
+            nested = _walk_sections(part, attachment_limits, f"{section}.")
+            if nested is None:
+                return None
+            sections.extend(nested)
+            continue
+        content_type = f"{_atom(part[0])}/{_atom(part[1])}"
+        if content_type == "message/rfc822":
+            return None
+        if _is_attachment(part):
+            kind = attachment_kind(_attachment_name(part), content_type)
+            limit = attachment_limits.get(kind, 0) if kind else 0
+            size = encoded_size(limit, _atom(part[5])) if limit else 0
+            sections.append((section, None, size))
+            continue
+        is_body = content_type in PEEK_BODY_TYPES
+        sections.append((section, content_type if is_body else None, 0))
+    return sections
+
+
+def _plan_sections(
+    structure: Any,
+    max_bytes: int,
+    attachment_limits: Optional[Dict[str, int]] = None,
+) -> Optional[List[Tuple[str, int]]]:
+    """
+    根据多部分邮件的 BODYSTRUCTURE 列出需要获取的叶子部分
+
+    Args:
+        structure: multipart 的 BODYSTRUCTURE
+        max_bytes: 每个正文部分最多下载的字节数
+        attachment_limits: 提取文本的附件类型 -> 解码后的字节上限
+
+    Returns:
+        (部分编号, 下载正文的字节数) 列表，0 表示只下载 MIME 头；
+        无法按部分重建时返回None
+    """
+    sections = _walk_sections(structure, attachment_limits or {})
+    if sections is None:
+        return None
+    has_plain = any(body_type == "text/plain" for _, body_type, _ in sections)
+    plan = []
+    for section, body_type, attachment_bytes in sections:
+        with_body = body_type == "text/plain" or (
+            body_type is not None and not has_plain
+        )
+        plan.append((section, max_bytes if with_body else attachment_bytes))
+    return plan
+
+
+def _trim_partial(body: bytes, max_bytes: int) -> bytes:
+    """部分获取被截断时丢弃最后不完整的一行，保证 base64/QP 编码可以正常解码"""
+    if len(body) < max_bytes:
+        return body
+    end = body.rfind(b"\n")
+    return body[: end + 1] if end >= 0 else b""
+
+
+def _is_new_mail_response(response: Any) -> bool:
+    """判断 IDLE 推送的响应是否表示有新邮件（EXISTS/RECENT）"""
+    return (
+        isinstance(response, tuple)
+        and len(response) >= 2
+        and response[1] in (b"EXISTS", b"RECENT")
+    )
 
 
 class MailFetcher:
-    """使用 IMAPClient 的邮件获取器"""
+    """使用 IMAPClient 的邮件获取器，维护长连接会话"""
+
+    def __init__(
+        self,
+        account: Optional[AccountConfig] = None,
+        ledger: Optional[UidLedger] = None,
+    ):
+        """
+        初始化邮件获取器
 
-    def __init__(self):
+        Args:
+            account: 邮箱账户配置，默认使用环境变量中的单账户配置
+            ledger: 已处理邮件台账，启用后按高水位增量搜索新邮件
+        """
+        self.account = account or AccountConfig.from_config()
+        self.ledger = ledger
         self.imap_conn: Optional[IMAPClient] = None
+        self.folder = "INBOX"
+        # 当前选中文件夹的 UIDVALIDITY 和 UIDNEXT
+        self.uidvalidity: Optional[int] = None
+        self._uidnext: Optional[int] = None
+        self.noop_interval = config.IMAP_NOOP_INTERVAL
+        self.reconnect_retries = config.IMAP_RECONNECT_RETRIES
+        self.reconnect_backoff = config.IMAP_RECONNECT_BACKOFF
+        # 获取策略：peek 只下载正文文本部分，full 下载完整邮件
+        self.fetch_strategy = config.FETCH_STRATEGY
+        self.fetch_max_bytes = config.FETCH_MAX_BYTES
+        # 提取文本的附件类型及解码后的字节上限，peek 策略下也会下载这些附件的前缀
+        self.attachment_limits = attachment_limits()
+        # 批量获取时每次请求的邮件数
+        self.fetch_chunk_size = config.FETCH_CHUNK_SIZE
+        # 最近一次批量获取的 (开始时间, 耗时, 邮件数)，解析时记录到每封邮件的追踪中
+        self._last_fetch: Optional[Tuple[float, float, int]] = None
+        # 会话统计：握手次数、断线重连次数、NOOP保活次数、下载的邮件字节数
+        self.stats: Dict[str, int] = {
+            "handshakes": 0,
+            "reconnects": 0,
+            "keepalives": 0,
+            "bytes_fetched": 0,
+        }
+        self._ssl_context: Optional[ssl.SSLContext] = None
+        self._selected_folder: Optional[str] = None
+        self._last_activity = 0.0
+        self._lock = threading.RLock()
+        # 等待使用连接的其他线程数，IDLE 期间有等待者时会提前退出 IDLE
+        self._waiters = 0
+        self._waiters_lock = threading.Lock()
 
     def connect(self) -> None:
         """建立 IMAP 连接"""
-        if self.imap_conn:
-            return
-        context = ssl.create_default_context()
-        self.imap_conn = IMAPClient(
-            config.SOURCE_IMAP_SERVER,
-            port=config.SOURCE_IMAP_PORT,
-            ssl=True,
-            ssl_context=context,
-        )
-        self.imap_conn.login(config.SOURCE_EMAIL, config.SOURCE_PASSWORD)
-        # logger.info("IMAP connection established") # 减少无效日志
+        with self._lock:
+            if self.imap_conn:
+                return
+            if self._ssl_context is None:
+                self._ssl_context = ssl.create_default_context()
+            self.imap_conn = IMAPClient(
+                self.account.imap_server,
+                port=self.account.imap_port,
+                ssl=True,
+                ssl_context=self._ssl_context,
+            )
+            self.stats["handshakes"] += 1
+            self._selected_folder = None
+            try:
+                self.imap_conn.login(
+                    self.account.source_email, self.account.source_password
+                )
+            except Exception:
+                self._drop_connection()
+                raise
+            self._last_activity = time.monotonic()
+            # logger.info("IMAP connection established") # 减少无效日志
 
     def disconnect(self) -> None:
         """断开 IMAP 连接"""
+        with self._lock:
+            if self.imap_conn:
+                try:
+                    self.imap_conn.logout()
+                    # logger.info("IMAP connection closed") # 减少无效日志
+                except Exception as e:
+                    logger.warning(f"Error disconnecting IMAP: {e}")
+                finally:
+                    self.imap_conn = None
+                    self._selected_folder = None
+
+    def _drop_connection(self) -> None:
+        """丢弃已失效的连接（不发送 LOGOUT）"""
         if self.imap_conn:
             try:
-                self.imap_conn.logout()
-                # logger.info("IMAP connection closed") # 减少无效日志
+                self.imap_conn.shutdown()
+            except Exception as e:
+                logger.debug(f"Error shutting down IMAP connection: {e}")
+        self.imap_conn = None
+        self._selected_folder = None
+
+    def _reconnect(self) -> None:
+        """按指数退避重新建立连接"""
+        delay = self.reconnect_backoff
+        for attempt in range(1, self.reconnect_retries + 1):
+            try:
+                self.connect()
+                self.stats["reconnects"] += 1
+                logger.info(f"IMAP reconnected, session stats: {self.stats}")
+                return
+            except Exception as e:
+                if attempt == self.reconnect_retries:
+                    raise
+                logger.warning(
+                    f"IMAP reconnect attempt {attempt} failed: {e}, retrying in {delay:.1f}s"
+                )
+                time.sleep(delay)
+                delay *= 2
+
+    def _ensure_connection(self) -> IMAPClient:
+        """
+        确保存在可用的 IMAP 连接并已选中邮箱
+
+        空闲超过 noop_interval 的连接先发送 NOOP 探测，失效则重连。
+        """
+        if (
+            self.imap_conn
+            and time.monotonic() - self._last_activity > self.noop_interval
+        ):
+            try:
+                self.imap_conn.noop()
+                self.stats["keepalives"] += 1
+                self._last_activity = time.monotonic()
             except Exception as e:
-                logger.warning(f"Error disconnecting IMAP: {e}")
+                logger.warning(f"IMAP connection is dead ({e}), reconnecting...")
+                self._drop_connection()
+
+        if not self.imap_conn:
+            if self.stats["handshakes"]:
+                self._reconnect()
+            else:
+                self.connect()
+        assert self.imap_conn is not None  # 类型检查需要
+
+        # 复用已选中的邮箱，避免每次操作重复 SELECT
+        if self._selected_folder != self.folder:
+            info = self.imap_conn.select_folder(self.folder)
+            self._selected_folder = self.folder
+            self.uidvalidity = info.get(b"UIDVALIDITY")
+            self._uidnext = info.get(b"UIDNEXT")
+        return self.imap_conn
+
+    @contextmanager
+    def _session(self) -> Iterator[None]:
+        """独占长连接；若连接正处于 IDLE，则通知 IDLE 尽快退出"""
+        if not self._lock.acquire(blocking=False):
+            with self._waiters_lock:
+                self._waiters += 1
+            try:
+                self._lock.acquire()
+            finally:
+                with self._waiters_lock:
+                    self._waiters -= 1
+        try:
+            yield
+        finally:
+            self._lock.release()
+
+    def _execute(self, operation: Callable[[IMAPClient], T]) -> T:
+        """
+        在长连接上执行 IMAP 操作，连接中断时重连并重试一次
+
+        Args:
+            operation: 接收 IMAPClient 的操作函数
+
+        Returns:
+            操作函数的返回值
+        """
+        with self._session():
+            for attempt in range(2):
+                conn = self._ensure_connection()
+                try:
+                    result = operation(conn)
+                    self._last_activity = time.monotonic()
+                    return result
+                except (IMAPClient.AbortError, OSError) as e:
+                    if attempt:
+                        raise
+                    logger.warning(f"IMAP connection dropped ({e}), reconnecting...")
+                    self._drop_connection()
+            raise RuntimeError("unreachable")
+
+    def supports_idle(self) -> bool:
+        """检查 IMAP 服务器是否支持 IDLE 扩展"""
+        try:
+            return bool(self._execute(lambda conn: conn.has_capability("IDLE")))
+        except Exception as e:
+            logger.error(f"Error checking IDLE capability: {e}")
+            return False
+
+    def wait_for_new_mail(
+        self, timeout: float, stop_event: Optional[threading.Event] = None
+    ) -> bool:
+        """
+        进入 IDLE 状态等待服务器推送新邮件
+
+        Args:
+            timeout: 本次 IDLE 的最长持续时间（秒），到期后退出以便重新发起 IDLE
+            stop_event: 停止信号，设置后尽快退出 IDLE
+
+        Returns:
+            收到 EXISTS/RECENT 推送，或因其他线程使用连接而中断 IDLE（期间的推送
+            可能被该命令消费）时返回True；超时或被停止返回False
+        """
+        # 先让等待中的命令（如工作线程标记已读）执行完毕
+        while self._waiters and not (stop_event and stop_event.is_set()):
+            time.sleep(IDLE_YIELD_INTERVAL)
+
+        with self._lock:
+            conn = self._ensure_connection()
+
+            deadline = time.monotonic() + timeout
+            has_new_mail = False
+            conn.idle()
+            try:
+                while not (stop_event and stop_event.is_set()) and not self._waiters:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    responses = conn.idle_check(
+                        timeout=min(remaining, IDLE_CHECK_INTERVAL)
+                    )
+                    if any(_is_new_mail_response(r) for r in responses):
+                        has_new_mail = True
+                        break
+                else:
+                    has_new_mail = bool(self._waiters)
             finally:
-                self.imap_conn = None
+                conn.idle_done()
+                self._last_activity = time.monotonic()
+            return has_new_mail
 
     def search_unseen_emails(self) -> List[int]:
         """返回未读邮件的 UID 列表"""
         try:
-            if not self.imap_conn:
-                self.connect()
-            assert self.imap_conn is not None  # 类型检查需要
-            self.imap_conn.select_folder("INBOX")
-            uids = self.imap_conn.search(["UNSEEN"])
-            return uids
+            with metrics.time(STAGE_IMAP_SEARCH):
+                return self._execute(lambda conn: conn.search(["UNSEEN"]))
         except Exception as e:
             logger.error(f"Error searching unseen emails: {e}")
             return []
 
+    @property
+    def mailbox_id(self) -> str:
+        """台账中的邮箱标识：账户名/文件夹"""
+        return f"{self.account.name}/{self.folder}"
+
+    def search_new_emails(self) -> List[int]:
+        """
+        返回需要处理的邮件 UID
+
+        启用台账时，只搜索高水位之后的新邮件（UID n:*），并加上台账中尚未完成的邮件，
+        不再依赖 \\Seen 标志；首次处理某个文件夹时以未读邮件和 UIDNEXT 建立高水位。
+        未启用台账时等同于 search_unseen_emails。
+        """
+        if self.ledger is None:
+            return self.search_unseen_emails()
+        ledger = self.ledger
+
+        def search(conn: IMAPClient) -> Tuple[int, List[int], int]:
+            uidvalidity = self.uidvalidity
+            assert uidvalidity is not None  # SELECT 后一定存在
+            high_water = ledger.high_water_mark(self.mailbox_id, uidvalidity)
+            if high_water is None:
+                uids = list(conn.search(["UNSEEN"]))
+                baseline = (self._uidnext or 1) - 1
+            else:
+                # UID n:* 至少会返回最后一封邮件，需要过滤掉高水位及以下的 UID
+                uids = [
+                    uid
+                    for uid in conn.search(["UID", f"{high_water + 1}:*"])
+                    if uid > high_water
+                ]
+                baseline = high_water
+            return uidvalidity, uids, max([baseline, *uids])
+
+        try:
+            with metrics.time(STAGE_IMAP_SEARCH):
+                uidvalidity, uids, high_water = self._execute(search)
+            ledger.add_pending(self.mailbox_id, uidvalidity, uids, high_water)
+            return ledger.unfinished(self.mailbox_id, uidvalidity)
+        except Exception as e:
+            logger.error(f"Error searching new emails: {e}")
+            return []
+
+    def get_state(
+        self, uid: Optional[int], uidvalidity: Optional[int]
+    ) -> Optional[str]:
+        """返回邮件在台账中的处理状态，未启用台账时返回None"""
+        if self.ledger is None or uid is None or uidvalidity is None:
+            return None
+        return self.ledger.get_state(self.mailbox_id, uidvalidity, uid)
+
+    def set_state(
+        self, uid: Optional[int], uidvalidity: Optional[int], state: str
+    ) -> None:
+        """更新邮件在台账中的处理状态，未启用台账时忽略"""
+        if self.ledger is None or uid is None or uidvalidity is None:
+            return
+        self.ledger.set_state(self.mailbox_id, uidvalidity, uid, state)
+
+    def record_failure(self, uid: Optional[int], uidvalidity: Optional[int]) -> bool:
+        """
+        在台账中记录一次处理失败，延迟后再重试
+
+        Returns:
+            超过最大尝试次数、不再处理时返回True；未启用台账时返回False
+        """
+        if self.ledger is None or uid is None or uidvalidity is None:
+            return False
+        return self.ledger.record_failure(self.mailbox_id, uidvalidity, uid)
+
+    def _fetch_full(self, conn: IMAPClient, uids: List[int]) -> Dict[int, bytes]:
+        """
+        下载完整邮件
+
+        使用 BODY.PEEK[] 而不是 RFC822，避免在处理成功之前就被服务器标记为已读。
+        """
+        if not uids:
+            return {}
+        response = conn.fetch(uids, ["BODY.PEEK[]"])
+        return {uid: response[uid][b"BODY[]"] for uid in uids if uid in response}
+
+    def _fetch_peek(self, conn: IMAPClient, uids: List[int]) -> Dict[int, bytes]:
+        """
+        只下载邮件头和正文文本部分，重建一封去掉附件内容的邮件
+
+        第一次请求获取 BODYSTRUCTURE 和邮件头；第二次请求获取各部分的 MIME 头，
+        以及文本部分最多 fetch_max_bytes 字节的内容（结构相同的邮件合并为一次请求）。
+        支持提取文本的附件按类型的上限下载前缀，其余附件只保留 MIME 头，
+        解析结果中仍然包含附件文件名。
+        """
+        max_bytes = self.fetch_max_bytes
+        response = conn.fetch(uids, ["BODYSTRUCTURE", "BODY.PEEK[HEADER]"])
+
+        emails: Dict[int, bytes] = {}
+        full_uids: List[int] = []
+        # 需要获取的数据项 -> 使用该结构的邮件
+        plans: Dict[Tuple[str, ...], List[int]] = {}
+        # 多部分邮件使用原始的分隔符重建
+        layouts: Dict[int, Optional[List[Tuple[str, int]]]] = {}
+        for uid in uids:
+            if uid not in response:
+                continue
+            data = response[uid]
+            structure = data.get(b"BODYSTRUCTURE")
+            try:
+                if structure is None:
+                    raise ValueError("missing BODYSTRUCTURE")
+                if structure.is_multipart:
+                    sections = _plan_sections(
+                        structure, max_bytes, self.attachment_limits
+                    )
+                    if sections is None:
+                        raise ValueError("unsupported structure")
+                    items: List[str] = []
+                    for section, size in sections:
+                        items.append(f"BODY.PEEK[{section}.MIME]")
+                        if size:
+                            items.append(f"BODY.PEEK[{section}]<0.{size}>")
+                    layouts[uid] = sections
+                else:
+                    content_type = f"{_atom(structure[0])}/{_atom(structure[1])}"
+                    with_body = content_type in PEEK_BODY_TYPES
+                    items = [f"BODY.PEEK[TEXT]<0.{max_bytes}>"] if with_body else []
+                    layouts[uid] = None
+            except Exception as e:
+                logger.debug(f"Falling back to full fetch for UID {uid}: {e}")
+                full_uids.append(uid)
+                continue
+
+            if items:
+                plans.setdefault(tuple(items), []).append(uid)
+            else:
+                emails[uid] = data[b"BODY[HEADER]"]
+
+        for plan_items, plan_uids in plans.items():
+            parts = conn.fetch(plan_uids, list(plan_items))
+            for uid in plan_uids:
+                if uid not in parts:
+                    continue
+                header = response[uid][b"BODY[HEADER]"]
+                data = parts[uid]
+                sections = layouts[uid]
+                if sections is None:
+                    body = data.get(b"BODY[TEXT]<0>", b"")
+                    emails[uid] = header + _trim_partial(body, max_bytes)
+                    continue
+
+                boundary = email.message_from_bytes(header).get_boundary()
+                if boundary is None:
+                    full_uids.append(uid)
+                    continue
+                delimiter = f"--{boundary}".encode()
+                chunks = [header]
+                for section, size in sections:
+                    chunks.append(delimiter + b"\r\n")
+                    chunks.append(data.get(f"BODY[{section}.MIME]".encode(), b"\r\n"))
+                    if size:
+                        body = data.get(f"BODY[{section}]<0>".encode(), b"")
+                        chunks.append(_trim_partial(body, size))
+                    chunks.append(b"\r\n")
+                chunks.append(delimiter + b"--\r\n")
+                emails[uid] = b"".join(chunks)
+
+        emails.update(self._fetch_full(conn, full_uids))
+        return emails
+
     def fetch_emails_by_uids(
         self, uids: List[Union[int, bytes, str]]
     ) -> Dict[int, bytes]:
-        """批量获取原始邮件数据"""
+        """批量获取原始邮件数据，不会改变邮件的已读状态"""
         if not uids:
             return {}
 
         try:
-            if not self.imap_conn:
-                self.connect()
-            assert self.imap_conn is not None  # 类型检查需要
-            self.imap_conn.select_folder("INBOX")
-
             # 转成 int
             uid_list = [
                 int(uid.decode() if isinstance(uid, bytes) else uid) for uid in uids
             ]
 
-            response = self.imap_conn.fetch(uid_list, ["RFC822"])
-            emails = {
-                uid: response[uid][b"RFC822"] for uid in uid_list if uid in response
-            }
+            started = time.time()
+            with metrics.time(STAGE_IMAP_FETCH):
+                if self.fetch_strategy == "peek":
+                    emails = self._execute(
+                        lambda conn: self._fetch_peek(conn, uid_list)
+                    )
+                else:
+                    emails = self._execute(
+                        lambda conn: self._fetch_full(conn, uid_list)
+                    )
 
-            logger.info(f"Fetched {len(emails)} emails in batch")
+            self._last_fetch = (started, time.time() - started, len(uid_list))
+
+            fetched = sum(len(raw) for raw in emails.values())
+            self.stats["bytes_fetched"] += fetched
+            if log_sampler.allow("fetch"):
+                logger.info(f"Fetched {len(emails)} emails in batch ({fetched} bytes)")
             return emails
         except Exception as e:
             logger.error(f"Error fetching emails by UIDs: {e}")
             return {}
 
-    def fetch_email_by_uid(
-        self, uid: Union[int, str, bytes]
-    ) -> Optional[Dict[str, Any]]:
+    def iter_emails_by_uids(
+        self, uids: List[Union[int, bytes, str]], chunk_size: Optional[int] = None
+    ) -> Iterator[Tuple[int, bytes]]:
+        """
+        分批获取原始邮件数据，边下载边返回
+
+        每批单独请求并在批次之间释放连接，积压大量未处理邮件时内存只占用一批邮件，
+        且第一批下载完成后就可以开始处理。
+
+        Args:
+            uids: 邮件 UID 列表
+            chunk_size: 每批的邮件数，默认使用 FETCH_CHUNK_SIZE
+
+        Yields:
+            (UID, 原始邮件数据)
+        """
+        size = max(1, chunk_size or self.fetch_chunk_size)
+        for start in range(0, len(uids), size):
+            yield from self.fetch_emails_by_uids(uids[start : start + size]).items()
+
+    def fetch_email_by_uid(self, uid: Union[int, str, bytes]) -> Optional[EmailRecord]:
         """根据 UID 获取并解析单封邮件"""
         try:
-            if not self.imap_conn:
-                self.connect()
-            assert self.imap_conn is not None  # 类型检查需要
-            self.imap_conn.select_folder("INBOX")
-
             uid_int = int(uid.decode() if isinstance(uid, bytes) else uid)
-            response = self.imap_conn.fetch([uid_int], ["RFC822"])
-            if uid_int not in response:
+            raw_email = self.fetch_emails_by_uids([uid_int]).get(uid_int)
+            if raw_email is None:
                 logger.error(f"No data for email UID {uid!r}")
                 return None
 
-            raw_email = response[uid_int][b"RFC822"]
-            email_message = email.message_from_bytes(raw_email)
-            email_info = self._parse_email(email_message)
-            email_info["uid"] = str(uid_int)
+            record = self.parse_raw_email(raw_email, uid_int)
+            if record is None:
+                return None
 
             # 标记已读
-            self._mark_as_read(uid_int)
+            self.mark_as_read(uid_int)
 
-            return email_info
+            return record
         except Exception as e:
             logger.error(f"Error fetching email UID {uid!r}: {e}")
             return None
 
-    def _parse_email(self, email_message: Message) -> Dict[str, Any]:
-        """解析邮件内容"""
-
-        def decode_header_str(header: str) -> str:
-            if not header:
-                return ""
-            decoded = decode_header(header)
-            return "".join(
-                [
-                    part.decode(enc or "utf-8", errors="ignore")
-                    if isinstance(part, bytes)
-                    else part
-                    for part, enc in decoded
-                ]
-            )
+    def parse_raw_email(
+        self,
+        raw_email: bytes,
+        uid: Optional[int] = None,
+        account: Optional[str] = None,
+    ) -> Optional[EmailRecord]:
+        """
+        解析原始邮件数据
 
-        subject = decode_header_str(email_message.get("Subject", ""))
-        sender = decode_header_str(email_message.get("From", ""))
-        receiver = decode_header_str(email_message.get("To", ""))
-        date = email_message.get("Date", "")
-
-        body_text = ""
-        body_html = ""  # 不再处理HTML内容
-        attachments = []
-
-        if email_message.is_multipart():
-            for part in email_message.walk():
-                content_type = part.get_content_type()
-                disposition = str(part.get("Content-Disposition", ""))
-
-                if "attachment" in disposition:
-                    filename = part.get_filename()
-                    if filename:
-                        attachments.append(
-                            {
-                                "filename": decode_header_str(filename),
-                                "content_type": content_type,
-                            }
-                        )
-                    continue
-
-                payload = part.get_payload(decode=True)
-                if not payload:
-                    continue
+        Args:
+            raw_email: 原始邮件数据
+            uid: 邮件 UID，会同时记录当前文件夹的 UIDVALIDITY
+            account: 多账户模式下的账户名称
 
-                # 只处理纯文本内容，忽略HTML
-                try:
-                    charset = part.get_content_charset() or "utf-8"
-                    if content_type == "text/plain" and isinstance(payload, bytes):
-                        body_text += payload.decode(charset, errors="ignore")
-                except Exception as e:
-                    logger.warning(f"Error decoding part: {e}")
-        else:
-            payload = email_message.get_payload(decode=True)
-            if payload:
-                try:
-                    charset = email_message.get_content_charset() or "utf-8"
-                    # 只处理纯文本内容，忽略HTML
-                    if email_message.get_content_type() == "text/plain" and isinstance(
-                        payload, bytes
-                    ):
-                        body_text = payload.decode(charset, errors="ignore")
-                except Exception as e:
-                    logger.warning(f"Error decoding payload: {e}")
-
-        return {
-            "subject": subject,
-            "sender": sender,
-            "receiver": receiver,
-            "date": date,
-            "body_text": body_text,
-            "body_html": body_html,  # 保持字段但始终为空
-            "attachments": attachments,
-        }
-
-    def parse_raw_email(self, raw_email: bytes) -> Dict[str, Any]:
-        """解析原始邮件数据"""
+        Returns:
+            邮件记录，启用追踪时带有新分配的 trace_id；解析失败时返回None
+        """
+        trace_id = new_trace_id() if tracer.enabled else None
+        if trace_id is not None and self._last_fetch is not None:
+            # 同一批邮件共用一次 IMAP 请求，每封邮件的获取阶段都记录这次请求的耗时
+            start, duration, batch_size = self._last_fetch
+            tracer.record(
+                "fetch",
+                trace_id,
+                start,
+                duration,
+                uid=uid,
+                account=account,
+                bytes=len(raw_email),
+                batch_size=batch_size,
+                strategy=self.fetch_strategy,
+            )
         try:
-            msg = email.message_from_bytes(raw_email)
-            return self._parse_email(msg)
+            with (
+                metrics.time(STAGE_PARSE),
+                tracer.span("parse", trace_id, uid=uid, bytes=len(raw_email)) as span,
+            ):
+                record = parse_email(
+                    raw_email, uid, self.uidvalidity, account, self.attachment_limits
+                )
+                span.set(
+                    body_chars=len(record.body_text),
+                    attachments=len(record.attachments),
+                )
+            return replace(record, trace_id=trace_id) if trace_id else record
         except Exception as e:
             logger.error(f"Error parsing raw email: {e}")
-            return {}
+            return None
 
-    def _mark_as_read(self, uid: int) -> None:
-        """标记邮件为已读"""
+    def mark_as_read(self, uid: int) -> bool:
+        """
+        标记邮件为已读（复用长连接，不再单独建立连接）
+
+        Args:
+            uid: 邮件 UID
+
+        Returns:
+            标记成功返回True，否则返回False
+        """
         try:
-            if self.imap_conn:
-                self.imap_conn.add_flags([uid], [b"\\Seen"])
+            with metrics.time(STAGE_MARK_READ):
+                self._execute(lambda conn: conn.add_flags([uid], [b"\\Seen"]))
+            if log_sampler.allow("mark_read"):
                 logger.info(f"Marked email UID {uid} as read")
+            return True
         except Exception as e:
             logger.error(f"Error marking UID {uid} as read: {e}")
+            return False
@@ -0,0 +1,212 @@
+"""
+邮件处理流程模块
+线程引擎、asyncio 引擎和多账户调度器共用的单封邮件处理流程：
+防回环检查 → LLM 处理 → 发送 → 标记已读，并在台账中记录每一步的结果，
+使进程在任意步骤中断后重启都不会重复发送或遗漏邮件
+"""
+
+import asyncio
+from typing import Optional
+
+from loguru import logger
+
+from app.email_record import EmailRecord
+from app.mail_fetcher import MailFetcher
+from app.mail_processor import MailProcessor
+from app.mail_sender import REPLY_SUBJECT_PREFIX, MailSender
+from app.metrics import EMAILS_FAILED, EMAILS_PROCESSED, EMAILS_SKIPPED, metrics
+from app.tracing import tracer
+from app.uid_ledger import DONE, FAILED, SENT, SKIPPED
+
+
+def _prefix(email_info: EmailRecord) -> str:
+    """多账户模式下日志中的账户前缀"""
+    account = email_info.account
+    return f"[{account}] " if account else ""
+
+
+def _should_skip(email_info: EmailRecord, fetcher: MailFetcher) -> bool:
+    """已处理完成或机器人自己发出的邮件直接跳过"""
+    uid = email_info.uid
+    uidvalidity = email_info.uidvalidity
+    if uid is not None and fetcher.get_state(uid, uidvalidity) in (
+        DONE,
+        SKIPPED,
+        FAILED,
+    ):
+        logger.info(f"{_prefix(email_info)}Email with UID {uid} already handled")
+        return True
+
+    # 检查邮件主题是否以"[EmailLLM]"开头，如果是则跳过处理
+    subject = email_info.subject
+    if subject.startswith(REPLY_SUBJECT_PREFIX):
+        logger.info(
+            f"{_prefix(email_info)}Skipping email with subject '{subject}' as it starts with '{REPLY_SUBJECT_PREFIX}'"
+        )
+        metrics.inc(EMAILS_SKIPPED)
+        if uid is not None:
+            fetcher.set_state(uid, uidvalidity, SKIPPED)
+        return True
+    return False
+
+
+def _already_sent(email_info: EmailRecord, fetcher: MailFetcher) -> bool:
+    """回复已发送但尚未标记已读（上次在标记前中断）"""
+    uid = email_info.uid
+    return uid is not None and fetcher.get_state(uid, email_info.uidvalidity) == SENT
+
+
+def _finish(email_info: EmailRecord, fetcher: MailFetcher) -> None:
+    """标记原邮件为已读并在台账中记录完成"""
+    uid = email_info.uid
+    if uid is None:
+        return
+    # 复用轮询器的IMAP长连接标记邮件为已读
+    with tracer.span("mark_read", email_info.trace_id, uid=uid) as span:
+        marked = fetcher.mark_as_read(uid)
+        span.set(ok=marked)
+    if marked:
+        fetcher.set_state(uid, email_info.uidvalidity, DONE)
+
+
+def _record_failure(email_info: EmailRecord, fetcher: MailFetcher) -> None:
+    """在台账中记录处理失败，超过最大尝试次数后不再处理"""
+    metrics.inc(EMAILS_FAILED)
+    if fetcher.record_failure(email_info.uid, email_info.uidvalidity):
+        logger.error(
+            f"{_prefix(email_info)}Email with UID {email_info.uid} failed too many times, giving up"
+        )
+
+
+def _send(email_info: EmailRecord, sender: MailSender) -> bool:
+    """发送回复，记录发送阶段的 span"""
+    with tracer.span(
+        "send",
+        email_info.trace_id,
+        uid=email_info.uid,
+        bytes=len(email_info.body_text.encode("utf-8")),
+    ) as span:
+        sent = sender.send_email(email_info)
+        span.set(ok=sent)
+    return sent
+
+
+def prepare_reply(
+    email_info: EmailRecord, processor: MailProcessor, fetcher: MailFetcher
+) -> Optional[EmailRecord]:
+    """
+    持久化队列的 LLM 阶段：防回环检查后调用LLM生成回复
+
+    Args:
+        email_info: 邮件记录
+        processor: 邮件处理器
+        fetcher: 邮件获取器，用于读写台账
+
+    Returns:
+        待发送的回复记录；邮件需要跳过时返回None。回复已发送过时原样返回，
+        发送阶段只补做标记已读
+    """
+    if _should_skip(email_info, fetcher):
+        return None
+    if _already_sent(email_info, fetcher):
+        return email_info
+    return processor.process(email_info)
+
+
+def deliver_reply(
+    email_info: EmailRecord, sender: MailSender, fetcher: MailFetcher
+) -> bool:
+    """
+    持久化队列的发送阶段：发送回复并标记原邮件为已读
+
+    Args:
+        email_info: LLM 阶段生成的回复记录
+        sender: 邮件发送器
+        fetcher: 邮件获取器，用于标记已读和读写台账
+
+    Returns:
+        发送成功（或此前已发送）返回True
+    """
+    uid = email_info.uid
+    if not _already_sent(email_info, fetcher):
+        if not _send(email_info, sender):
+            logger.error(
+                f"{_prefix(email_info)}Failed to forward email with UID: {uid}"
+            )
+            return False
+        logger.info(
+            f"{_prefix(email_info)}Successfully forwarded email with UID: {uid}"
+        )
+        fetcher.set_state(uid, email_info.uidvalidity, SENT)
+    _finish(email_info, fetcher)
+    metrics.inc(EMAILS_PROCESSED)
+    return True
+
+
+def handle_email(
+    email_info: EmailRecord,
+    processor: MailProcessor,
+    sender: MailSender,
+    fetcher: MailFetcher,
+) -> None:
+    """
+    处理单封新邮件
+
+    Args:
+        email_info: 邮件记录
+        processor: 邮件处理器
+        sender: 邮件发送器
+        fetcher: 邮件获取器，用于标记已读和读写台账
+    """
+    try:
+        reply = prepare_reply(email_info, processor, fetcher)
+        if reply is not None and not deliver_reply(reply, sender, fetcher):
+            _record_failure(email_info, fetcher)
+    except Exception as e:
+        logger.error(
+            f"{_prefix(email_info)}Error handling email UID {email_info.uid}: {e}"
+        )
+        _record_failure(email_info, fetcher)
+
+
+async def handle_email_async(
+    email_info: EmailRecord,
+    processor: MailProcessor,
+    sender: MailSender,
+    fetcher: MailFetcher,
+) -> None:
+    """
+    handle_email 的异步版本：LLM 调用在当前事件循环中执行，
+    IMAP/SMTP/SQLite 等阻塞操作放入线程池
+
+    Args:
+        email_info: 邮件记录
+        processor: 邮件处理器
+        sender: 邮件发送器
+        fetcher: 邮件获取器，用于标记已读和读写台账
+    """
+    uid = email_info.uid
+    try:
+        if await asyncio.to_thread(_should_skip, email_info, fetcher):
+            return
+
+        if not await asyncio.to_thread(_already_sent, email_info, fetcher):
+            processed_email_info = await processor.process_async(email_info)
+            if not await asyncio.to_thread(_send, processed_email_info, sender):
+                logger.error(
+                    f"{_prefix(email_info)}Failed to forward email with UID: {uid}"
+                )
+                await asyncio.to_thread(_record_failure, email_info, fetcher)
+                return
+            logger.info(
+                f"{_prefix(email_info)}Successfully forwarded email with UID: {uid}"
+            )
+            await asyncio.to_thread(
+                fetcher.set_state, uid, email_info.uidvalidity, SENT
+            )
+
+        await asyncio.to_thread(_finish, email_info, fetcher)
+        metrics.inc(EMAILS_PROCESSED)
+    except Exception as e:
+        logger.error(f"{_prefix(email_info)}Error handling email UID {uid}: {e}")
+        await asyncio.to_thread(_record_failure, email_info, fetcher)
@@ -0,0 +1,119 @@
+"""
+邮件解析模块
+单次遍历 MIME 树同时提取正文和附件信息，取代 MailFetcher 和 MailProcessor 中各自的解析器
+"""
+
+import email
+from email import policy
+from email.message import Message
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+from app.attachment_text import attachment_kind, extract_attachment_text
+from app.email_record import Attachment, EmailRecord, decode_text_header
+from app.html_text import html_to_text
+
+
+def _decode_payload(part: Message) -> str:
+    """解码文本部分的内容，未知字符集按 UTF-8 处理"""
+    payload = part.get_payload(decode=True)
+    if not isinstance(payload, bytes):
+        return ""
+    charset = part.get_content_charset() or "utf-8"
+    try:
+        return payload.decode(charset, errors="ignore")
+    except LookupError:
+        return payload.decode("utf-8", errors="ignore")
+
+
+def _attachment_filename(part: Message) -> Optional[str]:
+    """
+    返回附件的文件名，不是附件时返回None
+
+    get_filename 已处理 RFC 2231 编码，客户端常用的 RFC 2047 编码文件名再单独解码。
+    """
+    if part.get_content_disposition() != "attachment":
+        return None
+    filename = part.get_filename() or ""
+    if "=?" in filename:
+        filename = decode_text_header(filename)
+    return filename
+
+
+def parse_email(
+    raw_email: bytes,
+    uid: Optional[int] = None,
+    uidvalidity: Optional[int] = None,
+    account: Optional[str] = None,
+    attachment_limits: Optional[Dict[str, int]] = None,
+) -> EmailRecord:
+    """
+    解析原始邮件
+
+    只遍历一次 MIME 树：附件记录文件名和类型，非附件的 text/plain 部分作为正文，
+    正文片段先收集到列表中最后一次拼接；没有纯文本正文时使用 HTML 正文转换的文本。
+    attachment_limits 中列出类型的附件（聊天工具导出的 .txt/.csv/.html）会提取文本，
+    按附件顺序追加在正文之后。
+
+    使用 compat32 策略：policy.default 在解析过程中每次读取 Content-Type 都会
+    重新经过头部注册表，短邮件实测比 compat32 慢约 10 倍（见 scripts/bench_parser.py）。
+
+    主题和收发件人只保存原始头部，由 EmailRecord 在首次访问时解码。
+
+    Args:
+        raw_email: 原始邮件数据
+        uid: 邮件 UID
+        uidvalidity: 所在文件夹的 UIDVALIDITY
+        account: 多账户模式下的账户名称
+        attachment_limits: 附件类型 -> 解码后的字节上限，为空时不提取附件文本
+
+    Returns:
+        邮件记录
+    """
+    message = email.message_from_bytes(raw_email, policy=policy.compat32)
+
+    texts: List[str] = []
+    htmls: List[str] = []
+    attachments: List[Attachment] = []
+    attachment_texts: List[str] = []
+    for part in message.walk():
+        content_type = part.get_content_type()
+        try:
+            # 作为附件转发的邮件（message/rfc822）也记录文件名
+            filename = _attachment_filename(part)
+            if filename is not None:
+                if filename:
+                    attachments.append(Attachment(filename, content_type))
+                kind = attachment_kind(filename, content_type)
+                if attachment_limits and kind in attachment_limits:
+                    text = extract_attachment_text(
+                        part, filename, kind, attachment_limits[kind]
+                    )
+                    if text:
+                        attachment_texts.append(text)
+            elif content_type == "text/plain" and not part.is_multipart():
+                texts.append(_decode_payload(part))
+            elif content_type == "text/html" and not part.is_multipart():
+                htmls.append(_decode_payload(part))
+        except Exception as e:
+            logger.warning(f"Error decoding part: {e}")
+
+    body_text = "".join(texts)
+    # 只有 HTML 正文的邮件（如微信、QQ 转发的聊天记录）转换为纯文本
+    if not body_text.strip() and htmls:
+        body_text = "\n".join(html_to_text(html) for html in htmls)
+    if attachment_texts:
+        body_text = "\n\n".join([body_text.rstrip(), *attachment_texts]).lstrip()
+
+    return EmailRecord(
+        body_text=body_text,
+        raw_subject=str(message.get("Subject", "")),
+        raw_sender=str(message.get("From", "")),
+        raw_receiver=str(message.get("To", "")),
+        date=str(message.get("Date", "")),
+        attachments=tuple(attachments),
+        uid=uid,
+        uidvalidity=uidvalidity,
+        account=account,
+    )
@@ -0,0 +1,427 @@
+"""
+邮件处理流水线模块
+轮询线程负责获取和解析邮件（fetch → parse），
+工作线程池负责耗时的 LLM 处理及后续的发送与标记已读（LLM → send → mark-read）；
+启用持久化任务队列时，各阶段之间通过 SQLite 队列衔接，进程重启后继续处理
+"""
+
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, List, Optional, Protocol, Set, Tuple
+
+from loguru import logger
+
+from app.config import config
+from app.email_record import EmailRecord
+from app.job_queue import LEASED, READY, Job, JobQueue
+from app.metrics import EMAILS_FAILED, RETRIES, metrics
+
+# 向工作线程发送的停止标记
+_STOP = object()
+
+# 队列已满时重试入队的间隔（秒），用于及时响应停止信号
+_PUT_RETRY_INTERVAL = 0.5
+
+# 持久化流水线的阶段（任务队列名称）
+LLM_STAGE = "llm"
+SEND_STAGE = "send"
+
+
+class FairQueue:
+    """
+    按账户分组的公平队列
+
+    每个账户单独限制排队长度，某个账户队列满时只阻塞该账户的入队；
+    出队时在有待处理邮件的账户之间轮转，避免繁忙邮箱占满所有工作线程。
+    """
+
+    def __init__(self, per_key_size: int):
+        """
+        初始化公平队列
+
+        Args:
+            per_key_size: 每个账户的最大排队长度
+        """
+        self.per_key_size = per_key_size
+        self._queues: "OrderedDict[Any, Deque[Any]]" = OrderedDict()
+        self._cond = threading.Condition()
+        self._unfinished = 0
+
+    def put(self, key: Any, item: Any, timeout: Optional[float] = None) -> None:
+        """
+        入队，该账户队列已满时阻塞
+
+        Raises:
+            queue.Full: 超时后该账户队列仍然已满
+        """
+        with self._cond:
+            if not self._cond.wait_for(
+                lambda: len(self._queues.get(key, ())) < self.per_key_size, timeout
+            ):
+                raise queue.Full
+            self._append(key, item)
+
+    def put_unbounded(self, key: Any, item: Any) -> None:
+        """不受长度限制地入队（用于控制消息）"""
+        with self._cond:
+            self._append(key, item)
+
+    def _append(self, key: Any, item: Any) -> None:
+        """追加元素并唤醒等待的出队线程"""
+        self._queues.setdefault(key, deque()).append(item)
+        self._unfinished += 1
+        self._cond.notify_all()
+
+    def get(self, block: bool = True) -> Any:
+        """
+        按账户轮转出队
+
+        Raises:
+            queue.Empty: 非阻塞模式下队列为空
+        """
+        with self._cond:
+            if not self._queues:
+                if not block:
+                    raise queue.Empty
+                self._cond.wait_for(lambda: bool(self._queues))
+            key, items = next(iter(self._queues.items()))
+            item = items.popleft()
+            # 刚出队的账户排到末尾，下次优先服务其他账户
+            del self._queues[key]
+            if items:
+                self._queues[key] = items
+            self._cond.notify_all()
+            return item
+
+    def task_done(self) -> None:
+        """标记一个出队的元素处理完成"""
+        with self._cond:
+            self._unfinished -= 1
+            self._cond.notify_all()
+
+    def join(self) -> None:
+        """等待所有入队元素处理完成"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._unfinished <= 0)
+
+    def qsize(self) -> int:
+        """当前排队的元素总数"""
+        with self._cond:
+            return sum(len(items) for items in self._queues.values())
+
+
+class Pipeline(Protocol):
+    """邮件处理流水线的公共接口，由 MailPipeline 和 DurablePipeline 实现"""
+
+    def start(self) -> None:
+        """启动工作线程"""
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """停止接收新邮件并等待工作线程退出"""
+
+    def is_in_flight(self, uid: Any, account: Optional[str] = None) -> bool:
+        """邮件是否仍在处理中"""
+
+    def submit(self, email_info: EmailRecord) -> bool:
+        """提交一封邮件，成功入队返回True"""
+
+
+class MailPipeline:
+    """带有界工作线程池的邮件处理流水线"""
+
+    def __init__(
+        self,
+        handler: Callable[[EmailRecord], Any],
+        workers: Optional[int] = None,
+        queue_size: Optional[int] = None,
+    ):
+        """
+        初始化流水线
+
+        Args:
+            handler: 单封邮件的处理函数，在工作线程中依次完成 LLM、发送和标记已读
+            workers: 并发处理邮件的工作线程数
+            queue_size: 每个账户等待处理的邮件队列长度，队列满时阻塞该账户的获取（背压）
+        """
+        self.handler = handler
+        self.workers = workers or config.LLM_WORKERS
+        self._queue = FairQueue(queue_size or config.LLM_QUEUE_SIZE)
+        self._in_flight: Set[Tuple[Optional[str], Optional[int]]] = set()
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._stop_event = threading.Event()
+
+    def start(self) -> None:
+        """启动工作线程"""
+        if self._threads:
+            return
+        self._stop_event.clear()
+        for index in range(self.workers):
+            thread = threading.Thread(
+                target=self._worker, name=f"mail-worker-{index}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Mail pipeline started with {self.workers} workers")
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        停止流水线，等待正在处理的邮件完成
+
+        Args:
+            timeout: 等待每个工作线程退出的最长时间（秒）
+        """
+        self._stop_event.set()
+        # 丢弃尚未开始处理的邮件，它们仍为未读状态，下次启动时会重新获取
+        while True:
+            try:
+                email_info = self._queue.get(block=False)
+            except queue.Empty:
+                break
+            self._finish(email_info)
+            self._queue.task_done()
+        for _ in self._threads:
+            self._queue.put_unbounded(_STOP, _STOP)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        logger.info("Mail pipeline stopped")
+
+    def is_in_flight(self, uid: Any, account: Optional[str] = None) -> bool:
+        """判断邮件是否已在流水线中排队或处理"""
+        with self._lock:
+            return (account, uid) in self._in_flight
+
+    def submit(self, email_info: EmailRecord) -> bool:
+        """
+        提交邮件进入 LLM 阶段，该账户队列已满时阻塞，从而限制获取速度
+
+        Args:
+            email_info: 解析后的邮件记录，多账户模式下带有 account
+
+        Returns:
+            成功入队返回True，邮件已在处理中或流水线已停止返回False
+        """
+        key = self._key(email_info)
+        with self._lock:
+            if key in self._in_flight:
+                return False
+            self._in_flight.add(key)
+
+        while not self._stop_event.is_set():
+            try:
+                self._queue.put(key[0], email_info, timeout=_PUT_RETRY_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+
+        self._finish(email_info)
+        return False
+
+    def join(self) -> None:
+        """等待队列中的所有邮件处理完成"""
+        self._queue.join()
+
+    @staticmethod
+    def _key(email_info: EmailRecord) -> Tuple[Optional[str], Optional[int]]:
+        """邮件在流水线中的唯一标识：(账户, UID)"""
+        return email_info.account, email_info.uid
+
+    def _finish(self, email_info: EmailRecord) -> None:
+        """将邮件移出处理中集合"""
+        with self._lock:
+            self._in_flight.discard(self._key(email_info))
+
+    def _worker(self) -> None:
+        """工作线程主循环"""
+        while True:
+            email_info = self._queue.get()
+            try:
+                if email_info is _STOP:
+                    return
+                self.handler(email_info)
+            except Exception as e:
+                logger.error(f"Error processing mail with UID {email_info.uid}: {e}")
+            finally:
+                if email_info is not _STOP:
+                    self._finish(email_info)
+                self._queue.task_done()
+
+
+class DurablePipeline:
+    """
+    基于持久化任务队列的邮件处理流水线
+
+    轮询线程只需把解析后的邮件写入队列即可返回；工作线程按自己的节奏依次执行
+    LLM 阶段和发送阶段，每个阶段的结果都先写入队列再进入下一阶段。
+    进程在任意时刻退出后，重启的工作线程会继续处理队列中剩余的任务。
+    与 MailPipeline 一样按账户轮转取任务，并分别限制每个账户的排队长度。
+    """
+
+    def __init__(
+        self,
+        jobs: JobQueue,
+        prepare: Callable[[EmailRecord], Optional[EmailRecord]],
+        deliver: Callable[[EmailRecord], bool],
+        workers: Optional[int] = None,
+        retry_delay: Optional[float] = None,
+        poll_interval: float = 1.0,
+        queue_size: Optional[int] = None,
+    ):
+        """
+        初始化流水线
+
+        Args:
+            jobs: 持久化任务队列
+            prepare: LLM 阶段，返回待发送的回复记录，返回None表示无需回复
+            deliver: 发送阶段，发送回复并标记已读，失败返回False
+            workers: 工作线程数
+            retry_delay: 失败任务第一次重试前的等待时间（秒），之后每次翻倍
+            poll_interval: 队列为空时检查新任务的间隔（秒）
+            queue_size: 每个账户等待 LLM 处理的任务数上限，达到时阻塞该账户的获取（背压）
+        """
+        self.jobs = jobs
+        self.prepare = prepare
+        self.deliver = deliver
+        self.workers = workers or config.LLM_WORKERS
+        self.retry_delay = (
+            retry_delay if retry_delay is not None else config.JOB_RETRY_DELAY
+        )
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size or config.LLM_QUEUE_SIZE
+        self._cond = threading.Condition()
+        # LLM 阶段的任务被取出后通知等待入队的轮询线程
+        self._space = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._stop_event = threading.Event()
+
+    def start(self) -> None:
+        """启动工作线程，队列中上次未完成的任务会被继续处理"""
+        if self._threads:
+            return
+        self._stop_event.clear()
+        for index in range(self.workers):
+            thread = threading.Thread(
+                target=self._worker, name=f"job-worker-{index}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        logger.info(
+            f"Durable mail pipeline started with {self.workers} workers, "
+            f"jobs: {self.jobs.counts()}"
+        )
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        停止流水线，等待正在处理的任务完成，队列中的其余任务保留到下次启动
+
+        Args:
+            timeout: 等待每个工作线程退出的最长时间（秒）
+        """
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+        with self._space:
+            self._space.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        logger.info("Durable mail pipeline stopped")
+
+    @staticmethod
+    def _job_key(uid: Any, account: Optional[str]) -> str:
+        """任务键：账户/UID"""
+        return f"{account or ''}/{uid}"
+
+    def is_in_flight(self, uid: Any, account: Optional[str] = None) -> bool:
+        """判断邮件是否已在队列中（包括死信，避免每次轮询都重新获取）"""
+        return self.jobs.contains(self._job_key(uid, account))
+
+    def submit(self, email_info: EmailRecord) -> bool:
+        """
+        将邮件写入 LLM 阶段的队列，该账户排队的任务已满时阻塞等待
+
+        Args:
+            email_info: 解析后的邮件记录
+
+        Returns:
+            新入队返回True，队列中已有该邮件或流水线已停止返回False
+        """
+        key = self._job_key(email_info.uid, email_info.account)
+        account = email_info.account or ""
+        if self.jobs.contains(key):
+            return False
+        with self._space:
+            while self.jobs.pending(LLM_STAGE, account) >= self.queue_size:
+                if self._stop_event.is_set():
+                    return False
+                self._space.wait(_PUT_RETRY_INTERVAL)
+        if self._stop_event.is_set():
+            return False
+        added = self.jobs.enqueue(LLM_STAGE, key, email_info.to_dict(), account=account)
+        if added:
+            with self._cond:
+                self._cond.notify()
+        return added
+
+    def join(self) -> None:
+        """等待队列中除死信外的所有任务处理完成"""
+        while True:
+            counts = self.jobs.counts()
+            if not counts[READY] and not counts[LEASED]:
+                return
+            time.sleep(0.05)
+
+    def _lease(self) -> Optional[Job]:
+        """优先取发送阶段的任务，尽快完成已生成的回复"""
+        return self.jobs.lease(SEND_STAGE) or self.jobs.lease(LLM_STAGE)
+
+    def _worker(self) -> None:
+        """工作线程主循环"""
+        while not self._stop_event.is_set():
+            try:
+                job = self._lease()
+            except Exception as e:
+                logger.error(f"Error leasing job: {e}")
+                job = None
+            if job is None:
+                with self._cond:
+                    self._cond.wait(self.poll_interval)
+                continue
+            if job.queue == LLM_STAGE:
+                with self._space:
+                    self._space.notify_all()
+            self._run(job)
+
+    def _run(self, job: Job) -> None:
+        """执行一个任务，失败时按指数退避重试"""
+        email_info = EmailRecord.from_dict(job.payload)
+        try:
+            if job.queue == LLM_STAGE:
+                reply = self.prepare(email_info)
+                if reply is None:
+                    self.jobs.complete(job)
+                    return
+                self.jobs.complete(job, SEND_STAGE, reply.to_dict())
+                with self._cond:
+                    self._cond.notify()
+            else:
+                if not self.deliver(email_info):
+                    raise RuntimeError("send failed")
+                self.jobs.complete(job)
+        except Exception as e:
+            delay = self.retry_delay * 2 ** (job.attempts - 1)
+            if self.jobs.fail(job, str(e), delay):
+                metrics.inc(EMAILS_FAILED)
+                logger.error(
+                    f"Job {job.queue}/{job.key} failed {job.attempts} times, "
+                    f"moved to dead letters: {e}"
+                )
+            else:
+                metrics.inc(RETRIES, reason="job")
+                logger.warning(
+                    f"Job {job.queue}/{job.key} failed (attempt {job.attempts}), "
+                    f"retrying in {delay:.0f}s: {e}"
+                )
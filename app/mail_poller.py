@@ -1,46 +1,68 @@
 import threading
-from typing import Callable, Any
+from typing import Any, Callable, Optional
 from loguru import logger
 
 from app.config import config
+from app.email_record import EmailRecord
+from app.log_policy import log_sampler
 from .mail_fetcher import MailFetcher
+from .mail_pipeline import Pipeline
 
 
 class MailPoller:
     """邮件轮询器，负责定期检查和获取新邮件"""
 
-    def __init__(self, fetcher: MailFetcher):
+    def __init__(
+        self,
+        fetcher: MailFetcher,
+        pipeline: Optional[Pipeline] = None,
+        account: Optional[str] = None,
+    ):
         """初始化邮件轮询器
 
         Args:
             fetcher: 邮件获取器实例
+            pipeline: 邮件处理流水线，用于跳过仍在处理中的邮件
+            account: 多账户模式下的账户名称，会写入邮件记录的 account 字段
         """
         self.fetcher = fetcher
+        self.pipeline = pipeline
+        self.account = account
         self.is_polling = False
         self.check_interval = config.CHECK_INTERVAL
+        self.idle_timeout = config.IDLE_TIMEOUT
         self._stop_event = threading.Event()
 
-    def start_polling(self, callback: Callable[[dict], Any]) -> None:
+    def start_polling(self, callback: Callable[[EmailRecord], Any]) -> None:
         """
         开始轮询邮件
 
         Args:
-            callback: 处理新邮件的回调函数，接收邮件信息字典作为参数
+            callback: 处理新邮件的回调函数，接收邮件记录作为参数
         """
         self.is_polling = True
         self._stop_event.clear()
         logger.info("Starting mail polling...")
 
+        use_idle = config.IMAP_IDLE and self.fetcher.supports_idle()
+        if use_idle:
+            logger.info("IMAP IDLE supported, waiting for push notifications")
+        elif config.IMAP_IDLE:
+            logger.warning("IMAP server does not support IDLE, falling back to polling")
+
         try:
             while self.is_polling and not self._stop_event.is_set():
                 self._check_new_emails(callback)
-                # 等待下次检查或收到停止信号
-                if self.is_polling and not self._stop_event.wait(self.check_interval):
+                # 等待新邮件推送，或等待下次检查，直到收到停止信号
+                if use_idle:
+                    self._wait_idle()
+                elif self.is_polling and not self._stop_event.wait(self.check_interval):
                     continue
         except Exception as e:
             logger.error(f"Error during mail polling: {e}")
         finally:
             self.fetcher.disconnect()
+            logger.info(f"IMAP session stats: {self.fetcher.stats}")
 
     def stop_polling(self) -> None:
         """停止轮询"""
@@ -48,7 +70,21 @@ class MailPoller:
         self.is_polling = False
         self._stop_event.set()
 
-    def _check_new_emails(self, callback: Callable[[dict], Any]) -> None:
+    def _wait_idle(self) -> None:
+        """通过 IMAP IDLE 等待新邮件，超时前重新发起 IDLE"""
+        while self.is_polling and not self._stop_event.is_set():
+            try:
+                if self.fetcher.wait_for_new_mail(self.idle_timeout, self._stop_event):
+                    logger.info("IDLE woke up, checking mailbox")
+                    return
+            except Exception as e:
+                logger.error(f"Error during IMAP IDLE: {e}")
+                self.fetcher.disconnect()
+                # 连接异常时等待一个检查间隔后重新检查邮件
+                self._stop_event.wait(self.check_interval)
+                return
+
+    def _check_new_emails(self, callback: Callable[[EmailRecord], Any]) -> None:
         """
         检查新邮件并处理
 
@@ -56,24 +92,36 @@ class MailPoller:
             callback: 处理新邮件的回调函数
         """
         try:
-            # 搜索未读邮件
-            uids = self.fetcher.search_unseen_emails()
-            logger.info(f"Found {len(uids)} unread emails")
+            # 搜索新邮件（启用台账时为高水位之后的邮件和未完成的邮件，否则为未读邮件）
+            uids = self.fetcher.search_new_emails()
+            # 没有新邮件的轮询心跳按采样记录
+            if uids or log_sampler.allow("poll"):
+                logger.info(f"Found {len(uids)} new emails")
+
+            # 跳过已在流水线中排队或处理的邮件，避免重复获取
+            if self.pipeline is not None:
+                uids = [
+                    uid
+                    for uid in uids
+                    if not self.pipeline.is_in_flight(uid, self.account)
+                ]
 
             if not uids:
                 return
 
-            # 批量获取邮件
-            raw_emails = self.fetcher.fetch_emails_by_uids(list(uids))
-
-            # 处理每封邮件
-            for uid, raw_email in raw_emails.items():
+            # 分批获取邮件，每封邮件下载后立即提交处理
+            for uid, raw_email in self.fetcher.iter_emails_by_uids(list(uids)):
+                if self._stop_event.is_set():
+                    return
                 try:
                     logger.info(f"Processing new mail with UID: {uid}")
 
                     # 解析邮件内容
-                    email_info = self.fetcher.parse_raw_email(raw_email)
-                    email_info["uid"] = uid
+                    email_info = self.fetcher.parse_raw_email(
+                        raw_email, uid, self.account
+                    )
+                    if email_info is None:
+                        continue
 
                     # 调用回调函数处理邮件
                     callback(email_info)
@@ -83,6 +131,3 @@ class MailPoller:
 
         except Exception as e:
             logger.error(f"Error checking emails: {e}")
-        finally:
-            # 断开IMAP连接
-            self.fetcher.disconnect()
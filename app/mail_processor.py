@@ -4,14 +4,69 @@
 负责邮件的解析、LLM处理和格式化输出
 """
 
+import asyncio
+import functools
 import os
-import email
-from email.message import Message
-from typing import Any, Dict, Optional, Tuple
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 from loguru import logger
 from agents import Agent, Runner, set_tracing_disabled
 
+from app.attachment_text import attachment_limits
+from app.chat_chunker import REDUCE_HEADER, chunk_text, estimate_tokens, map_reduce
+from app.chat_preprocessor import preprocess_with_stats
 from app.config import config
+from app.email_record import EmailRecord
+from app.llm_runtime import BackgroundLoop, TimedModel, mark_call_start
+from app.log_policy import describe_payload, log_sampler
+from app.mail_parser import parse_email
+from app.metrics import RETRIES, metrics
+from app.model_router import ModelRouter
+from app.rate_limiter import RateLimiter, backoff_delay, is_rate_limit_error
+from app.response_cache import ResponseCache, cache_key
+from app.tracing import tracer
+
+
+# 关闭时等待模型客户端关闭的最长时间（秒）
+_CLOSE_TIMEOUT = 5
+
+# 超过截止时间时附加在部分结果之后的说明
+PARTIAL_NOTE = "\n\n——\n注意：LLM 未能在 {deadline:g} 秒内完成分析，以上为部分结果。"
+
+
+def _text_delta(event: Any) -> Optional[str]:
+    """从流式事件中取出模型输出的文本增量，其他事件返回None"""
+    if getattr(event, "type", None) != "raw_response_event":
+        return None
+    data = event.data
+    if getattr(data, "type", None) != "response.output_text.delta":
+        return None
+    return data.delta
+
+
+def _partial_output(streams: List[Tuple[bool, List[str]]]) -> str:
+    """
+    从流式调用已收到的文本中取出部分结果
+
+    合并阶段已有输出时使用合并结果，否则按顺序拼接各块已有的分析。
+
+    Args:
+        streams: 每次调用的 (是否为合并调用, 文本增量)
+
+    Returns:
+        部分结果，没有任何输出时为空字符串
+    """
+    reduced = ["".join(deltas) for is_reduce, deltas in streams if is_reduce]
+    if reduced and reduced[-1].strip():
+        return reduced[-1].strip()
+    mapped = ["".join(deltas).strip() for is_reduce, deltas in streams if not is_reduce]
+    return "\n\n".join(text for text in mapped if text)
+
+
+def _text_bytes(text: Optional[str]) -> int:
+    """文本的 UTF-8 字节数，None 为 0"""
+    return len(text.encode("utf-8")) if text else 0
 
 
 def _get_model():
@@ -26,9 +81,36 @@ class MailProcessor:
         """初始化邮件处理器"""
         self.config = config
         set_tracing_disabled(True)
+        self.cache: Optional[ResponseCache] = None
+        if config.RESPONSE_CACHE:
+            self.cache = ResponseCache(
+                config.RESPONSE_CACHE_PATH,
+                ttl=config.RESPONSE_CACHE_TTL,
+                max_entries=config.RESPONSE_CACHE_MAX_ENTRIES,
+            )
+        # 预处理前后的累计token估算，用于衡量压缩效果
+        self.stats = {"emails": 0, "tokens_in": 0, "tokens_out": 0}
+        self._stats_lock = threading.Lock()
+        # 流式调用的首个token耗时
+        self.ttft = {"streams": 0, "total_seconds": 0.0, "last_seconds": 0.0}
+
+        # 模型和Agent只创建一次，所有邮件共用
+        self.prompt = config.LLM_PROMPT
+        self.router: Optional[ModelRouter] = None
+        self.model_name, self.model = self._build_model()
+        self.agent = Agent(name="Assistant", model=self.model, instructions=self.prompt)
+        # 同步调用共用的常驻事件循环，HTTP连接在多次调用之间保持；
+        # 首次同步调用时才创建，asyncio 引擎在自己的事件循环中调用，不需要
+        self._loop: Optional[BackgroundLoop] = None
+        self._loop_lock = threading.Lock()
+        # 按RPM/TPM限流，遇到429时退避重试
+        self.limiter = RateLimiter(rpm=config.LLM_RPM, tpm=config.LLM_TPM)
+        self.rate_limit_retries = config.LLM_RATE_LIMIT_RETRIES
+        self.backoff_base = config.LLM_BACKOFF_BASE
+        self.backoff_max = config.LLM_BACKOFF_MAX
         logger.info("MailProcessor initialized")
 
-    def parse_raw_email(self, raw_email: bytes) -> Optional[Dict[str, Any]]:
+    def parse_raw_email(self, raw_email: bytes) -> Optional[EmailRecord]:
         """
         解析原始邮件数据
 
@@ -36,51 +118,26 @@ class MailProcessor:
             raw_email: 原始邮件数据
 
         Returns:
-            包含邮件信息的字典，如果解析失败则返回None
+            邮件记录，如果解析失败则返回None
         """
         try:
-            # 将原始邮件数据解析为email.message.Message对象
-            email_message = email.message_from_bytes(raw_email)
-
-            # 提取基本信息
-            subject = self._decode_header(email_message.get("Subject", ""))
-            sender = self._decode_header(email_message.get("From", ""))
-            receiver = self._decode_header(email_message.get("To", ""))
-            date = email_message.get("Date", "")
-
-            # 解析邮件正文
-            body_text, body_html = self._extract_body(email_message)
-
-            # 解析附件信息
-            attachments = self._extract_attachments(email_message)
-
-            # 构建邮件信息字典，不再包含HTML内容
-            email_info = {
-                "subject": subject,
-                "sender": sender,
-                "receiver": receiver,
-                "date": date,
-                "body_text": body_text,
-                "body_html": body_html,  # 保持字段但始终为空
-                "attachments": attachments,
-            }
-
-            logger.info(f"Successfully parsed email: {subject}")
+            email_info = parse_email(raw_email, attachment_limits=attachment_limits())
+            if log_sampler.allow("parse"):
+                logger.info(f"Successfully parsed email: {email_info.subject}")
             return email_info
-
         except Exception as e:
             logger.error(f"Error parsing raw email: {e}")
             return None
 
-    def process(self, email_info: Dict[str, Any]) -> Dict[str, Any]:
+    def process(self, email_info: EmailRecord) -> EmailRecord:
         """
         处理邮件内容（包括LLM处理）
 
         Args:
-            email_info: 解析后的邮件信息
+            email_info: 解析后的邮件记录
 
         Returns:
-            处理后的邮件信息
+            处理后的邮件记录副本，原记录保持不变
         """
         # 调用LLM处理逻辑
         processed_result = self.process_with_llm(email_info)
@@ -88,150 +145,411 @@ class MailProcessor:
         # 如果LLM处理成功，替换邮件正文
         if processed_result is not None:
             # 使用LLM处理结果替换原始正文
-            email_info["body_text"] = processed_result
-
-        print(email_info)
+            email_info = email_info.with_body(processed_result)
 
         # 返回处理后的邮件信息
         return email_info
 
-    def process_with_llm(self, email_info: Dict[str, Any]) -> Optional[str]:
+    async def process_async(self, email_info: EmailRecord) -> EmailRecord:
+        """
+        处理邮件内容的异步版本，在调用方的事件循环中执行LLM调用
+
+        Args:
+            email_info: 解析后的邮件记录
+
+        Returns:
+            处理后的邮件记录副本，原记录保持不变
+        """
+        processed_result = await self.process_with_llm_async(email_info)
+
+        if processed_result is not None:
+            email_info = email_info.with_body(processed_result)
+
+        return email_info
+
+    def process_with_llm(self, email_info: EmailRecord) -> Optional[str]:
         """
         使用LLM处理邮件内容（具体实现由用户完成）
 
         Args:
-            email_info: 解析后的邮件信息
+            email_info: 解析后的邮件记录
 
         Returns:
             经过LLM处理后的结果，如果处理失败则返回None
         """
-        body_text = email_info["body_text"]
-
-        logger.info(f"body_text: {body_text}")
+        body_text = email_info.body_text
 
-        model = _get_model()
-        agent = Agent(
-            name="Assistant", model=model, instructions=os.environ.get("LLM_PROMPT", "")
+        # 只在有输出目标接受该级别时才计算摘要
+        logger.opt(lazy=True).info(
+            "LLM input for UID {}: {}",
+            lambda: email_info.uid,
+            lambda: describe_payload(body_text),
         )
-        result = Runner.run_sync(agent, body_text)
-        final_output = result.final_output
 
-        logger.info(f"final_output: {final_output}")
+        with tracer.span(
+            "llm",
+            email_info.trace_id,
+            uid=email_info.uid,
+            input_bytes=len(body_text.encode("utf-8")),
+        ) as span:
+            body_text = self._preprocess(body_text)
+
+            key, cached = self._lookup_cache(body_text)
+            if cached is not None:
+                span.set(cached=True, output_bytes=len(cached.encode("utf-8")))
+                return cached
+
+            # 在常驻事件循环中执行（当前 span 随上下文传入，模型调用记录为子 span）
+            final_output, complete = self._background_loop().run(
+                self._analyze(body_text)
+            )
+            span.set(complete=complete, output_bytes=_text_bytes(final_output))
+
+        logger.opt(lazy=True).info(
+            "LLM output for UID {}: {}",
+            lambda: email_info.uid,
+            lambda: describe_payload(final_output),
+        )
 
+        # 超时的部分结果不写入缓存
+        if complete:
+            self._store_cache(key, final_output)
         return final_output
 
-    def _decode_header(self, header: str) -> str:
+    async def process_with_llm_async(self, email_info: EmailRecord) -> Optional[str]:
         """
-        解码邮件头部信息
+        使用LLM处理邮件内容的异步版本（Runner.run，不为每次调用新建事件循环）
 
         Args:
-            header: 编码的头部字符串
+            email_info: 解析后的邮件记录
 
         Returns:
-            解码后的字符串
+            经过LLM处理后的结果，如果处理失败则返回None
         """
-        from email.header import decode_header
+        body_text = email_info.body_text
 
-        if not header:
-            return ""
+        # 只在有输出目标接受该级别时才计算摘要
+        logger.opt(lazy=True).info(
+            "LLM input for UID {}: {}",
+            lambda: email_info.uid,
+            lambda: describe_payload(body_text),
+        )
 
-        try:
-            decoded_parts = decode_header(header)
-            decoded_string = ""
-            for part, encoding in decoded_parts:
-                if isinstance(part, bytes):
-                    if encoding:
-                        decoded_string += part.decode(encoding, errors="ignore")
-                    else:
-                        decoded_string += part.decode("utf-8", errors="ignore")
-                else:
-                    decoded_string += part
-            return decoded_string
-        except Exception as e:
-            logger.warning(f"Error decoding header '{header}': {e}")
-            return header
+        with tracer.span(
+            "llm",
+            email_info.trace_id,
+            uid=email_info.uid,
+            input_bytes=len(body_text.encode("utf-8")),
+        ) as span:
+            body_text = self._preprocess(body_text)
+
+            key, cached = self._lookup_cache(body_text)
+            if cached is not None:
+                span.set(cached=True, output_bytes=len(cached.encode("utf-8")))
+                return cached
+
+            final_output, complete = await self._analyze(body_text)
+            span.set(complete=complete, output_bytes=_text_bytes(final_output))
+
+        logger.opt(lazy=True).info(
+            "LLM output for UID {}: {}",
+            lambda: email_info.uid,
+            lambda: describe_payload(final_output),
+        )
+
+        if complete:
+            self._store_cache(key, final_output)
+        return final_output
 
-    def _extract_body(self, email_message: Message) -> Tuple[str, str]:
+    def _build_model(self) -> Tuple[Optional[str], TimedModel]:
+        """
+        根据配置创建模型：LLM_MODELS 配置多个模型时使用多模型路由器
+
+        Returns:
+            (用于缓存键的模型名称, 带计时的模型)
+        """
+        names = self.config.LLM_MODELS or [_get_model()]
+        if len(names) == 1:
+            return names[0], TimedModel(names[0])
+        self.router = ModelRouter(
+            names,
+            latency_budget=self.config.LLM_LATENCY_BUDGET,
+            failure_threshold=self.config.LLM_BREAKER_FAILURES,
+            cooldown=self.config.LLM_BREAKER_COOLDOWN,
+        )
+        logger.info(f"LLM model routing enabled: {', '.join(names)}")
+        model_name = ",".join(names)
+        return model_name, TimedModel(model_name, model=self.router)
+
+    def _background_loop(self) -> BackgroundLoop:
+        """返回同步调用共用的常驻事件循环，首次使用时创建"""
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = BackgroundLoop()
+            return self._loop
+
+    def _preprocess(self, body_text: str) -> str:
         """
-        提取邮件正文内容
+        压缩聊天记录（去掉引用、签名、系统消息等），并记录前后的token数
 
         Args:
-            email_message: email.message.Message对象
+            body_text: 邮件正文
 
         Returns:
-            (纯文本正文, HTML正文)的元组，其中HTML正文始终为空字符串
+            发送给LLM的文本，未启用预处理时原样返回
+        """
+        if not self.config.CHAT_PREPROCESS:
+            return body_text
+        result = preprocess_with_stats(body_text)
+        # 多个工作线程同时预处理邮件
+        with self._stats_lock:
+            self.stats["emails"] += 1
+            self.stats["tokens_in"] += result.tokens_in
+            self.stats["tokens_out"] += result.tokens_out
+        logger.info(
+            f"Preprocessed chat log: {result.tokens_in} -> {result.tokens_out} tokens "
+            f"({result.saved_ratio:.0%} saved)"
+        )
+        return result.text
+
+    def _chunk(self, body_text: str) -> List[str]:
+        """按配置的块大小切分聊天记录"""
+        chunks = chunk_text(body_text, self.config.LLM_CHUNK_TOKENS)
+        if len(chunks) > 1:
+            logger.info(
+                f"Chat log split into {len(chunks)} chunks of up to {self.config.LLM_CHUNK_TOKENS} tokens"
+            )
+        return chunks
+
+    async def _run_agent(self, text: str) -> str:
+        """对一段输入调用一次LLM"""
+        mark_call_start()
+        result = await Runner.run(self.agent, text)
+        return result.final_output
+
+    async def _run_agent_streamed(
+        self, text: str, streams: List[Tuple[bool, List[str]]]
+    ) -> str:
         """
-        body_text = ""
-        body_html = ""  # 不再处理HTML内容
+        流式调用一次LLM，收到的文本增量随时写入streams，超时后可取出部分结果
+
+        Args:
+            text: 输入文本
+            streams: 本封邮件各次调用的文本增量，调用开始时追加一项
 
+        Returns:
+            完整的输出
+        """
+        deltas: List[str] = []
+        streams.append((text.startswith(REDUCE_HEADER), deltas))
+        mark_call_start()
+        start = time.perf_counter()
+        result = Runner.run_streamed(self.agent, text)
         try:
-            if email_message.is_multipart():
-                # 处理多部分邮件
-                for part in email_message.walk():
-                    content_type = part.get_content_type()
-                    content_disposition = str(part.get("Content-Disposition", ""))
-
-                    # 跳过附件
-                    if "attachment" in content_disposition:
-                        continue
-
-                    # 只处理纯文本内容，忽略HTML
-                    if content_type == "text/plain":
-                        charset = part.get_content_charset() or "utf-8"
-                        try:
-                            payload = part.get_payload(decode=True)
-                            if isinstance(payload, bytes):
-                                body_text += payload.decode(charset, errors="ignore")
-                        except Exception as e:
-                            logger.warning(f"Error decoding plain text part: {e}")
-            else:
-                # 处理单部分邮件
-                content_type = email_message.get_content_type()
-                charset = email_message.get_content_charset() or "utf-8"
-
-                # 只处理纯文本内容，忽略HTML
-                if content_type == "text/plain":
-                    try:
-                        payload = email_message.get_payload(decode=True)
-                        if isinstance(payload, bytes):
-                            body_text = payload.decode(charset, errors="ignore")
-                    except Exception as e:
-                        logger.warning(f"Error decoding plain text: {e}")
+            async for event in result.stream_events():
+                delta = _text_delta(event)
+                if not delta:
+                    continue
+                if not deltas:
+                    self._record_ttft(time.perf_counter() - start)
+                deltas.append(delta)
+        except BaseException:
+            # 超时取消时停止后台的流式运行
+            result.cancel()
+            raise
+        return result.final_output
+
+    async def _run_admitted(
+        self,
+        call: Callable[[str], Awaitable[str]],
+        text: str,
+        priority: int,
+        on_admitted: Optional[Callable[[], None]] = None,
+    ) -> str:
+        """
+        经限流器放行后调用LLM，遇到限流错误（429）时退避后重试
 
-        except Exception as e:
-            logger.error(f"Error extracting email body: {e}")
+        Args:
+            call: 单次LLM调用
+            text: 输入文本
+            priority: 限流排队的优先级
+            on_admitted: 每次被限流器放行后调用
 
-        return body_text, body_html
+        Returns:
+            LLM输出
+        """
+        tokens = estimate_tokens(text) + estimate_tokens(self.prompt)
+
+        attempt = 0
+        while True:
+            await self.limiter.acquire(tokens, priority)
+            if on_admitted is not None:
+                on_admitted()
+            try:
+                return await call(text)
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt >= self.rate_limit_retries:
+                    raise
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_max)
+                attempt += 1
+                logger.warning(
+                    f"LLM rate limited, retry {attempt}/{self.rate_limit_retries} "
+                    f"in {delay:.1f}s: {e}"
+                )
+                metrics.inc(RETRIES, reason="llm_rate_limit")
+                # 暂停所有调用的放行，避免其他请求继续触发限流
+                self.limiter.pause(delay)
+
+    def _record_ttft(self, seconds: float) -> None:
+        """记录首个token的耗时"""
+        self.ttft["streams"] += 1
+        self.ttft["total_seconds"] += seconds
+        self.ttft["last_seconds"] = seconds
+        if log_sampler.allow("ttft"):
+            logger.info(f"LLM time to first token: {seconds:.2f}s")
+
+    async def _analyze(self, body_text: str) -> Tuple[str, bool]:
+        """
+        分析聊天记录，超过截止时间时返回已生成的部分结果并附加说明
+
+        Args:
+            body_text: 预处理后的聊天记录
 
-    def _extract_attachments(self, email_message: Message) -> list:
+        Returns:
+            (结果, 是否完整)
+
+        Raises:
+            TimeoutError: 超过截止时间且没有任何输出（如非流式调用），由调用方稍后重试，
+                而不是转发未经分析的原始正文
+        """
+        chunks = self._chunk(body_text)
+        streams: List[Tuple[bool, List[str]]] = []
+        call: Callable[..., Awaitable[str]]
+        if self.config.LLM_STREAMING:
+            call = functools.partial(self._run_agent_streamed, streams=streams)
+        else:
+            call = self._run_agent
+
+        deadline = self.config.LLM_DEADLINE
+        try:
+            async with asyncio.timeout(None) as timeout:
+
+                def start_deadline() -> None:
+                    # 限流排队的等待不计入截止时间，从第一次调用被放行时开始计时
+                    if deadline > 0 and timeout.when() is None:
+                        loop = asyncio.get_running_loop()
+                        timeout.reschedule(loop.time() + deadline)
+
+                run = functools.partial(
+                    self._run_admitted, call, on_admitted=start_deadline
+                )
+                output = await self._map_reduce(chunks, run)
+            return output, True
+        except asyncio.TimeoutError:
+            partial = _partial_output(streams)
+            if not partial:
+                raise TimeoutError(
+                    f"LLM analysis exceeded the {deadline:g}s deadline without output"
+                ) from None
+            logger.warning(
+                f"LLM analysis exceeded the {deadline:g}s deadline, sending partial result"
+            )
+            return partial + PARTIAL_NOTE.format(deadline=deadline), False
+
+    async def _map_reduce(
+        self, chunks: List[str], run: Callable[[str, int], Awaitable[str]]
+    ) -> str:
         """
-        提取附件信息
+        并发分析各块并合并结果，只有一块时直接调用一次LLM
 
         Args:
-            email_message: email.message.Message对象
+            chunks: 切分后的聊天记录
+            run: 单次LLM调用
 
         Returns:
-            附件信息列表
+            LLM处理结果
         """
-        attachments = []
+        return await map_reduce(
+            chunks,
+            run,
+            max_tokens=self.config.LLM_CHUNK_TOKENS,
+            concurrency=self.config.LLM_MAP_CONCURRENCY,
+        )
 
-        try:
-            if email_message.is_multipart():
-                for part in email_message.walk():
-                    content_disposition = str(part.get("Content-Disposition", ""))
-
-                    # 检查是否为附件
-                    if "attachment" in content_disposition:
-                        filename = part.get_filename()
-                        if filename:
-                            attachments.append(
-                                {
-                                    "filename": self._decode_header(filename),
-                                    "content_type": part.get_content_type(),
-                                }
-                            )
+    def _lookup_cache(self, body_text: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        查询响应缓存
+
+        Args:
+            body_text: 邮件正文
 
+        Returns:
+            (缓存键, 缓存的结果)，未启用缓存或未命中时结果为None
+        """
+        if self.cache is None:
+            return None, None
+        try:
+            key = cache_key(body_text, self.prompt, self.model_name)
+            cached = self.cache.get(key)
+        except Exception as e:
+            logger.warning(f"Error reading response cache: {e}")
+            return None, None
+        if cached is not None:
+            logger.info(f"Response cache hit, stats: {self.cache.stats()}")
+        return key, cached
+
+    def _store_cache(self, key: Optional[str], final_output: Any) -> None:
+        """将LLM结果写入响应缓存"""
+        if self.cache is None or key is None or not isinstance(final_output, str):
+            return
+        if not final_output:
+            return
+        try:
+            self.cache.set(key, final_output)
         except Exception as e:
-            logger.error(f"Error extracting attachments: {e}")
+            logger.warning(f"Error writing response cache: {e}")
 
-        return attachments
+    def llm_stats(self) -> Dict[str, Any]:
+        """
+        LLM调用耗时统计
+
+        Returns:
+            调用次数、错误数、调用开始到发出模型请求的平均准备耗时、平均响应耗时
+            及流式调用的首个token耗时（秒）、限流统计；多模型路由时还包括各模型的延迟分位数和错误率
+        """
+        summary: Dict[str, Any] = dict(self.model.summary())
+        streams = self.ttft["streams"]
+        summary["avg_ttft_seconds"] = (
+            self.ttft["total_seconds"] / streams if streams else 0.0
+        )
+        summary["last_ttft_seconds"] = self.ttft["last_seconds"]
+        summary["rate_limiter"] = dict(self.limiter.stats)
+        if self.router is not None:
+            summary["models"] = self.router.stats()
+        return summary
+
+    def close(self) -> None:
+        """关闭模型（含多模型路由的各后端）的客户端，停止常驻事件循环并关闭响应缓存"""
+        with self._loop_lock:
+            loop = self._loop
+        # 模型客户端绑定在调用它的事件循环上，只在常驻事件循环中关闭
+        if loop is not None and not loop.closed:
+            try:
+                loop.run(self.model.close(), timeout=_CLOSE_TIMEOUT)
+            except Exception as e:
+                logger.warning(f"Error closing model clients: {e}")
+            loop.close()
+        if self.cache is not None:
+            self.cache.close()
+
+    async def aclose(self) -> None:
+        """
+        close 的异步版本，供 asyncio 引擎使用：模型在调用方的事件循环中运行，
+        因此在当前事件循环中关闭模型客户端
+        """
+        try:
+            await asyncio.wait_for(self.model.close(), timeout=_CLOSE_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"Error closing model clients: {e}")
+        if self.cache is not None:
+            await asyncio.to_thread(self.cache.close)
@@ -1,191 +1,186 @@
 import smtplib
-import ssl
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from typing import Any, Dict, Union
+from typing import List, Optional
 
 from loguru import logger
 
+from app.accounts import AccountConfig
 from app.config import config
+from app.email_record import EmailRecord
+from app.log_policy import log_sampler
+from app.metrics import RETRIES, STAGE_SMTP_SEND, metrics
+from app.smtp_pool import SMTPConnection, SMTPConnectionPool
+
+# 机器人发出的邮件主题前缀，用于识别并跳过自己发出的邮件，避免循环处理
+REPLY_SUBJECT_PREFIX = "[EmailLLM]"
 
 
 class MailSender:
-    """邮件发送器"""
+    """邮件发送器，通过连接池复用已认证的 SMTP 会话"""
 
-    def __init__(self):
-        """初始化邮件发送器"""
-        self.smtp_server = config.SMTP_SERVER
-        self.smtp_port = config.SMTP_PORT
-        self.sender_email = config.SOURCE_EMAIL
-        self.sender_password = config.SMTP_PASSWORD or config.SOURCE_PASSWORD
+    def __init__(
+        self,
+        account: Optional[AccountConfig] = None,
+        pool: Optional[SMTPConnectionPool] = None,
+    ):
+        """
+        初始化邮件发送器
 
-    def send_email(self, email_info: Dict[str, Any]) -> bool:
+        Args:
+            account: 邮箱账户配置，默认使用环境变量中的单账户配置
+            pool: 共享的SMTP连接池，默认按账户配置新建
         """
-        发送邮件
+        account = account or AccountConfig.from_config()
+        self.smtp_server = account.smtp_server
+        self.smtp_port = account.smtp_port
+        self.sender_email = account.source_email
+        self.sender_password = account.sender_password
+        self.target_email = account.target_email
+        self.pool = pool or SMTPConnectionPool(
+            self.smtp_server,
+            self.smtp_port,
+            self.sender_email,
+            self.sender_password,
+            max_size=config.SMTP_POOL_SIZE,
+            idle_timeout=config.SMTP_POOL_IDLE_TIMEOUT,
+        )
+
+    def _build_message(self, email_info: EmailRecord) -> MIMEMultipart:
+        """
+        构建待发送的邮件对象
 
         Args:
-            email_info: 包含邮件信息的字典
+            email_info: 处理后的邮件记录
 
         Returns:
-            发送成功返回True，否则返回False
+            邮件对象
         """
-        server: Union[smtplib.SMTP, smtplib.SMTP_SSL, None] = None
-        try:
-            # 创建邮件对象
-            message = MIMEMultipart()
+        message = MIMEMultipart()
 
-            # 设置邮件头
-            # 在主题前添加转发标识
-            original_subject = email_info.get("subject", "")
-            forwarded_subject = f"[EmailLLM] {original_subject}"
-            message["Subject"] = forwarded_subject
+        # 设置邮件头
+        # 在主题前添加转发标识
+        original_subject = email_info.subject
+        forwarded_subject = f"{REPLY_SUBJECT_PREFIX} {original_subject}"
+        message["Subject"] = forwarded_subject
 
-            # 设置发件人和收件人
-            message["From"] = self.sender_email
-            message["To"] = config.TARGET_EMAIL
+        # 设置发件人和收件人
+        message["From"] = self.sender_email
+        message["To"] = self.target_email
 
-            # 添加邮件正文，只使用纯文本内容
-            body_text = email_info.get("body_text", "")
-            # 忽略HTML内容
+        # 添加邮件正文，只使用纯文本内容
+        body_text = email_info.body_text
+        text_part = MIMEText(body_text, "plain")
+        message.attach(text_part)
 
-            # 只使用纯文本内容
-            text_part = MIMEText(body_text, "plain")
-            message.attach(text_part)
+        # TODO: 处理附件（如果需要）
+        # attachments = email_info.attachments
+        # for attachment in attachments:
+        #     # 这里需要实现附件的处理逻辑
+        #     pass
 
-            # TODO: 处理附件（如果需要）
-            # attachments = email_info.get('attachments', [])
-            # for attachment in attachments:
-            #     # 这里需要实现附件的处理逻辑
-            #     pass
+        return message
 
-            # 创建安全的SSL上下文
-            context = ssl.create_default_context()
+    def send_email(self, email_info: EmailRecord) -> bool:
+        """
+        发送邮件
 
-            # 连接到SMTP服务器并发送邮件
-            logger.info(
-                f"Connecting to SMTP server {self.smtp_server}:{self.smtp_port}"
-            )
+        Args:
+            email_info: 处理后的邮件记录
 
-            # 尝试连接SMTP服务器
-            try:
-                server = smtplib.SMTP_SSL(
-                    self.smtp_server, self.smtp_port, context=context
-                )
-                logger.info("SMTP SSL connection established")
-            except Exception as conn_err:
-                logger.error(f"Failed to establish SMTP SSL connection: {conn_err}")
-                # 尝试使用STARTTLS连接方式
-                try:
-                    logger.info("Trying STARTTLS connection...")
-                    server = smtplib.SMTP(
-                        self.smtp_server, 587
-                    )  # 通常STARTTLS使用587端口
-                    server.starttls(context=context)
-                    logger.info("STARTTLS connection established")
-                except Exception as starttls_err:
-                    logger.error(
-                        f"Failed to establish STARTTLS connection: {starttls_err}"
-                    )
-                    raise
-
-            # 尝试登录
-            try:
-                server.login(self.sender_email, self.sender_password)
-                logger.info("SMTP login successful")
-            except smtplib.SMTPAuthenticationError as auth_err:
-                logger.error(f"SMTP authentication failed: {auth_err}")
-                logger.error("Check your email address and password/authorization code")
-                if server:
-                    server.quit()
-                return False
-            except Exception as login_err:
-                logger.error(f"Error during SMTP login: {login_err}")
-                if server:
-                    server.quit()
-                return False
-
-            # 发送邮件
-            try:
-                server.send_message(message)
-                logger.info(f"Successfully forwarded email to {config.TARGET_EMAIL}")
-            except Exception as send_err:
-                logger.error(f"Error sending email: {send_err}")
-                if server:
-                    server.quit()
-                return False
-
-            if server:
-                server.quit()
-            return True
+        Returns:
+            发送成功返回True，否则返回False
+        """
+        return self.send_many([email_info])[0]
 
-        except Exception as e:
-            logger.error(f"Error sending email: {e}")
-            if server:
-                server.quit()
-            return False
+    def send_many(self, email_infos: List[EmailRecord]) -> List[bool]:
+        """
+        通过同一个已认证的 SMTP 会话批量发送邮件
+
+        连接在发送过程中断开时会重新获取连接并重试当前邮件一次。
+
+        Args:
+            email_infos: 邮件记录列表
+
+        Returns:
+            与输入顺序一致的发送结果列表
+        """
+        results: List[bool] = []
+        server: Optional[SMTPConnection] = None
+        try:
+            for email_info in email_infos:
+                try:
+                    message = self._build_message(email_info)
+                except Exception as e:
+                    logger.error(f"Error building email: {e}")
+                    results.append(False)
+                    continue
+
+                sent = False
+                with metrics.time(STAGE_SMTP_SEND):
+                    for attempt in range(2):
+                        try:
+                            if server is None:
+                                server = self.pool.acquire()
+                            server.send_message(message)
+                            sent = True
+                            if log_sampler.allow("smtp_send"):
+                                logger.info(
+                                    f"Successfully forwarded email to {self.target_email}"
+                                )
+                            break
+                        except smtplib.SMTPAuthenticationError as auth_err:
+                            logger.error(f"SMTP authentication failed: {auth_err}")
+                            logger.error(
+                                "Check your email address and password/authorization code"
+                            )
+                            break
+                        except smtplib.SMTPServerDisconnected as conn_err:
+                            # 连接已失效，丢弃后用新连接重试
+                            logger.warning(f"SMTP connection lost: {conn_err}")
+                            metrics.inc(RETRIES, reason="smtp_reconnect")
+                            if server is not None:
+                                self.pool.release(server, discard=True)
+                                server = None
+                        except smtplib.SMTPException as send_err:
+                            # 单封邮件被拒绝，连接仍然可用
+                            logger.error(f"Error sending email: {send_err}")
+                            break
+                        except OSError as conn_err:
+                            logger.warning(f"SMTP connection error: {conn_err}")
+                            metrics.inc(RETRIES, reason="smtp_reconnect")
+                            if server is not None:
+                                self.pool.release(server, discard=True)
+                                server = None
+                results.append(sent)
+        finally:
+            if server is not None:
+                self.pool.release(server)
+        return results
 
     def test_connection(self) -> bool:
         """
-        测试SMTP连接
+        测试SMTP连接，测试成功的连接会保留在连接池中供后续发送复用
 
         Returns:
             连接成功返回True，否则返回False
         """
-        server: Union[smtplib.SMTP, smtplib.SMTP_SSL, None] = None
         try:
-            # 创建安全的SSL上下文
-            context = ssl.create_default_context()
-
-            # 尝试连接SMTP服务器
-            try:
-                logger.info(
-                    f"Testing SMTP connection to {self.smtp_server}:{self.smtp_port}"
-                )
-                server = smtplib.SMTP_SSL(
-                    self.smtp_server, self.smtp_port, context=context
-                )
-                logger.info("SMTP SSL test connection established")
-            except Exception as conn_err:
-                logger.error(
-                    f"Failed to establish SMTP SSL test connection: {conn_err}"
-                )
-                # 尝试使用STARTTLS连接方式
-                try:
-                    logger.info("Trying STARTTLS test connection...")
-                    server = smtplib.SMTP(
-                        self.smtp_server, 587
-                    )  # 通常STARTTLS使用587端口
-                    server.starttls(context=context)
-                    logger.info("STARTTLS test connection established")
-                except Exception as starttls_err:
-                    logger.error(
-                        f"Failed to establish STARTTLS test connection: {starttls_err}"
-                    )
-                    return False
-
-            # 尝试登录
-            try:
-                server.login(self.sender_email, self.sender_password)
-                logger.info("SMTP test login successful")
-            except smtplib.SMTPAuthenticationError as auth_err:
-                logger.error(f"SMTP test authentication failed: {auth_err}")
-                logger.error("Check your email address and password/authorization code")
-                if server:
-                    server.quit()
-                return False
-            except Exception as login_err:
-                logger.error(f"Error during SMTP test login: {login_err}")
-                if server:
-                    server.quit()
-                return False
-
-            if server:
-                server.quit()
+            logger.info(
+                f"Testing SMTP connection to {self.smtp_server}:{self.smtp_port}"
+            )
+            with self.pool.connection():
+                pass
             logger.info("SMTP connection test successful")
             return True
-
+        except smtplib.SMTPAuthenticationError as auth_err:
+            logger.error(f"SMTP test authentication failed: {auth_err}")
+            logger.error("Check your email address and password/authorization code")
+            return False
         except Exception as e:
             logger.error(f"SMTP connection test failed: {e}")
-            if server:
-                server.quit()
             return False
+
+    def close(self) -> None:
+        """关闭连接池中的所有连接"""
+        self.pool.close_all()
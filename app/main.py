@@ -8,15 +8,24 @@ import signal
 import sys
 import os
 import threading
+from typing import Optional
 
 # 添加项目根目录到 Python 路径，确保能正确导入模块
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # 使用相对导入
+from .config import config
+from .email_record import EmailRecord
 from .mail_fetcher import MailFetcher
 from .mail_sender import MailSender
 from .mail_processor import MailProcessor
+from .mail_handler import deliver_reply, handle_email, prepare_reply
+from .job_queue import JobQueue
+from .metrics import MetricsServer, start_metrics_server
+from .tracing import start_tracing, tracer
+from .uid_ledger import UidLedger
 from .mail_poller import MailPoller
+from .mail_pipeline import DurablePipeline, MailPipeline, Pipeline
 from .utils.logger import default_logger as logger
 
 
@@ -26,10 +35,42 @@ class EmailForwarderBot:
     def __init__(self):
         """初始化邮件转发机器人"""
         # 初始化各组件
-        self.fetcher = MailFetcher()
+        # 台账记录每封邮件的处理状态，重启后只增量获取新邮件
+        self.ledger = (
+            UidLedger(
+                config.UID_LEDGER_PATH,
+                max_attempts=config.UID_LEDGER_MAX_ATTEMPTS,
+                retry_delay=config.UID_LEDGER_RETRY_DELAY,
+            )
+            if config.UID_LEDGER
+            else None
+        )
+        self.fetcher = MailFetcher(ledger=self.ledger)
         self.sender = MailSender()
         self.processor = MailProcessor()
-        self.poller = MailPoller(self.fetcher)
+        # LLM、发送与标记已读在工作线程池中并发执行；
+        # 启用持久化任务队列时各阶段之间经SQLite队列衔接，重启后继续处理
+        self.jobs: Optional[JobQueue] = None
+        self.metrics_server: Optional[MetricsServer] = None
+        self.pipeline: Pipeline
+        if config.JOB_QUEUE:
+            self.jobs = JobQueue(
+                config.JOB_QUEUE_PATH,
+                visibility_timeout=config.JOB_VISIBILITY_TIMEOUT,
+                max_attempts=config.JOB_MAX_ATTEMPTS,
+            )
+            self.pipeline = DurablePipeline(
+                self.jobs,
+                prepare=lambda email_info: prepare_reply(
+                    email_info, self.processor, self.fetcher
+                ),
+                deliver=lambda email_info: deliver_reply(
+                    email_info, self.sender, self.fetcher
+                ),
+            )
+        else:
+            self.pipeline = MailPipeline(self._handle_new_email)
+        self.poller = MailPoller(self.fetcher, self.pipeline)
 
         # 运行状态标志
         self.is_running = False
@@ -39,47 +80,14 @@ class EmailForwarderBot:
         signal.signal(signal.SIGINT, self._signal_handler)
         signal.signal(signal.SIGTERM, self._signal_handler)
 
-    def _handle_new_email(self, email_info: dict) -> None:
+    def _handle_new_email(self, email_info: EmailRecord) -> None:
         """
         处理新邮件的回调函数
 
         Args:
-            email_info: 邮件信息字典
+            email_info: 邮件记录
         """
-        try:
-            # 检查邮件主题是否以"[EmailLLM]"开头，如果是则跳过处理
-            subject = email_info.get("subject", "")
-            if subject.startswith("[EmailLLM]"):
-                logger.info(
-                    f"Skipping email with subject '{subject}' as it starts with '[EmailLLM]'"
-                )
-                return
-
-            # 使用MailProcessor处理邮件内容（包括LLM处理）
-            processed_email_info = self.processor.process(email_info)
-
-            # 发送邮件
-            success = self.sender.send_email(processed_email_info)
-            if success:
-                logger.info(
-                    f"Successfully forwarded email with UID: {email_info.get('uid', 'unknown')}"
-                )
-                # 邮件转发成功后，将原邮件标记为已读
-                uid = email_info.get('uid')
-                if uid:
-                    try:
-                        # 确保连接到IMAP服务器
-                        self.fetcher.connect()
-                        # 标记邮件为已读
-                        self.fetcher._mark_as_read(int(uid))
-                    except Exception as e:
-                        logger.error(f"Error marking email UID {uid} as read: {e}")
-            else:
-                logger.error(
-                    f"Failed to forward email with UID: {email_info.get('uid', 'unknown')}"
-                )
-        except Exception as e:
-            logger.error(f"Error handling email: {e}")
+        handle_email(email_info, self.processor, self.sender, self.fetcher)
 
     def _signal_handler(self, signum, frame):
         """
@@ -105,16 +113,23 @@ class EmailForwarderBot:
 
             self.is_running = True
             self._stop_event.clear()
+            self.metrics_server = start_metrics_server(
+                config.METRICS_HOST, config.METRICS_PORT
+            )
+            start_tracing(config.TRACING, config.TRACE_EXPORTER, config.TRACE_PATH)
 
             logger.info("Email Forwarder Bot started successfully!")
             logger.info("Press Ctrl+C to stop the bot")
 
-            # 开始轮询邮件
-            self.poller.start_polling(self._handle_new_email)
+            # 启动处理流水线并开始轮询邮件
+            self.pipeline.start()
+            self.poller.start_polling(self.pipeline.submit)
 
         except Exception as e:
             logger.error(f"Error starting Email Forwarder Bot: {e}")
             self.stop()
+        finally:
+            self._shutdown()
 
     def stop(self):
         """停止邮件转发机器人"""
@@ -122,14 +137,44 @@ class EmailForwarderBot:
         self.is_running = False
         self._stop_event.set()
 
-        # 停止邮件轮询
+        # 停止邮件轮询，流水线和连接池在轮询线程退出后关闭
         self.poller.stop_polling()
 
+    def _shutdown(self):
+        """轮询结束后释放资源：等待处理中的邮件完成并关闭IMAP/SMTP连接"""
+        self.pipeline.stop()
+        self.fetcher.disconnect()
+        self.sender.close()
+        self.processor.close()
+        if self.jobs is not None:
+            self.jobs.close()
+        if self.ledger is not None:
+            self.ledger.close()
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+        tracer.close()
         logger.info("Email Forwarder Bot stopped")
 
 
 def main():
     """主函数"""
+    if config.ACCOUNTS_FILE:
+        from .accounts import load_accounts
+        from .scheduler import MultiAccountScheduler
+
+        try:
+            MultiAccountScheduler(load_accounts(config.ACCOUNTS_FILE)).start()
+        except Exception as e:
+            print(f"Fatal error in main program: {e}")
+            sys.exit(1)
+        return
+
+    if config.ENGINE == "async":
+        from .async_main import main as async_main
+
+        async_main()
+        return
+
     try:
         # 创建机器人实例并启动
         bot = EmailForwarderBot()
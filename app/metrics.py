@@ -0,0 +1,295 @@
+"""
+运行指标模块
+进程内的指标注册表（计数器和延迟直方图），通过内置的 HTTP 服务以 Prometheus 文本格式
+在 /metrics 输出。未启用时所有埋点直接返回，不加锁也不计时，开销接近于零
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from loguru import logger
+
+# 各阶段延迟直方图的桶上限（秒），覆盖从毫秒级的解析到分钟级的LLM调用
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# 埋点的阶段名称
+STAGE_IMAP_SEARCH = "imap_search"
+STAGE_IMAP_FETCH = "imap_fetch"
+STAGE_PARSE = "parse"
+STAGE_LLM = "llm"
+STAGE_SMTP_SEND = "smtp_send"
+STAGE_MARK_READ = "mark_read"
+
+# 计数器名称
+EMAILS_PROCESSED = "emailllm_emails_processed_total"
+EMAILS_SKIPPED = "emailllm_emails_skipped_total"
+EMAILS_FAILED = "emailllm_emails_failed_total"
+RETRIES = "emailllm_retries_total"
+LLM_TOKENS = "emailllm_llm_tokens_total"
+STAGE_SECONDS = "emailllm_stage_duration_seconds"
+
+_HELP = {
+    EMAILS_PROCESSED: "Emails answered and marked as read",
+    EMAILS_SKIPPED: "Emails skipped by the [EmailLLM] loop guard",
+    EMAILS_FAILED: "Emails whose handling failed",
+    RETRIES: "Retried operations by reason",
+    LLM_TOKENS: "LLM tokens by direction (in/out)",
+    STAGE_SECONDS: "Latency of each pipeline stage",
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _format_labels(labels: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    """格式化标签，如 {stage="llm",le="0.5"}"""
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"'))
+        for k, v in items
+    )
+    return "{" + body + "}"
+
+
+def _format_value(value: float) -> str:
+    """整数值不带小数点输出"""
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Histogram:
+    """累积桶直方图，记录观测次数、总和及各桶的计数"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        """记录一次观测值"""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """
+        按 Prometheus 约定返回累积计数
+
+        Returns:
+            (le, 小于等于该上限的观测次数) 列表，最后一项为 +Inf
+        """
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((_format_value(bound), total))
+        result.append(("+Inf", self.count))
+        return result
+
+
+class Metrics:
+    """
+    进程内指标注册表
+
+    计数器和直方图按 (名称, 标签) 存储，首次使用时自动创建。
+    enabled 为 False 时 inc/observe/time 直接返回。
+    """
+
+    def __init__(
+        self, enabled: bool = False, buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        """
+        初始化注册表
+
+        Args:
+            enabled: 是否记录指标
+            buckets: 直方图的桶上限（秒）
+        """
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, amount: float = 1, **labels: str) -> None:
+        """
+        增加计数器
+
+        Args:
+            name: 计数器名称
+            amount: 增加量
+            labels: 标签
+        """
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, stage: str, seconds: float) -> None:
+        """
+        记录一次阶段耗时
+
+        Args:
+            stage: 阶段名称
+            seconds: 耗时（秒）
+        """
+        if not self.enabled:
+            return
+        key = (("stage", stage),)
+        with self._lock:
+            series = self._histograms.setdefault(STAGE_SECONDS, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def time(self, stage: str):
+        """
+        统计代码块耗时的上下文管理器，出现异常时同样记录
+
+        Args:
+            stage: 阶段名称
+        """
+        if not self.enabled:
+            return _NOOP
+        return self._timer(stage)
+
+    @contextmanager
+    def _timer(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def value(self, name: str, **labels: str) -> float:
+        """读取计数器的当前值（用于测试和汇总日志）"""
+        with self._lock:
+            return self._counters.get(name, {}).get(tuple(sorted(labels.items())), 0)
+
+    def histogram(self, stage: str) -> Optional[Histogram]:
+        """读取阶段耗时直方图"""
+        with self._lock:
+            return self._histograms.get(STAGE_SECONDS, {}).get((("stage", stage),))
+
+    def reset(self) -> None:
+        """清空所有指标"""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self) -> str:
+        """
+        以 Prometheus 文本格式（0.0.4）输出所有指标
+
+        Returns:
+            指标文本
+        """
+        lines: List[str] = []
+        with self._lock:
+            for name in sorted(self._counters):
+                lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in sorted(self._counters[name].items()):
+                    lines.append(
+                        f"{name}{_format_labels(labels)} {_format_value(value)}"
+                    )
+            for name in sorted(self._histograms):
+                lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, histogram in sorted(self._histograms[name].items()):
+                    for le, count in histogram.cumulative():
+                        lines.append(
+                            f"{name}_bucket{_format_labels(labels, ('le', le))} {count}"
+                        )
+                    lines.append(
+                        f"{name}_sum{_format_labels(labels)} "
+                        f"{_format_value(histogram.sum)}"
+                    )
+                    lines.append(
+                        f"{name}_count{_format_labels(labels)} {histogram.count}"
+                    )
+        return "\n".join(lines) + "\n"
+
+
+_NOOP = nullcontext()
+
+# 全局指标注册表，由 start_metrics_server 启用
+metrics = Metrics()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """只响应 GET /metrics"""
+
+    registry: Metrics = metrics
+
+    def do_GET(self) -> None:
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        """抓取请求不写访问日志"""
+
+
+class MetricsServer:
+    """在后台线程中运行的 /metrics HTTP 服务"""
+
+    def __init__(self, host: str, port: int, registry: Metrics = metrics):
+        """
+        启动 HTTP 服务并启用指标记录
+
+        Args:
+            host: 监听地址
+            port: 监听端口，0 表示由系统分配
+            registry: 输出的指标注册表
+        """
+        handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        registry.enabled = True
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="metrics-server", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"Metrics endpoint listening on http://{host}:{self.port}/metrics")
+
+    def close(self) -> None:
+        """停止 HTTP 服务"""
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+
+def start_metrics_server(host: str, port: int) -> Optional[MetricsServer]:
+    """
+    按配置启动指标服务
+
+    Args:
+        host: 监听地址
+        port: 监听端口，0 表示不启用
+
+    Returns:
+        指标服务，未启用或启动失败时返回None
+    """
+    if port <= 0:
+        return None
+    try:
+        return MetricsServer(host, port)
+    except OSError as e:
+        logger.error(f"Failed to start metrics endpoint on {host}:{port}: {e}")
+        return None
@@ -0,0 +1,265 @@
+"""
+多模型路由模块
+按优先级排列多个模型（或不同提供方的同一模型），记录每个后端最近的延迟分位数和错误率：
+主模型超过延迟预算时对冲请求下一个后端并采用先返回的结果，出错时切换到下一个后端，
+连续失败的后端由熔断器暂时跳过
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional
+
+from agents.models.interface import Model
+from agents.models.multi_provider import MultiProvider
+from loguru import logger
+
+# 自动确定对冲延迟（按主模型的 p95）前需要的最少样本数
+MIN_LATENCY_SAMPLES = 20
+
+
+class Backend:
+    """一个模型后端及其延迟、错误和熔断状态"""
+
+    def __init__(self, name: str, provider: Any, window: int):
+        """
+        初始化后端
+
+        Args:
+            name: 模型名称
+            provider: 模型提供方，首次调用时按名称创建模型
+            window: 统计延迟和错误率的最近调用数
+        """
+        self.name = name
+        self._provider = provider
+        self._model: Optional[Model] = None
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+
+    @property
+    def model(self) -> Model:
+        """底层模型，首次访问时创建"""
+        if self._model is None:
+            self._model = self._provider.get_model(self.name)
+        return self._model
+
+    def percentile(self, q: float) -> Optional[float]:
+        """
+        最近成功调用延迟的分位数
+
+        Args:
+            q: 分位（0-100）
+
+        Returns:
+            延迟（秒），没有样本时返回None
+        """
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, round(q / 100 * (len(ordered) - 1)))
+        return ordered[index]
+
+    def error_rate(self) -> float:
+        """最近调用的错误率"""
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def is_open(self, now: float) -> bool:
+        """熔断器是否处于打开状态（冷却结束后允许试探调用）"""
+        return now < self.open_until
+
+    def record_success(self, latency: float) -> None:
+        """记录成功调用，关闭熔断器"""
+        self.latencies.append(latency)
+        self.outcomes.append(True)
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+
+    def record_failure(self, now: float, threshold: int, cooldown: float) -> None:
+        """记录失败调用，连续失败达到阈值时打开熔断器"""
+        self.outcomes.append(False)
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= threshold:
+            self.open_until = now + cooldown
+            logger.warning(
+                f"Circuit breaker opened for model {self.name} after "
+                f"{self.consecutive_failures} consecutive failures"
+            )
+
+    def summary(self, now: float) -> Dict[str, Any]:
+        """后端统计"""
+        return {
+            "p50_seconds": self.percentile(50),
+            "p95_seconds": self.percentile(95),
+            "error_rate": self.error_rate(),
+            "calls": len(self.outcomes),
+            "circuit_open": self.is_open(now),
+        }
+
+
+class ModelRouter(Model):
+    """按延迟和错误率在多个模型后端之间路由的模型"""
+
+    def __init__(
+        self,
+        model_names: List[str],
+        provider: Any = None,
+        latency_budget: float = 30.0,
+        failure_threshold: int = 3,
+        cooldown: float = 60.0,
+        window: int = 100,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        初始化路由器
+
+        Args:
+            model_names: 按优先级排列的模型名称
+            provider: 模型提供方，默认 MultiProvider
+            latency_budget: 对冲前等待当前后端的时间（秒），0 表示按主模型的 p95 自动确定
+            failure_threshold: 打开熔断器的连续失败次数
+            cooldown: 熔断器打开后跳过该后端的时间（秒）
+            window: 统计延迟和错误率的最近调用数
+            clock: 时钟函数，便于测试
+        """
+        if not model_names:
+            raise ValueError("ModelRouter requires at least one model")
+        provider = provider or MultiProvider()
+        self.backends = [Backend(name, provider, window) for name in model_names]
+        self.latency_budget = latency_budget
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self._clock = clock
+
+    def _candidates(self) -> List[Backend]:
+        """
+        本次调用依次尝试的后端：熔断器关闭的后端按优先级排列；
+        只有全部熔断时才按熔断结束时间尝试熔断的后端，避免完全没有结果
+        """
+        now = self._clock()
+        closed = [backend for backend in self.backends if not backend.is_open(now)]
+        if closed:
+            return closed
+        return sorted(self.backends, key=lambda backend: backend.open_until)
+
+    def _hedge_delay(self, backend: Backend) -> Optional[float]:
+        """等待当前后端多久后对冲请求下一个后端，None 表示不对冲"""
+        if self.latency_budget > 0:
+            return self.latency_budget
+        if len(backend.latencies) >= MIN_LATENCY_SAMPLES:
+            return backend.percentile(95)
+        return None
+
+    def _record_failure(self, backend: Backend, error: BaseException) -> None:
+        """记录后端失败"""
+        logger.warning(f"Model {backend.name} failed: {error}")
+        backend.record_failure(self._clock(), self.failure_threshold, self.cooldown)
+
+    async def _call(self, backend: Backend, args, kwargs):
+        """调用一个后端并记录延迟或失败，被取消（对冲落败）时不计入统计"""
+        start = self._clock()
+        try:
+            result = await backend.model.get_response(*args, **kwargs)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._record_failure(backend, e)
+            raise
+        backend.record_success(self._clock() - start)
+        return result
+
+    async def get_response(self, *args, **kwargs):
+        """
+        依次请求各后端：当前后端超过延迟预算时对冲请求下一个，出错时切换到下一个，
+        采用最先成功的结果并取消其余请求
+        """
+        candidates = self._candidates()
+        pending: Dict[asyncio.Task, Backend] = {}
+        errors: List[BaseException] = []
+        next_index = 0
+
+        def launch() -> Backend:
+            nonlocal next_index
+            backend = candidates[next_index]
+            next_index += 1
+            task = asyncio.ensure_future(self._call(backend, args, kwargs))
+            pending[task] = backend
+            return backend
+
+        current = launch()
+        try:
+            while pending:
+                delay = None
+                if next_index < len(candidates):
+                    delay = self._hedge_delay(current)
+                done, _ = await asyncio.wait(
+                    pending, timeout=delay, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    hedge = launch()
+                    logger.warning(
+                        f"Model {current.name} exceeded {delay:.1f}s latency budget, "
+                        f"hedging with {hedge.name}"
+                    )
+                    current = hedge
+                    continue
+                for task in done:
+                    pending.pop(task)
+                    if task.exception() is None:
+                        return task.result()
+                    errors.append(task.exception())
+                if not pending and next_index < len(candidates):
+                    current = launch()
+        finally:
+            for task in pending:
+                task.cancel()
+        if not errors:
+            raise RuntimeError("unreachable")
+        raise errors[-1]
+
+    def stream_response(self, *args, **kwargs) -> AsyncIterator[Any]:
+        """流式请求：在收到第一个事件之前出错时切换到下一个后端，不进行对冲"""
+        return self._stream(args, kwargs)
+
+    async def _stream(self, args, kwargs) -> AsyncIterator[Any]:
+        error: Optional[BaseException] = None
+        for backend in self._candidates():
+            start = self._clock()
+            started = False
+            try:
+                async for event in backend.model.stream_response(*args, **kwargs):
+                    started = True
+                    yield event
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._record_failure(backend, e)
+                if started:
+                    raise
+                error = e
+                continue
+            backend.record_success(self._clock() - start)
+            return
+        if error is None:
+            raise RuntimeError("unreachable")
+        raise error
+
+    async def close(self) -> None:
+        """关闭已创建的后端模型"""
+        for backend in self.backends:
+            close = getattr(backend._model, "close", None)
+            if close is not None:
+                await close()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        各后端的延迟分位数、错误率和熔断状态
+
+        Returns:
+            以模型名称为键的统计
+        """
+        now = self._clock()
+        return {backend.name: backend.summary(now) for backend in self.backends}
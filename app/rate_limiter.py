@@ -0,0 +1,209 @@
+"""
+LLM 调用限流模块
+按每分钟请求数（RPM）和每分钟 token 数（TPM）两个令牌桶控制 LLM 调用的准入，
+等待中的调用按优先级排队依次放行；遇到 429 限流错误时按带抖动的指数退避暂停所有调用
+"""
+
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from typing import Callable, List, Optional, Tuple
+
+# 调用优先级，数值越小越先放行
+PRIORITY_REDUCE = 0
+PRIORITY_SINGLE = 1
+PRIORITY_MAP = 2
+
+
+class TokenBucket:
+    """按固定速率补充的令牌桶"""
+
+    def __init__(
+        self,
+        per_minute: float,
+        capacity: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        初始化令牌桶，初始为满
+
+        Args:
+            per_minute: 每分钟补充的令牌数
+            capacity: 桶容量（允许的突发量），默认等于每分钟的令牌数
+            clock: 时钟函数，便于测试
+        """
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.tokens = self.capacity
+        self._clock = clock
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        """按经过的时间补充令牌"""
+        now = self._clock()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """
+        距离桶中有足够令牌还需等待的时间
+
+        Args:
+            amount: 需要的令牌数，超过容量时按容量计算（避免永远无法放行）
+
+        Returns:
+            等待时间（秒），0 表示可以立即取用
+        """
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float) -> None:
+        """取出令牌（调用前应确认 wait_time 为 0）"""
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+
+def backoff_delay(
+    attempt: int,
+    base: float,
+    cap: float,
+    rng: Callable[[float, float], float] = random.uniform,
+) -> float:
+    """
+    带抖动的指数退避时间（full jitter）
+
+    Args:
+        attempt: 第几次重试（从 0 开始）
+        base: 第一次重试的最大等待时间（秒）
+        cap: 等待时间上限（秒）
+        rng: 随机数函数，便于测试
+
+    Returns:
+        等待时间（秒）
+    """
+    return rng(0, min(cap, base * 2**attempt))
+
+
+class RateLimiter:
+    """
+    LLM 调用准入控制
+
+    只有队首（优先级最高、最早到达）的调用可以从令牌桶取用，其余调用排队等待，
+    因此突发的大量调用会按令牌补充的速度均匀放行，而不是同时发出后集中失败。
+    RPM 和 TPM 为 0 时不限制。
+    """
+
+    def __init__(
+        self,
+        rpm: float = 0,
+        tpm: float = 0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        初始化限流器
+
+        Args:
+            rpm: 每分钟请求数上限，0 表示不限制
+            tpm: 每分钟 token 数上限，0 表示不限制
+            clock: 时钟函数，便于测试
+        """
+        self.requests = TokenBucket(rpm, clock=clock) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm, clock=clock) if tpm > 0 else None
+        self._clock = clock
+        self._paused_until = 0.0
+        self._waiters: List[Tuple[int, int, asyncio.Event]] = []
+        self._sequence = itertools.count()
+        self.stats = {"admitted": 0, "waited_seconds": 0.0, "rate_limited": 0}
+
+    @property
+    def enabled(self) -> bool:
+        """是否需要准入控制"""
+        return self.requests is not None or self.tokens is not None
+
+    def _wait_time(self, tokens: int) -> float:
+        """队首调用还需等待的时间"""
+        wait = max(0.0, self._paused_until - self._clock())
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_time(1))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(tokens))
+        return wait
+
+    def _take(self, tokens: int) -> None:
+        """放行队首调用"""
+        if self.requests is not None:
+            self.requests.take(1)
+        if self.tokens is not None:
+            self.tokens.take(tokens)
+
+    def _wake_head(self) -> None:
+        """唤醒新的队首"""
+        if self._waiters:
+            self._waiters[0][2].set()
+
+    async def acquire(self, tokens: int, priority: int = PRIORITY_SINGLE) -> None:
+        """
+        等待直到允许发出一次调用
+
+        Args:
+            tokens: 本次调用预计使用的 token 数
+            priority: 优先级，数值越小越先放行
+        """
+        if not self.enabled and self._paused_until <= self._clock():
+            self.stats["admitted"] += 1
+            return
+
+        start = self._clock()
+        entry = (priority, next(self._sequence), asyncio.Event())
+        heapq.heappush(self._waiters, entry)
+        try:
+            while True:
+                if self._waiters[0] is not entry:
+                    entry[2].clear()
+                    await entry[2].wait()
+                    continue
+                wait = self._wait_time(tokens)
+                if wait <= 0:
+                    break
+                # 等待期间可能有更高优先级的调用到达，醒来后重新检查队首
+                try:
+                    await asyncio.wait_for(entry[2].wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                entry[2].clear()
+            self._take(tokens)
+        finally:
+            self._waiters.remove(entry)
+            heapq.heapify(self._waiters)
+            self._wake_head()
+        self.stats["admitted"] += 1
+        self.stats["waited_seconds"] += self._clock() - start
+
+    def pause(self, seconds: float) -> None:
+        """
+        收到限流错误后暂停放行
+
+        Args:
+            seconds: 暂停时间（秒）
+        """
+        self.stats["rate_limited"] += 1
+        self._paused_until = max(self._paused_until, self._clock() + seconds)
+        self._wake_head()
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """
+    判断异常是否为提供方的限流错误（HTTP 429）
+
+    openai 和 litellm 的 RateLimitError 都带有 status_code 属性。
+    """
+    if getattr(error, "status_code", None) == 429:
+        return True
+    return type(error).__name__ == "RateLimitError"
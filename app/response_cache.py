@@ -0,0 +1,185 @@
+"""
+LLM 响应缓存模块
+以规范化后的聊天记录、提示词和模型名称的哈希作为键，缓存 LLM 的分析结果，
+使用 SQLite 持久化，支持过期时间和按最近访问时间的容量淘汰（LRU）
+"""
+
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from loguru import logger
+
+# 转发邮件时客户端插入的分隔行，不影响聊天内容本身
+_FORWARD_BANNER = re.compile(
+    r"^-{2,}\s*(forwarded message|original message|转发的邮件|原始邮件)\s*-{2,}$",
+    re.IGNORECASE,
+)
+# 引用回复的行首标记
+_QUOTE_PREFIX = re.compile(r"^(>\s*)+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    规范化聊天记录文本，使重复转发或重新发送的相同内容得到相同的结果
+
+    统一 Unicode 形式和换行符，去掉引用标记、转发分隔行和空行，并合并连续空白。
+
+    Args:
+        text: 原始文本
+
+    Returns:
+        规范化后的文本
+    """
+    text = unicodedata.normalize("NFKC", text)
+    lines = []
+    for line in text.splitlines():
+        line = " ".join(_QUOTE_PREFIX.sub("", line).split())
+        if not line or _FORWARD_BANNER.match(line):
+            continue
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def cache_key(body_text: str, prompt: str, model: Optional[str]) -> str:
+    """
+    计算缓存键
+
+    Args:
+        body_text: 邮件正文（聊天记录）
+        prompt: LLM 提示词
+        model: 模型名称
+
+    Returns:
+        十六进制的 SHA-256 摘要
+    """
+    digest = hashlib.sha256()
+    for part in (model or "", prompt, normalize_text(body_text)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """基于 SQLite 的 LLM 响应缓存"""
+
+    def __init__(self, path: str, ttl: float, max_entries: int):
+        """
+        初始化缓存，数据库在首次使用时才打开
+
+        Args:
+            path: SQLite 数据库文件路径，":memory:" 表示仅使用内存
+            ttl: 缓存有效期（秒）
+            max_entries: 最大缓存条目数，超出后淘汰最久未访问的条目
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        """打开数据库并建表"""
+        if self._conn is None:
+            if self.path != ":memory:":
+                Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_responses_accessed_at "
+                "ON responses (accessed_at)"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        查询缓存
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            命中且未过期时返回缓存的结果，否则返回None
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[1] > self.ttl:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, value: str) -> None:
+        """
+        写入缓存，超出容量时淘汰最久未访问的条目
+
+        Args:
+            key: 缓存键
+            value: LLM 结果
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中、未命中次数和当前条目数"""
+        with self._lock:
+            entries = (
+                self._connection()
+                .execute("SELECT COUNT(*) FROM responses")
+                .fetchone()[0]
+            )
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries,
+        }
+
+    def close(self) -> None:
+        """关闭数据库连接"""
+        with self._lock:
+            if self._conn is not None:
+                try:
+                    self._conn.close()
+                except sqlite3.Error as e:
+                    logger.warning(f"Error closing response cache: {e}")
+                self._conn = None
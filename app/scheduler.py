@@ -0,0 +1,226 @@
+"""
+多账户调度模块
+一个进程服务多个邮箱：每个邮箱一个轮询线程，
+所有邮箱共享 LLM 工作线程池，使用相同 SMTP 账号的邮箱共享连接池
+"""
+
+import signal
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from app.accounts import AccountConfig
+from app.config import config
+from app.email_record import EmailRecord
+from app.mail_fetcher import MailFetcher
+from app.job_queue import JobQueue
+from app.metrics import MetricsServer, start_metrics_server
+from app.tracing import start_tracing, tracer
+from app.mail_pipeline import DurablePipeline, MailPipeline, Pipeline
+from app.mail_poller import MailPoller
+from app.mail_processor import MailProcessor
+from app.mail_handler import deliver_reply, handle_email, prepare_reply
+from app.mail_sender import MailSender
+from app.smtp_pool import SMTPConnectionPool
+from app.uid_ledger import UidLedger
+
+# 停止时等待每个轮询线程退出的最长时间（秒）
+POLLER_JOIN_TIMEOUT = 10
+
+
+@dataclass
+class Mailbox:
+    """单个邮箱的收发组件"""
+
+    account: AccountConfig
+    fetcher: MailFetcher
+    sender: MailSender
+    poller: MailPoller
+    thread: Optional[threading.Thread] = None
+
+
+class MultiAccountScheduler:
+    """多账户调度器"""
+
+    def __init__(self, accounts: List[AccountConfig]):
+        """
+        初始化调度器
+
+        Args:
+            accounts: 账户配置列表
+        """
+        self.processor = MailProcessor()
+        # 流水线按账户轮转出队，并单独限制每个账户的排队长度，保证公平；
+        # 启用持久化任务队列时所有邮箱共用一个队列
+        self.jobs: Optional[JobQueue] = None
+        self.metrics_server: Optional[MetricsServer] = None
+        self.pipeline: Pipeline
+        if config.JOB_QUEUE:
+            self.jobs = JobQueue(
+                config.JOB_QUEUE_PATH,
+                visibility_timeout=config.JOB_VISIBILITY_TIMEOUT,
+                max_attempts=config.JOB_MAX_ATTEMPTS,
+            )
+            self.pipeline = DurablePipeline(
+                self.jobs, prepare=self._prepare_reply, deliver=self._deliver_reply
+            )
+        else:
+            self.pipeline = MailPipeline(self._handle_new_email)
+        self._pools: Dict[Tuple[str, int, str], SMTPConnectionPool] = {}
+        self.mailboxes: Dict[str, Mailbox] = {}
+        # 所有邮箱共享一个台账，按 账户/文件夹 区分
+        self.ledger = (
+            UidLedger(
+                config.UID_LEDGER_PATH,
+                max_attempts=config.UID_LEDGER_MAX_ATTEMPTS,
+                retry_delay=config.UID_LEDGER_RETRY_DELAY,
+            )
+            if config.UID_LEDGER
+            else None
+        )
+        for account in accounts:
+            fetcher = MailFetcher(account, self.ledger)
+            self.mailboxes[account.name] = Mailbox(
+                account=account,
+                fetcher=fetcher,
+                sender=MailSender(account, self._shared_pool(account)),
+                poller=MailPoller(fetcher, self.pipeline, account.name),
+            )
+
+        self.is_running = False
+        self._stop_event = threading.Event()
+
+        # 注册信号处理器，用于优雅关闭
+        signal.signal(signal.SIGINT, self._signal_handler)
+        signal.signal(signal.SIGTERM, self._signal_handler)
+
+    def _shared_pool(self, account: AccountConfig) -> SMTPConnectionPool:
+        """获取账户对应的SMTP连接池，相同服务器和登录账号的邮箱共享同一个池"""
+        key = (account.smtp_server, account.smtp_port, account.source_email)
+        if key not in self._pools:
+            self._pools[key] = SMTPConnectionPool(
+                account.smtp_server,
+                account.smtp_port,
+                account.source_email,
+                account.sender_password,
+                max_size=config.SMTP_POOL_SIZE,
+                idle_timeout=config.SMTP_POOL_IDLE_TIMEOUT,
+            )
+        return self._pools[key]
+
+    def _mailbox(self, email_info: EmailRecord) -> Mailbox:
+        """
+        按邮件的账户找到对应的邮箱
+
+        Args:
+            email_info: 邮件记录，带有 account
+
+        Returns:
+            邮箱
+
+        Raises:
+            ValueError: 邮件没有账户或账户不存在
+        """
+        if email_info.account is None or email_info.account not in self.mailboxes:
+            raise ValueError(
+                f"Mail with UID {email_info.uid} has unknown account "
+                f"{email_info.account!r}"
+            )
+        return self.mailboxes[email_info.account]
+
+    def _handle_new_email(self, email_info: EmailRecord) -> None:
+        """
+        处理新邮件的回调函数，在共享的工作线程中执行
+
+        Args:
+            email_info: 邮件记录，带有 account
+        """
+        mailbox = self._mailbox(email_info)
+        handle_email(email_info, self.processor, mailbox.sender, mailbox.fetcher)
+
+    def _prepare_reply(self, email_info: EmailRecord) -> Optional[EmailRecord]:
+        """持久化队列的 LLM 阶段，按账户找到对应的邮箱"""
+        mailbox = self._mailbox(email_info)
+        return prepare_reply(email_info, self.processor, mailbox.fetcher)
+
+    def _deliver_reply(self, email_info: EmailRecord) -> bool:
+        """持久化队列的发送阶段，按账户找到对应的邮箱"""
+        mailbox = self._mailbox(email_info)
+        return deliver_reply(email_info, mailbox.sender, mailbox.fetcher)
+
+    def _signal_handler(self, signum, frame):
+        """信号处理器，用于优雅关闭"""
+        logger.info(f"Received signal {signum}, shutting down gracefully...")
+        self.stop()
+
+    def start(self) -> None:
+        """启动所有邮箱的轮询，阻塞直到收到停止信号"""
+        logger.info(f"Starting scheduler for {len(self.mailboxes)} mailboxes...")
+
+        try:
+            active = []
+            for mailbox in self.mailboxes.values():
+                if mailbox.sender.test_connection():
+                    active.append(mailbox)
+                else:
+                    logger.error(
+                        f"[{mailbox.account.name}] SMTP connection test failed, mailbox disabled"
+                    )
+            if not active:
+                logger.error("No mailbox available, exiting...")
+                return
+
+            self.is_running = True
+            self._stop_event.clear()
+            self.metrics_server = start_metrics_server(
+                config.METRICS_HOST, config.METRICS_PORT
+            )
+            start_tracing(config.TRACING, config.TRACE_EXPORTER, config.TRACE_PATH)
+            self.pipeline.start()
+            for mailbox in active:
+                mailbox.thread = threading.Thread(
+                    target=mailbox.poller.start_polling,
+                    args=(self.pipeline.submit,),
+                    name=f"poller-{mailbox.account.name}",
+                    daemon=True,
+                )
+                mailbox.thread.start()
+            logger.info(f"Scheduler started with {len(active)} active mailboxes")
+
+            # 主线程等待停止信号
+            while not self._stop_event.wait(1):
+                pass
+        except Exception as e:
+            logger.error(f"Error running scheduler: {e}")
+        finally:
+            self.stop()
+            self._shutdown()
+
+    def stop(self) -> None:
+        """请求停止所有邮箱的轮询"""
+        self.is_running = False
+        self._stop_event.set()
+        for mailbox in self.mailboxes.values():
+            mailbox.poller.stop_polling()
+
+    def _shutdown(self) -> None:
+        """等待轮询线程和处理中的邮件结束，并关闭所有连接"""
+        for mailbox in self.mailboxes.values():
+            if mailbox.thread is not None:
+                mailbox.thread.join(POLLER_JOIN_TIMEOUT)
+        self.pipeline.stop()
+        for mailbox in self.mailboxes.values():
+            mailbox.fetcher.disconnect()
+        for pool in self._pools.values():
+            pool.close_all()
+        self.processor.close()
+        if self.jobs is not None:
+            self.jobs.close()
+        if self.ledger is not None:
+            self.ledger.close()
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+        tracer.close()
+        logger.info("Scheduler stopped")
@@ -0,0 +1,176 @@
+"""
+SMTP 连接池模块
+复用已认证的 SMTP 会话，避免每封邮件都重复 TLS 握手和登录
+"""
+
+import smtplib
+import ssl
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from loguru import logger
+
+SMTPConnection = Union[smtplib.SMTP, smtplib.SMTP_SSL]
+
+# STARTTLS 回退时使用的端口
+STARTTLS_PORT = 587
+
+
+class SMTPConnectionPool:
+    """有界 SMTP 连接池，支持 NOOP 健康检查和空闲过期"""
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        username: Optional[str],
+        password: Optional[str],
+        max_size: int = 2,
+        idle_timeout: float = 60,
+    ):
+        """
+        初始化连接池
+
+        Args:
+            host: SMTP 服务器地址
+            port: SMTP SSL 端口
+            username: 登录用户名
+            password: 登录密码（授权码）
+            max_size: 同时存在的最大连接数
+            idle_timeout: 连接空闲超过该时间（秒）后丢弃，不再复用
+
+        Raises:
+            ValueError: 缺少用户名或密码
+        """
+        if not username or not password:
+            raise ValueError(f"SMTP username and password are required for {host}")
+        self.host = host
+        self.port = port
+        self.username: str = username
+        self.password: str = password
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        # 连接池统计：新建连接数、复用次数、丢弃次数
+        self.stats: Dict[str, int] = {"connects": 0, "reuses": 0, "discards": 0}
+        self._idle: List[Tuple[SMTPConnection, float]] = []
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._ssl_context: Optional[ssl.SSLContext] = None
+
+    def _open(self) -> SMTPConnection:
+        """建立新的已认证连接，SSL 失败时回退到 STARTTLS"""
+        if self._ssl_context is None:
+            self._ssl_context = ssl.create_default_context()
+
+        server: SMTPConnection
+        logger.info(f"Connecting to SMTP server {self.host}:{self.port}")
+        try:
+            server = smtplib.SMTP_SSL(self.host, self.port, context=self._ssl_context)
+            logger.info("SMTP SSL connection established")
+        except Exception as conn_err:
+            logger.error(f"Failed to establish SMTP SSL connection: {conn_err}")
+            logger.info("Trying STARTTLS connection...")
+            server = smtplib.SMTP(self.host, STARTTLS_PORT)
+            server.starttls(context=self._ssl_context)
+            logger.info("STARTTLS connection established")
+
+        try:
+            server.login(self.username, self.password)
+        except Exception:
+            self._close(server)
+            raise
+        logger.info("SMTP login successful")
+        self.stats["connects"] += 1
+        return server
+
+    @staticmethod
+    def _close(server: SMTPConnection) -> None:
+        """关闭连接，忽略已断开连接上的错误"""
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception as e:
+                logger.debug(f"Error closing SMTP connection: {e}")
+
+    @staticmethod
+    def _is_alive(server: SMTPConnection) -> bool:
+        """使用 NOOP 检查连接是否仍然可用"""
+        try:
+            code, _ = server.noop()
+            return code == 250
+        except Exception:
+            return False
+
+    def acquire(self) -> SMTPConnection:
+        """
+        获取一个可用连接，优先复用空闲连接，池满时阻塞等待
+
+        Returns:
+            已认证的 SMTP 连接
+        """
+        self._slots.acquire()
+        try:
+            while True:
+                with self._lock:
+                    if not self._idle:
+                        break
+                    server, last_used = self._idle.pop()
+                if time.monotonic() - last_used > self.idle_timeout:
+                    self.stats["discards"] += 1
+                    self._close(server)
+                    continue
+                if not self._is_alive(server):
+                    logger.info("Discarding dead SMTP connection from pool")
+                    self.stats["discards"] += 1
+                    self._close(server)
+                    continue
+                self.stats["reuses"] += 1
+                return server
+            return self._open()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, server: SMTPConnection, discard: bool = False) -> None:
+        """
+        归还连接
+
+        Args:
+            server: 要归还的连接
+            discard: 为True时关闭连接而不放回池中（连接已损坏时使用）
+        """
+        try:
+            if discard:
+                self.stats["discards"] += 1
+                self._close(server)
+            else:
+                with self._lock:
+                    self._idle.append((server, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self) -> Iterator[SMTPConnection]:
+        """以上下文管理器方式借用连接，发生连接级错误时丢弃该连接"""
+        server = self.acquire()
+        try:
+            yield server
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            self.release(server, discard=True)
+            raise
+        except BaseException:
+            self.release(server)
+            raise
+        else:
+            self.release(server)
+
+    def close_all(self) -> None:
+        """关闭所有空闲连接"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for server, _ in idle:
+            self._close(server)
@@ -0,0 +1,329 @@
+"""
+邮件处理链路追踪模块
+每封邮件在解析时分配一个 trace_id（保存在 EmailRecord 中，随邮件进入流水线），
+获取、解析、LLM、发送和标记已读各阶段分别记录为一个 span，带有 UID、字节数和 token 数，
+结束时交给可替换的导出器（默认每个 span 一行写入 JSONL 文件），用于逐阶段拆解慢邮件。
+未启用时 span 为空操作
+"""
+
+import importlib
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextvars import ContextVar
+from pathlib import Path
+from types import TracebackType
+from typing import Any, Callable, Dict, Optional, Self
+
+from loguru import logger
+
+
+def new_trace_id() -> str:
+    """生成新的 trace_id（32 位十六进制）"""
+    return os.urandom(16).hex()
+
+
+class SpanExporter(ABC):
+    """span 导出器基类，自定义导出器实现 export，需要释放资源时覆盖 close"""
+
+    @abstractmethod
+    def export(self, span: Dict[str, Any]) -> None:
+        """
+        导出一个已结束的 span
+
+        Args:
+            span: span 的字典形式（见 Span.to_dict）
+        """
+
+    def close(self) -> None:
+        """释放导出器持有的资源"""
+
+
+class JsonlExporter(SpanExporter):
+    """每个 span 写一行 JSON 到文件"""
+
+    def __init__(self, path: str):
+        """
+        初始化导出器，以追加方式打开文件
+
+        Args:
+            path: JSONL 文件路径
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        # 文件在导出器的整个生命周期内保持打开，由 close 关闭
+        self._file = open(path, "a", encoding="utf-8")  # noqa: SIM115
+        self._lock = threading.Lock()
+
+    def export(self, span: Dict[str, Any]) -> None:
+        line = json.dumps(span, ensure_ascii=False, default=str)
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class Span:
+    """一个处理阶段的耗时和属性"""
+
+    def __init__(
+        self,
+        tracer: "Tracer",
+        name: str,
+        trace_id: str,
+        parent: Optional["Span"] = None,
+        attributes: Optional[Dict[str, Any]] = None,
+    ):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent = parent
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.start = time.time()
+        self._start_perf = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def set(self, **attributes: Any) -> None:
+        """设置属性"""
+        with self._lock:
+            self.attributes.update(attributes)
+
+    def add(self, **counts: float) -> None:
+        """
+        累加数值属性，同时累加到所有上级 span
+
+        用于 token 数等由子阶段（如每次模型调用）产生、需要在整个阶段汇总的数据。
+        """
+        span: Optional[Span] = self
+        while span is not None:
+            with span._lock:
+                for key, value in counts.items():
+                    span.attributes[key] = span.attributes.get(key, 0) + value
+            span = span.parent
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        """结束 span 并导出，重复调用时忽略"""
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._start_perf
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        self.tracer.export(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """导出格式：时间为 Unix 秒，耗时为毫秒"""
+        with self._lock:
+            attributes = dict(self.attributes)
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent else None,
+            "name": self.name,
+            "start": round(self.start, 6),
+            "duration_ms": round((self.duration or 0.0) * 1000, 3),
+            "status": "error" if self.error else "ok",
+            "error": self.error,
+            "attributes": attributes,
+        }
+
+
+class _NoopSpan:
+    """未启用追踪时使用的空 span，同时充当上下文管理器"""
+
+    trace_id = None
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+    def add(self, **counts: float) -> None:
+        pass
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        pass
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+# 当前上下文中活动的 span，子 span 自动以它为上级；
+# 通过 contextvars 传递到 asyncio 任务和 BackgroundLoop 中执行的协程
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class _ActiveSpan:
+    """将 span 设为当前 span 的上下文管理器，退出时结束 span"""
+
+    def __init__(self, span: Span):
+        self.span = span
+        self._token: Any = None
+
+    def __enter__(self) -> Span:
+        self._token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc: Optional[BaseException],
+        tb: Optional[TracebackType],
+    ) -> None:
+        _current_span.reset(self._token)
+        self.span.end(exc)
+
+
+class Tracer:
+    """创建 span 并交给导出器"""
+
+    def __init__(self, exporter: Optional[SpanExporter] = None):
+        """
+        初始化追踪器
+
+        Args:
+            exporter: span 导出器，None 表示不启用
+        """
+        self.exporter = exporter
+
+    @property
+    def enabled(self) -> bool:
+        """是否启用追踪"""
+        return self.exporter is not None
+
+    def start_span(
+        self, name: str, trace_id: Optional[str] = None, **attributes: Any
+    ) -> Any:
+        """
+        创建 span（不设为当前 span），需调用 end 结束
+
+        Args:
+            name: 阶段名称
+            trace_id: 所属邮件的 trace_id，默认沿用当前 span 的 trace_id
+            attributes: 初始属性
+
+        Returns:
+            span，未启用时返回空 span
+        """
+        if self.exporter is None:
+            return _NOOP_SPAN
+        parent = _current_span.get()
+        if parent is not None and trace_id not in (None, parent.trace_id):
+            parent = None
+        trace_id = trace_id or (parent.trace_id if parent else new_trace_id())
+        return Span(self, name, trace_id, parent, attributes)
+
+    def span(self, name: str, trace_id: Optional[str] = None, **attributes: Any):
+        """
+        记录代码块的 span 的上下文管理器，期间创建的 span 以它为上级
+
+        Args:
+            name: 阶段名称
+            trace_id: 所属邮件的 trace_id
+            attributes: 初始属性
+        """
+        if self.exporter is None:
+            return _NOOP_SPAN
+        return _ActiveSpan(self.start_span(name, trace_id, **attributes))
+
+    def record(
+        self,
+        name: str,
+        trace_id: Optional[str],
+        start: float,
+        duration: float,
+        **attributes: Any,
+    ) -> None:
+        """
+        记录已在别处计时的 span（如多封邮件共用一次 IMAP 请求的获取阶段）
+
+        Args:
+            name: 阶段名称
+            trace_id: 所属邮件的 trace_id
+            start: 开始时间（Unix 秒）
+            duration: 耗时（秒）
+            attributes: 属性
+        """
+        if self.exporter is None or trace_id is None:
+            return
+        span = Span(self, name, trace_id, attributes=attributes)
+        span.start = start
+        span.duration = duration
+        self.export(span)
+
+    def export(self, span: Span) -> None:
+        """导出 span，导出器出错时只记录日志"""
+        exporter = self.exporter
+        if exporter is None:
+            return
+        try:
+            exporter.export(span.to_dict())
+        except Exception as e:
+            logger.warning(f"Error exporting span {span.name}: {e}")
+
+    def close(self) -> None:
+        """关闭导出器并停止追踪"""
+        exporter, self.exporter = self.exporter, None
+        if exporter is not None:
+            exporter.close()
+
+
+# 全局追踪器，由 start_tracing 启用
+tracer = Tracer()
+
+
+def load_exporter(spec: str, path: str) -> SpanExporter:
+    """
+    根据配置创建导出器
+
+    Args:
+        spec: "jsonl"，或 "包.模块:工厂" 形式的自定义导出器（无参数调用）
+        path: JSONL 文件路径
+
+    Returns:
+        导出器
+    """
+    if spec == "jsonl":
+        return JsonlExporter(path)
+    module_name, _, attr = spec.partition(":")
+    if not attr:
+        raise ValueError(f"Unknown trace exporter: {spec}")
+    factory: Callable[[], SpanExporter] = getattr(
+        importlib.import_module(module_name), attr
+    )
+    return factory()
+
+
+def start_tracing(enabled: bool, exporter: str, path: str) -> bool:
+    """
+    按配置启用全局追踪器
+
+    Args:
+        enabled: 是否启用
+        exporter: 导出器配置（见 load_exporter）
+        path: JSONL 文件路径
+
+    Returns:
+        成功启用返回True
+    """
+    if not enabled:
+        return False
+    try:
+        tracer.exporter = load_exporter(exporter, path)
+    except Exception as e:
+        logger.error(f"Failed to start tracing with exporter '{exporter}': {e}")
+        return False
+    logger.info(f"Tracing enabled, exporter: {exporter}")
+    return True
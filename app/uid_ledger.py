@@ -0,0 +1,236 @@
+"""
+已处理邮件台账模块
+在本地 SQLite 中记录每个邮箱（UIDVALIDITY, UID）的处理状态和高水位 UID，
+使获取器只需增量搜索新邮件，并保证重启后不会重复处理或遗漏邮件；
+处理失败的邮件按指数退避延迟重试，超过最大尝试次数后不再处理
+"""
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional
+
+from loguru import logger
+
+# 处理状态
+PENDING = "pending"  # 已发现，尚未发送回复
+SENT = "sent"  # 回复已发送，尚未标记已读
+DONE = "done"  # 处理完成
+SKIPPED = "skipped"  # 机器人自己发出的邮件，无需处理
+FAILED = "failed"  # 超过最大尝试次数，不再处理
+
+UNFINISHED_STATES = (PENDING, SENT)
+
+
+class UidLedger:
+    """基于 SQLite 的邮件处理台账"""
+
+    def __init__(
+        self,
+        path: str,
+        max_attempts: int = 5,
+        retry_delay: float = 60.0,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        初始化台账，数据库在首次使用时才打开
+
+        Args:
+            path: SQLite 数据库文件路径，":memory:" 表示仅使用内存
+            max_attempts: 每封邮件的最大处理次数，超过后进入失败状态
+            retry_delay: 处理失败后第一次重试前的等待时间（秒），之后每次翻倍
+            clock: 时钟函数，便于测试
+        """
+        self.path = path
+        self.max_attempts = max(1, max_attempts)
+        self.retry_delay = retry_delay
+        self._clock = clock
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        """打开数据库并建表"""
+        if self._conn is None:
+            if self.path != ":memory:":
+                Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS mailboxes ("
+                "mailbox TEXT NOT NULL, uidvalidity INTEGER NOT NULL, "
+                "high_water INTEGER NOT NULL, "
+                "PRIMARY KEY (mailbox, uidvalidity))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "mailbox TEXT NOT NULL, uidvalidity INTEGER NOT NULL, "
+                "uid INTEGER NOT NULL, state TEXT NOT NULL, updated_at REAL NOT NULL, "
+                "attempts INTEGER NOT NULL DEFAULT 0, "
+                "next_retry_at REAL NOT NULL DEFAULT 0, "
+                "PRIMARY KEY (mailbox, uidvalidity, uid))"
+            )
+            # 旧版本创建的表没有重试相关的列
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(messages)")}
+            if "attempts" not in columns:
+                conn.execute(
+                    "ALTER TABLE messages ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0"
+                )
+            if "next_retry_at" not in columns:
+                conn.execute(
+                    "ALTER TABLE messages "
+                    "ADD COLUMN next_retry_at REAL NOT NULL DEFAULT 0"
+                )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_messages_state "
+                "ON messages (mailbox, uidvalidity, state)"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def high_water_mark(self, mailbox: str, uidvalidity: int) -> Optional[int]:
+        """
+        返回已登记的最大 UID
+
+        Args:
+            mailbox: 邮箱标识（账户/文件夹）
+            uidvalidity: 文件夹当前的 UIDVALIDITY
+
+        Returns:
+            高水位 UID，首次处理该文件夹时返回None
+        """
+        with self._lock:
+            row = (
+                self._connection()
+                .execute(
+                    "SELECT high_water FROM mailboxes "
+                    "WHERE mailbox = ? AND uidvalidity = ?",
+                    (mailbox, uidvalidity),
+                )
+                .fetchone()
+            )
+        return row[0] if row else None
+
+    def add_pending(
+        self, mailbox: str, uidvalidity: int, uids: Iterable[int], high_water: int
+    ) -> None:
+        """
+        登记新发现的邮件并推进高水位
+
+        Args:
+            mailbox: 邮箱标识
+            uidvalidity: 文件夹当前的 UIDVALIDITY
+            uids: 新发现的邮件 UID
+            high_water: 新的高水位 UID
+        """
+        now = self._clock()
+        with self._lock:
+            conn = self._connection()
+            conn.executemany(
+                "INSERT OR IGNORE INTO messages "
+                "(mailbox, uidvalidity, uid, state, updated_at) VALUES (?, ?, ?, ?, ?)",
+                [(mailbox, uidvalidity, uid, PENDING, now) for uid in uids],
+            )
+            conn.execute(
+                "INSERT INTO mailboxes (mailbox, uidvalidity, high_water) "
+                "VALUES (?, ?, ?) ON CONFLICT (mailbox, uidvalidity) "
+                "DO UPDATE SET high_water = MAX(high_water, excluded.high_water)",
+                (mailbox, uidvalidity, high_water),
+            )
+            conn.commit()
+
+    def unfinished(self, mailbox: str, uidvalidity: int) -> List[int]:
+        """返回尚未处理完成且已到重试时间的邮件 UID"""
+        with self._lock:
+            rows = (
+                self._connection()
+                .execute(
+                    "SELECT uid FROM messages WHERE mailbox = ? AND uidvalidity = ? "
+                    f"AND state IN ({', '.join('?' * len(UNFINISHED_STATES))}) "
+                    "AND next_retry_at <= ? ORDER BY uid",
+                    (mailbox, uidvalidity, *UNFINISHED_STATES, self._clock()),
+                )
+                .fetchall()
+            )
+        return [row[0] for row in rows]
+
+    def get_state(self, mailbox: str, uidvalidity: int, uid: int) -> Optional[str]:
+        """返回邮件的处理状态，未登记时返回None"""
+        with self._lock:
+            row = (
+                self._connection()
+                .execute(
+                    "SELECT state FROM messages "
+                    "WHERE mailbox = ? AND uidvalidity = ? AND uid = ?",
+                    (mailbox, uidvalidity, uid),
+                )
+                .fetchone()
+            )
+        return row[0] if row else None
+
+    def set_state(self, mailbox: str, uidvalidity: int, uid: int, state: str) -> None:
+        """更新邮件的处理状态"""
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT INTO messages (mailbox, uidvalidity, uid, state, updated_at) "
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT (mailbox, uidvalidity, uid) "
+                "DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+                (mailbox, uidvalidity, uid, state, self._clock()),
+            )
+            conn.commit()
+
+    def record_failure(self, mailbox: str, uidvalidity: int, uid: int) -> bool:
+        """
+        记录一次处理失败：延迟后重试，超过最大尝试次数进入失败状态
+
+        Args:
+            mailbox: 邮箱标识
+            uidvalidity: 文件夹当前的 UIDVALIDITY
+            uid: 邮件 UID
+
+        Returns:
+            进入失败状态返回True
+        """
+        now = self._clock()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT attempts FROM messages "
+                "WHERE mailbox = ? AND uidvalidity = ? AND uid = ?",
+                (mailbox, uidvalidity, uid),
+            ).fetchone()
+            attempts = (row[0] if row else 0) + 1
+            failed = attempts >= self.max_attempts
+            conn.execute(
+                "INSERT INTO messages "
+                "(mailbox, uidvalidity, uid, state, updated_at, attempts, next_retry_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (mailbox, uidvalidity, uid) "
+                "DO UPDATE SET state = CASE WHEN ? THEN ? ELSE state END, "
+                "updated_at = excluded.updated_at, attempts = excluded.attempts, "
+                "next_retry_at = excluded.next_retry_at",
+                (
+                    mailbox,
+                    uidvalidity,
+                    uid,
+                    FAILED if failed else PENDING,
+                    now,
+                    attempts,
+                    now + self.retry_delay * 2 ** (attempts - 1),
+                    failed,
+                    FAILED,
+                ),
+            )
+            conn.commit()
+        return failed
+
+    def close(self) -> None:
+        """关闭数据库连接"""
+        with self._lock:
+            if self._conn is not None:
+                try:
+                    self._conn.close()
+                except sqlite3.Error as e:
+                    logger.warning(f"Error closing UID ledger: {e}")
+                self._conn = None
@@ -5,13 +5,20 @@ from loguru import logger
 from ..config import config
 
 
-def setup_logger(log_level: str = "INFO", log_file: Optional[str] = None):
+def setup_logger(
+    log_level: str = "INFO",
+    log_file: Optional[str] = None,
+    backtrace: bool = False,
+    diagnose: bool = False,
+):
     """
     设置日志记录器
 
     Args:
         log_level: 日志级别，默认为INFO
         log_file: 日志文件路径，如果为None则只输出到控制台
+        backtrace: 异常日志是否带完整调用栈
+        diagnose: 异常日志是否带各层变量值（可能包含邮件内容）
     """
     # 移除默认的日志处理器
     logger.remove()
@@ -21,8 +28,8 @@ def setup_logger(log_level: str = "INFO", log_file: Optional[str] = None):
         sys.stdout,
         level=log_level,
         enqueue=True,  # 异步写入
-        backtrace=True,  # 错误跟踪
-        diagnose=True,  # 诊断信息
+        backtrace=backtrace,  # 错误跟踪
+        diagnose=diagnose,  # 诊断信息
     )
 
     # 如果指定了日志文件，则添加文件输出
@@ -39,15 +46,17 @@ def setup_logger(log_level: str = "INFO", log_file: Optional[str] = None):
             retention="30 days",  # 保留30天的日志
             compression="zip",  # 压缩旧日志
             enqueue=True,  # 异步写入
-            backtrace=True,  # 错误跟踪
-            diagnose=True,  # 诊断信息
+            backtrace=backtrace,  # 错误跟踪
+            diagnose=diagnose,  # 诊断信息
         )
 
     return logger
 
 
 # 创建默认的日志记录器实例
-default_logger = setup_logger(config.LOG_LEVEL, config.LOG_FILE)
+default_logger = setup_logger(
+    config.LOG_LEVEL, config.LOG_FILE, config.LOG_BACKTRACE, config.LOG_DIAGNOSE
+)
 
 
 __all__ = ["logger", "setup_logger", "default_logger"]
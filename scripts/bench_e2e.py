@@ -0,0 +1,305 @@
+"""
+端到端基准测试
+在本进程中启动假 IMAP 服务器、SMTP 接收端和延迟可配置的假 LLM 接口（tests/fake_servers.py），
+以子进程运行未经修改的机器人（python -m app.main，全部配置通过环境变量传入），
+机器人就绪后向邮箱放入一批合成的聊天记录邮件，统计从邮件进入邮箱到回复投递到 SMTP 的
+延迟（p50/p99）、吞吐量，以及机器人进程的内存峰值（ru_maxrss）。
+
+每个列表参数取多个值时按笛卡尔积组合成多组配置，例如：
+    python scripts/bench_e2e.py --emails 50,200 --body-kib 4,256 --llm-latency 0.5
+    python scripts/bench_e2e.py --env ENGINE=thread,async --env LLM_WORKERS=4,16
+    python scripts/bench_e2e.py --layout attachment --env FETCH_STRATEGY=peek,full
+
+项目根目录的 .env 仍会被机器人读取，但其中与本测试相关的配置会被这里设置的环境变量覆盖
+"""
+
+import argparse
+import itertools
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from email.message import EmailMessage
+
+# 添加项目根目录到 Python 路径，确保能正确导入模块（tests.fake_servers 在用到时才导入）
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SUBJECT_PREFIX = "bench-"
+
+
+def build_email(index, body_kib, layout, prefix=SUBJECT_PREFIX):
+    """
+    构造一封约 body_kib KiB 的聊天记录邮件
+
+    Args:
+        index: 序号，写入主题用于对应回复
+        body_kib: 聊天记录大小（KiB）
+        layout: body 表示聊天记录在正文中，attachment 表示作为 .txt 附件
+        prefix: 主题前缀
+    """
+    lines = []
+    size = 0
+    i = 0
+    while size < body_kib * 1024:
+        speaker = "我" if i % 2 else "小红"
+        line = f"2024-01-01 10:{i % 60:02d} {speaker}: 第{index}封第{i}条，今天过得怎么样？\n"
+        lines.append(line)
+        size += len(line.encode("utf-8"))
+        i += 1
+    chat = "".join(lines)
+
+    message = EmailMessage()
+    message["Subject"] = f"{prefix}{index}"
+    message["From"] = "friend@localhost"
+    message["To"] = "bench@localhost"
+    if layout == "attachment":
+        message.set_content("聊天记录见附件")
+        message.add_attachment(
+            chat.encode("utf-8"),
+            maintype="text",
+            subtype="plain",
+            filename="chat.txt",
+        )
+    else:
+        message.set_content(chat)
+    return message.as_bytes()
+
+
+def bot_env(imap, sink, llm, workdir, overrides):
+    """机器人子进程的环境变量"""
+    from tests.fake_servers import CERT_FILE
+
+    env = dict(os.environ)
+    env.pop("DEEPSEEK_API_KEY", None)
+    env.update(
+        {
+            "SOURCE_EMAIL": "bench@localhost",
+            "SOURCE_PASSWORD": "bench",
+            "TARGET_EMAIL": "target@localhost",
+            "SOURCE_IMAP_SERVER": "localhost",
+            "SOURCE_IMAP_PORT": str(imap.port),
+            "SMTP_SERVER": "localhost",
+            "SMTP_PORT": str(sink.port),
+            "SSL_CERT_FILE": CERT_FILE,
+            "ACCOUNTS_FILE": "",
+            "CHECK_INTERVAL": "1",
+            "LLM_MODELS": "litellm/openai/bench",
+            "OPENAI_API_BASE": llm.base_url,
+            "OPENAI_BASE_URL": llm.base_url,
+            "OPENAI_API_KEY": "bench",
+            "RESPONSE_CACHE": "false",
+            "UID_LEDGER_PATH": os.path.join(workdir, "uid_ledger.sqlite3"),
+            "JOB_QUEUE_PATH": os.path.join(workdir, "jobs.sqlite3"),
+            "LOG_FILE": os.path.join(workdir, "bot.log"),
+            "METRICS_PORT": "0",
+            "TRACING": "false",
+        }
+    )
+    env.update(overrides)
+    return env
+
+
+def percentile(values, fraction):
+    """最近秩法百分位数"""
+    ordered = sorted(values)
+    if not ordered:
+        return float("nan")
+    rank = max(0, min(len(ordered) - 1, int(-(-fraction * len(ordered) // 1)) - 1))
+    return ordered[rank]
+
+
+def wait_child(proc, timeout):
+    """等待子进程退出，超时后强制结束，返回 (退出码, 内存峰值 MiB)"""
+    deadline = time.monotonic() + timeout
+    while True:
+        pid, status, usage = os.wait4(proc.pid, os.WNOHANG)
+        if pid:
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            return proc.returncode, usage.ru_maxrss / 1024
+        if time.monotonic() > deadline:
+            proc.kill()
+            deadline = float("inf")
+        time.sleep(0.05)
+
+
+def run_config(emails, body_kib, layout, llm_latency, overrides, args):
+    """运行一组配置并返回结果"""
+    from tests.fake_servers import FakeIMAPServer, FakeLLMServer, SMTPSink
+
+    imap = FakeIMAPServer()
+    sink = SMTPSink()
+    llm = FakeLLMServer(
+        latency=llm_latency, reply="【聊天总结】" + "双方约定晚上一起吃饭。" * 20
+    )
+    raws = [build_email(index, body_kib, layout) for index in range(emails)]
+    result = {
+        "emails": emails,
+        "body_kib": body_kib,
+        "layout": layout,
+        "llm_latency": llm_latency,
+        "env": overrides,
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        log_path = os.path.join(workdir, "stdout.log")
+        with open(log_path, "wb") as log:
+            proc = subprocess.Popen(
+                [sys.executable, "-m", "app.main"],
+                cwd=ROOT,
+                env=bot_env(imap, sink, llm, workdir, overrides),
+                stdout=log,
+                stderr=subprocess.STDOUT,
+            )
+        try:
+            # 机器人完成第一次搜索后开始放入邮件
+            deadline = time.monotonic() + args.startup_timeout
+            while not imap.mailbox.searched.wait(0.1):
+                if proc.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("bot did not start")
+
+            # 预热邮件（首次调用LLM时的导入和建立连接）不计入结果
+            for index in range(args.warmup):
+                imap.mailbox.append(build_email(index, body_kib, layout, "warmup-"))
+            deadline = time.monotonic() + args.startup_timeout
+            while not sink.wait_for(args.warmup, 0.1):
+                if proc.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("warm-up emails were not delivered")
+
+            warmup_calls = llm.requests
+            interval = 1 / args.rate if args.rate > 0 else 0
+            start = time.monotonic()
+            arrivals = {}
+            for index, raw in enumerate(raws):
+                if interval:
+                    time.sleep(max(0.0, start + index * interval - time.monotonic()))
+                uid = imap.mailbox.append(raw)
+                arrivals[f"{SUBJECT_PREFIX}{index}"] = imap.mailbox.messages[
+                    uid - 1
+                ].arrived
+
+            deadline = time.monotonic() + args.timeout
+            while not sink.wait_for(args.warmup + emails, 0.2):
+                if proc.poll() is not None or time.monotonic() > deadline:
+                    break
+        except RuntimeError as e:
+            result["error"] = str(e)
+            arrivals, warmup_calls = {}, llm.requests
+        finally:
+            if proc.poll() is None:
+                proc.send_signal(signal.SIGTERM)
+            exit_code, peak_rss = wait_child(proc, 30)
+            imap.close()
+            sink.close()
+            llm.close()
+
+        latencies = []
+        for delivery in sink.deliveries:
+            subject = delivery.subject.rsplit(" ", 1)[-1]
+            if subject in arrivals:
+                latencies.append(delivery.received - arrivals.pop(subject))
+        delivered = len(latencies)
+        wall = (
+            max(d.received for d in sink.deliveries) - start
+            if delivered and "error" not in result
+            else float("nan")
+        )
+        result.update(
+            {
+                "delivered": delivered,
+                "wall_seconds": wall,
+                "throughput": delivered / wall if delivered else 0.0,
+                "p50_seconds": percentile(latencies, 0.5),
+                "p99_seconds": percentile(latencies, 0.99),
+                "peak_rss_mib": peak_rss,
+                "llm_requests": llm.requests - warmup_calls,
+                "exit_code": exit_code,
+            }
+        )
+        if delivered < emails:
+            with open(log_path, "rb") as log:
+                tail = log.read()[-2000:].decode("utf-8", "replace")
+            print(f"  bot output (tail):\n{tail}", file=sys.stderr)
+    return result
+
+
+def split_values(text, convert=str):
+    return [convert(value) for value in text.split(",") if value]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--emails", default="50,200", help="每组配置的邮件数（逗号分隔）"
+    )
+    parser.add_argument(
+        "--body-kib", default="4,64", help="每封聊天记录大小 KiB（逗号分隔）"
+    )
+    parser.add_argument(
+        "--layout", default="body", help="body 或 attachment（逗号分隔）"
+    )
+    parser.add_argument(
+        "--llm-latency", default="0.2", help="假 LLM 每次请求的延迟秒数（逗号分隔）"
+    )
+    parser.add_argument(
+        "--env",
+        action="append",
+        default=[],
+        metavar="KEY=V1[,V2...]",
+        help="传给机器人的环境变量，多个值参与组合（可重复）",
+    )
+    parser.add_argument(
+        "--rate", type=float, default=0, help="每秒放入的邮件数，0表示一次全部放入"
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=600, help="每组配置等待投递完成的最长秒数"
+    )
+    parser.add_argument(
+        "--startup-timeout", type=float, default=60, help="等待机器人启动的最长秒数"
+    )
+    parser.add_argument(
+        "--warmup",
+        type=int,
+        default=1,
+        help="正式放入邮件前先处理的预热邮件数，不计入结果",
+    )
+    parser.add_argument("--json", help="把结果写入该 JSON 文件")
+    args = parser.parse_args()
+
+    env_axes = []
+    for item in args.env:
+        key, _, values = item.partition("=")
+        env_axes.append([(key, value) for value in values.split(",")])
+
+    results = []
+    for emails, body_kib, layout, latency, env_items in itertools.product(
+        split_values(args.emails, int),
+        split_values(args.body_kib, int),
+        split_values(args.layout),
+        split_values(args.llm_latency, float),
+        itertools.product(*env_axes),
+    ):
+        overrides = dict(env_items)
+        label = f"{emails} emails, {body_kib} KiB {layout}, llm {latency}s"
+        if overrides:
+            label += ", " + " ".join(f"{k}={v}" for k, v in overrides.items())
+        print(label)
+        result = run_config(emails, body_kib, layout, latency, overrides, args)
+        results.append(result)
+        print(
+            f"  delivered {result['delivered']}/{emails}"
+            f"  {result['throughput']:7.2f} emails/s"
+            f"  p50 {result['p50_seconds']:7.3f}s  p99 {result['p99_seconds']:7.3f}s"
+            f"  peak RSS {result['peak_rss_mib']:6.1f} MiB"
+            f"  llm calls {result['llm_requests']}"
+        )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+日志负载基准测试
+模拟每封邮件记录一次LLM输入（聊天记录正文）和一次LLM输出，比较记录完整内容（full）
+与只记录长度、哈希和预览（summary）时的吞吐量和日志文件大小。
+日志输出与生产环境相同：enqueue=True 的文件输出，计时包含等待队列写完
+
+用法: python scripts/bench_logging.py [邮件数] [正文KiB ...]
+"""
+
+import sys
+import os
+import tempfile
+import time
+
+# 添加项目根目录到 Python 路径，确保能正确导入模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loguru import logger
+
+from app.config import config
+from app.log_policy import PAYLOADS_FULL, PAYLOADS_SUMMARY, describe_payload
+
+
+def build_chat(size_kib):
+    """构造约 size_kib KiB 的聊天记录正文"""
+    line = "2024-01-01 10:00 小明: 今天过得怎么样？晚上一起吃饭吗\n"
+    repeat = size_kib * 1024 // len(line.encode("utf-8")) + 1
+    return line * repeat
+
+
+def run(mode, emails, body, output, log_dir):
+    """
+    以指定模式记录 emails 封邮件的输入和输出
+
+    Returns:
+        (耗时秒数, 日志文件字节数)
+    """
+    config.LOG_PAYLOADS = mode
+    path = os.path.join(log_dir, f"{mode}.log")
+    logger.remove()
+    logger.add(path, level="INFO", enqueue=True)
+    start = time.perf_counter()
+    for uid in range(emails):
+        logger.opt(lazy=True).info(
+            "LLM input for UID {}: {}",
+            lambda uid=uid: uid,
+            lambda: describe_payload(body),
+        )
+        logger.opt(lazy=True).info(
+            "LLM output for UID {}: {}",
+            lambda uid=uid: uid,
+            lambda: describe_payload(output),
+        )
+    logger.complete()
+    elapsed = time.perf_counter() - start
+    logger.remove()
+    return elapsed, os.path.getsize(path)
+
+
+def main():
+    emails = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    sizes = [int(arg) for arg in sys.argv[2:]] or [64, 1024, 4096]
+    output = "【聊天总结】\n" + "双方约定晚上一起吃饭，气氛融洽。\n" * 20
+    with tempfile.TemporaryDirectory() as log_dir:
+        for size_kib in sizes:
+            body = build_chat(size_kib)
+            print(f"{emails} emails, {size_kib} KiB body:")
+            for mode in (PAYLOADS_FULL, PAYLOADS_SUMMARY):
+                elapsed, written = run(mode, emails, body, output, log_dir)
+                print(
+                    f"  {mode:<8} {elapsed * 1000:9.1f} ms"
+                    f"  {emails / elapsed:10.0f} emails/s"
+                    f"  {written / 1024 / 1024:9.2f} MiB written"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+邮件解析微基准测试
+对比 app.mail_parser.parse_email 与原先 MailFetcher._parse_email、
+MailProcessor.parse_raw_email 两个解析器（副本保留在本脚本中），
+以及使用 email.policy.default 的同等实现的耗时
+
+用法: python scripts/bench_parser.py [重复次数]
+"""
+
+import sys
+import os
+import email
+import timeit
+from email import policy
+from email.header import decode_header
+from email.message import EmailMessage
+
+# 添加项目根目录到 Python 路径，确保能正确导入模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.mail_parser import parse_email
+
+
+def _legacy_decode_header(header):
+    if not header:
+        return ""
+    decoded_string = ""
+    for part, encoding in decode_header(header):
+        if isinstance(part, bytes):
+            decoded_string += part.decode(encoding or "utf-8", errors="ignore")
+        else:
+            decoded_string += part
+    return decoded_string
+
+
+def legacy_fetcher_parse(raw_email):
+    """原 MailFetcher._parse_email：compat32 解析，字符串 += 拼接"""
+    msg = email.message_from_bytes(raw_email)
+    subject = _legacy_decode_header(msg.get("Subject", ""))
+    sender = _legacy_decode_header(msg.get("From", ""))
+    receiver = _legacy_decode_header(msg.get("To", ""))
+    body_text = ""
+    attachments = []
+    if msg.is_multipart():
+        for part in msg.walk():
+            disposition = str(part.get("Content-Disposition", ""))
+            if "attachment" in disposition:
+                filename = part.get_filename()
+                if filename:
+                    attachments.append(
+                        {
+                            "filename": _legacy_decode_header(filename),
+                            "content_type": part.get_content_type(),
+                        }
+                    )
+                continue
+            payload = part.get_payload(decode=True)
+            if payload and part.get_content_type() == "text/plain":
+                charset = part.get_content_charset() or "utf-8"
+                body_text += payload.decode(charset, errors="ignore")
+    else:
+        payload = msg.get_payload(decode=True)
+        if payload and msg.get_content_type() == "text/plain":
+            body_text = payload.decode(
+                msg.get_content_charset() or "utf-8", errors="ignore"
+            )
+    return subject, sender, receiver, body_text, attachments
+
+
+def legacy_processor_parse(raw_email):
+    """原 MailProcessor.parse_raw_email：正文和附件分两次遍历 MIME 树"""
+    msg = email.message_from_bytes(raw_email)
+    subject = _legacy_decode_header(msg.get("Subject", ""))
+    sender = _legacy_decode_header(msg.get("From", ""))
+    receiver = _legacy_decode_header(msg.get("To", ""))
+    body_text = ""
+    if msg.is_multipart():
+        for part in msg.walk():
+            if "attachment" in str(part.get("Content-Disposition", "")):
+                continue
+            if part.get_content_type() == "text/plain":
+                payload = part.get_payload(decode=True)
+                if isinstance(payload, bytes):
+                    body_text += payload.decode(
+                        part.get_content_charset() or "utf-8", errors="ignore"
+                    )
+    attachments = []
+    if msg.is_multipart():
+        for part in msg.walk():
+            if "attachment" in str(part.get("Content-Disposition", "")):
+                filename = part.get_filename()
+                if filename:
+                    attachments.append(
+                        {
+                            "filename": _legacy_decode_header(filename),
+                            "content_type": part.get_content_type(),
+                        }
+                    )
+    return subject, sender, receiver, body_text, attachments
+
+
+def policy_default_parse(raw_email):
+    """同样的单次遍历，改用 email.policy.default 解析（用于对比两种策略的开销）"""
+    msg = email.message_from_bytes(raw_email, policy=policy.default)
+    texts = []
+    attachments = []
+    for part in msg.walk():
+        if part.get_content_disposition() == "attachment":
+            attachments.append((part.get_filename(), part.get_content_type()))
+        elif part.get_content_type() == "text/plain":
+            texts.append(part.get_content())
+    return (
+        str(msg["Subject"]),
+        str(msg["From"]),
+        str(msg["To"]),
+        "".join(texts),
+        attachments,
+    )
+
+
+def build_sample(lines, attachments):
+    """构造一封聊天记录邮件：lines 行纯文本正文、HTML 副本和若干截图附件"""
+    message = EmailMessage()
+    message["Subject"] = "聊天记录 - 小红"
+    message["From"] = "小明 <a@example.com>"
+    message["To"] = "b@example.com"
+    text = "".join(f"我：第{i}句，今天过得怎么样？\n" for i in range(lines))
+    message.set_content(text)
+    message.add_alternative(f"<pre>{text}</pre>", subtype="html")
+    for i in range(attachments):
+        message.add_attachment(
+            os.urandom(20_000),
+            maintype="image",
+            subtype="png",
+            filename=f"截图{i}.png",
+        )
+    return message.as_bytes()
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    samples = {
+        "short": build_sample(20, 0),
+        "chat+3 images": build_sample(500, 3),
+        "long chat": build_sample(5000, 1),
+    }
+    parsers = {
+        "fetcher (legacy)": legacy_fetcher_parse,
+        "processor (legacy)": legacy_processor_parse,
+        "policy.default": policy_default_parse,
+        "parse_email": parse_email,
+    }
+
+    for name, raw in samples.items():
+        print(f"{name} ({len(raw) / 1024:.0f} KiB):")
+        for parser_name, parser in parsers.items():
+            seconds = timeit.timeit(
+                lambda parser=parser, raw=raw: parser(raw), number=number
+            )
+            print(f"  {parser_name:<20} {seconds / number * 1e6:10.1f} us/msg")
+
+
+if __name__ == "__main__":
+    main()
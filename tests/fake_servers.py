@@ -0,0 +1,980 @@
+"""
+本地假服务器
+供集成测试和端到端基准测试（scripts/bench_e2e.py）使用：
+- FakeIMAPServer：实现机器人用到的 IMAP4rev1 子集（UID SEARCH/FETCH/STORE、部分获取、
+  BODYSTRUCTURE 和 IDLE 推送），邮件保存在内存中的 FakeMailbox
+- SMTPSink：接受登录和投递的 SMTP 服务器，记录每封邮件的到达时间
+- FakeLLMServer：OpenAI 兼容的 /v1/chat/completions 接口（支持流式），延迟可配置
+
+IMAP 和 SMTP 使用隐式 TLS，证书为 tests/localhost.pem（localhost/127.0.0.1 的自签名证书），
+客户端使用 client_ssl_context，或在子进程中设置 SSL_CERT_FILE 信任该证书
+"""
+
+import base64
+import email.utils
+import json
+import os
+import re
+import select
+import socket
+import socketserver
+import ssl
+import threading
+import time
+from email.message import Message
+from email.parser import BytesHeaderParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+CERT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "localhost.pem")
+
+_HEADER_END = re.compile(rb"\r?\n\r?\n")
+_LITERAL = re.compile(rb"\{(\d+)(\+?)\}\r\n$")
+_SECTION = re.compile(
+    r"^(BODY|BODY\.PEEK)\[([0-9.]*?)\.?(HEADER|TEXT|MIME)?\](?:<(\d+)\.(\d+)>)?$",
+    re.IGNORECASE,
+)
+
+
+def server_ssl_context() -> ssl.SSLContext:
+    """服务器端 TLS 上下文"""
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(CERT_FILE)
+    return context
+
+
+def client_ssl_context() -> ssl.SSLContext:
+    """信任测试证书的客户端 TLS 上下文"""
+    return ssl.create_default_context(cafile=CERT_FILE)
+
+
+class _TLSServer(socketserver.ThreadingTCPServer):
+    """每个连接一个线程，可选在处理线程中完成 TLS 握手"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, handler, ssl_context: Optional[ssl.SSLContext]):
+        self.ssl_context = ssl_context
+        super().__init__(address, handler)
+
+
+class _BackgroundServer:
+    """在后台线程中运行 socketserver，提供 port 和 close"""
+
+    def _serve(self, server: socketserver.TCPServer, name: str) -> None:
+        self._server = server
+        self.port: int = server.socket.getsockname()[1]
+        self._thread = threading.Thread(
+            target=server.serve_forever, name=name, daemon=True
+        )
+        self._thread.start()
+
+    def close(self) -> None:
+        """停止服务"""
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+
+# ---------------------------------------------------------------- MIME 结构
+
+
+class MimePart:
+    """按原始字节切分的 MIME 部分，用于 BODYSTRUCTURE 和按部分获取"""
+
+    def __init__(self, raw: bytes):
+        match = _HEADER_END.search(raw)
+        if match:
+            self.header, self.body = raw[: match.end()], raw[match.end() :]
+        else:
+            self.header, self.body = raw, b""
+        self.headers: Message = BytesHeaderParser().parsebytes(self.header)
+        self.children: List[MimePart] = []
+        if self.headers.get_content_maintype() == "multipart":
+            boundary = self.headers.get_boundary()
+            if boundary:
+                self.children = [
+                    MimePart(part)
+                    for part in _split_multipart(self.body, boundary.encode())
+                ]
+
+    def find(self, path: List[int]) -> Optional["MimePart"]:
+        """按部分编号查找，单部分邮件的部分 1 为邮件本身"""
+        part = self
+        for number in path:
+            if part.children:
+                if not 0 < number <= len(part.children):
+                    return None
+                part = part.children[number - 1]
+            elif number != 1:
+                return None
+        return part
+
+    def structure(self) -> bytes:
+        """IMAP BODYSTRUCTURE（带扩展字段）"""
+        headers = self.headers
+        if self.children:
+            return (
+                b"("
+                + b"".join(child.structure() for child in self.children)
+                + b" "
+                + _join(
+                    [
+                        _string(headers.get_content_subtype().upper()),
+                        _params(headers, "content-type"),
+                        _disposition(headers),
+                        b"NIL",
+                        b"NIL",
+                    ]
+                )
+                + b")"
+            )
+        main_type = headers.get_content_maintype()
+        fields = [
+            _string(main_type.upper()),
+            _string(headers.get_content_subtype().upper()),
+            _params(headers, "content-type"),
+            _string(headers.get("Content-ID")),
+            _string(headers.get("Content-Description")),
+            _string(headers.get("Content-Transfer-Encoding", "7bit").upper()),
+            str(len(self.body)).encode(),
+        ]
+        if main_type == "text":
+            fields.append(str(self.body.count(b"\n")).encode())
+        fields += [b"NIL", _disposition(headers), b"NIL", b"NIL"]
+        return b"(" + _join(fields) + b")"
+
+
+def _split_multipart(body: bytes, boundary: bytes) -> List[bytes]:
+    """按分隔符切分多部分正文，分隔符前的换行属于分隔符"""
+    delimiter = re.compile(
+        rb"(?:^|\r?\n)--" + re.escape(boundary) + rb"(--)?[ \t]*(?:\r?\n|$)"
+    )
+    parts: List[bytes] = []
+    start: Optional[int] = None
+    for match in delimiter.finditer(body):
+        if start is not None:
+            parts.append(body[start : match.start()])
+        if match.group(1):
+            break
+        start = match.end()
+    return parts
+
+
+def _string(value: Any) -> bytes:
+    """IMAP 字符串：None 为 NIL，含非 ASCII 或换行时使用字面量"""
+    if value is None:
+        return b"NIL"
+    data = value if isinstance(value, bytes) else str(value).encode("utf-8")
+    if data.isascii() and b"\r" not in data and b"\n" not in data:
+        return b'"' + data.replace(b"\\", b"\\\\").replace(b'"', b'\\"') + b'"'
+    return b"{%d}\r\n" % len(data) + data
+
+
+def _join(items: List[bytes]) -> bytes:
+    return b" ".join(items)
+
+
+def _params(headers: Message, header: str) -> bytes:
+    """头部参数列表，RFC 2231 编码的值解码后输出"""
+    params = headers.get_params(header=header) or []
+    items: List[bytes] = []
+    for key, value in params[1:]:
+        items += [
+            _string(key.upper()),
+            _string(email.utils.collapse_rfc2231_value(value)),
+        ]
+    return b"(" + _join(items) + b")" if items else b"NIL"
+
+
+def _disposition(headers: Message) -> bytes:
+    disposition = headers.get_content_disposition()
+    if disposition is None:
+        return b"NIL"
+    return (
+        b"("
+        + _join(
+            [
+                _string(disposition.upper()),
+                _params(headers, "content-disposition"),
+            ]
+        )
+        + b")"
+    )
+
+
+# ---------------------------------------------------------------- IMAP
+
+
+class StoredMessage:
+    """邮箱中的一封邮件"""
+
+    def __init__(self, uid: int, raw: bytes, flags: Set[str]):
+        self.uid = uid
+        self.raw = raw
+        self.flags = flags
+        self.part = MimePart(raw)
+        self.bodystructure = self.part.structure()
+        # 放入邮箱的时间（time.monotonic），用于统计端到端延迟
+        self.arrived = time.monotonic()
+
+
+class FakeMailbox:
+    """内存中的单个文件夹，所有会话共享"""
+
+    def __init__(self, uidvalidity: int = 1):
+        self.uidvalidity = uidvalidity
+        self.messages: List[StoredMessage] = []
+        self.next_uid = 1
+        self.lock = threading.RLock()
+        # 第一次 SEARCH 后设置，表示客户端已完成启动
+        self.searched = threading.Event()
+        self._listeners: Set[socket.socket] = set()
+
+    def append(self, raw: bytes, seen: bool = False) -> int:
+        """
+        放入一封邮件并通知处于 IDLE 的会话
+
+        Returns:
+            邮件 UID
+        """
+        with self.lock:
+            message = StoredMessage(self.next_uid, raw, {"\\Seen"} if seen else set())
+            self.messages.append(message)
+            self.next_uid += 1
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener.send(b"!")
+            except OSError:
+                pass
+        return message.uid
+
+    def seen_count(self) -> int:
+        """已标记为已读的邮件数"""
+        with self.lock:
+            return sum("\\Seen" in message.flags for message in self.messages)
+
+    def add_listener(self, listener: socket.socket) -> None:
+        with self.lock:
+            self._listeners.add(listener)
+
+    def remove_listener(self, listener: socket.socket) -> None:
+        with self.lock:
+            self._listeners.discard(listener)
+
+
+class _Literal(bytes):
+    """命令中的字面量"""
+
+
+def _tokenize(data: bytes) -> List[Any]:
+    """
+    把 IMAP 命令切分为嵌套列表：原子和带引号的字符串为 str，字面量为 bytes；
+    原子中的方括号部分（如 BODY.PEEK[HEADER.FIELDS (FROM)]）整体保留
+    """
+    stack: List[List[Any]] = [[]]
+    pos = 0
+    while pos < len(data):
+        char = data[pos : pos + 1]
+        if char in (b" ", b"\r", b"\n"):
+            pos += 1
+        elif char == b"(":
+            stack.append([])
+            pos += 1
+        elif char == b")":
+            inner = stack.pop()
+            stack[-1].append(inner)
+            pos += 1
+        elif char == b'"':
+            pos += 1
+            value = bytearray()
+            while data[pos : pos + 1] != b'"':
+                if data[pos : pos + 1] == b"\\":
+                    pos += 1
+                value += data[pos : pos + 1]
+                pos += 1
+            stack[-1].append(value.decode("utf-8", "replace"))
+            pos += 1
+        elif char == b"{":
+            match = re.compile(rb"\{(\d+)\+?\}\r\n").match(data, pos)
+            if match is None:
+                raise ValueError("bad literal")
+            end = match.end() + int(match.group(1))
+            stack[-1].append(_Literal(data[match.end() : end]))
+            pos = end
+        else:
+            start = pos
+            depth = 0
+            while pos < len(data):
+                char = data[pos : pos + 1]
+                if char == b"[":
+                    depth += 1
+                elif char == b"]":
+                    depth -= 1
+                elif depth == 0 and char in (b" ", b"(", b")", b"\r", b"\n"):
+                    break
+                pos += 1
+            stack[-1].append(data[start:pos].decode("utf-8", "replace"))
+    return stack[0]
+
+
+def _parse_set(spec: str, largest: int) -> List[Tuple[int, int]]:
+    """解析序号/UID 集合（如 1,3:5,7:*），返回闭区间列表"""
+    ranges = []
+    for item in spec.split(","):
+        low, _, high = item.partition(":")
+        start = largest if low == "*" else int(low)
+        end = start if not high else (largest if high == "*" else int(high))
+        ranges.append((min(start, end), max(start, end)))
+    return ranges
+
+
+def _in_set(value: int, ranges: List[Tuple[int, int]]) -> bool:
+    return any(low <= value <= high for low, high in ranges)
+
+
+class _IMAPHandler(socketserver.BaseRequestHandler):
+    """一个 IMAP 会话"""
+
+    server: "_IMAPServer"
+
+    def setup(self) -> None:
+        if self.server.ssl_context is not None:
+            self.request = self.server.ssl_context.wrap_socket(
+                self.request, server_side=True
+            )
+        self.mailbox = self.server.mailbox
+        self.buffer = b""
+        self.selected = False
+        # 已通知本会话的邮件数
+        self.known = 0
+
+    # -- 读写
+
+    def _send(self, data: bytes) -> None:
+        self.request.sendall(data)
+
+    def _fill(self) -> bool:
+        chunk = self.request.recv(65536)
+        if not chunk:
+            return False
+        self.buffer += chunk
+        return True
+
+    def _readline(self) -> Optional[bytes]:
+        while b"\n" not in self.buffer:
+            if not self._fill():
+                return None
+        line, _, self.buffer = self.buffer.partition(b"\n")
+        return line + b"\n"
+
+    def _read_command(self) -> Optional[bytes]:
+        """读取一条命令，包括其中的字面量"""
+        data = b""
+        while True:
+            line = self._readline()
+            if line is None:
+                return None
+            data += line
+            match = _LITERAL.search(line)
+            if not match:
+                return data
+            if not match.group(2):
+                self._send(b"+ Ready for literal data\r\n")
+            size = int(match.group(1))
+            while len(self.buffer) < size:
+                if not self._fill():
+                    return None
+            data += self.buffer[:size]
+            self.buffer = self.buffer[size:]
+
+    def _readable(self, waker: socket.socket, timeout: Optional[float]) -> bool:
+        """等待客户端数据或邮箱变化，有客户端数据时返回True"""
+        if self.buffer or self.request.pending():
+            return True
+        readable, _, _ = select.select([self.request, waker], [], [], timeout)
+        if waker in readable:
+            waker.recv(4096)
+        return self.request in readable
+
+    # -- 会话
+
+    def handle(self) -> None:
+        try:
+            self._send(
+                b"* OK [CAPABILITY IMAP4rev1 IDLE UIDPLUS LITERAL+] Fake IMAP ready\r\n"
+            )
+            while True:
+                data = self._read_command()
+                if data is None:
+                    return
+                tokens = _tokenize(data)
+                if len(tokens) < 2:
+                    self._send(b"* BAD empty command\r\n")
+                    continue
+                tag = str(tokens[0]).encode()
+                if not self._dispatch(tag, str(tokens[1]).upper(), tokens[2:]):
+                    return
+        except (OSError, ssl.SSLError):
+            return
+
+    def _dispatch(self, tag: bytes, command: str, args: List[Any]) -> bool:
+        """执行一条命令，返回False表示会话结束"""
+        uid = False
+        if command == "UID" and args:
+            uid, command, args = True, str(args[0]).upper(), args[1:]
+        if command == "LOGOUT":
+            self._send(b"* BYE logging out\r\n" + tag + b" OK LOGOUT completed\r\n")
+            return False
+        handlers: Dict[str, Callable[..., bytes]] = {
+            "CAPABILITY": self._capability,
+            "LOGIN": self._login,
+            "NOOP": self._noop,
+            "CHECK": self._noop,
+            "SELECT": self._select,
+            "EXAMINE": self._select,
+            "SEARCH": self._search,
+            "FETCH": self._fetch,
+            "STORE": self._store,
+            "IDLE": self._idle,
+        }
+        handler = handlers.get(command)
+        if handler is None or (
+            command in ("SEARCH", "FETCH", "STORE") and not self.selected
+        ):
+            self._send(tag + b" BAD unsupported command " + command.encode() + b"\r\n")
+            return True
+        try:
+            result = (
+                handler(args, uid)
+                if command in ("SEARCH", "FETCH", "STORE")
+                else handler(args)
+            )
+        except (ValueError, IndexError, TypeError) as e:
+            self._send(tag + f" BAD {e}\r\n".encode())
+            return True
+        self._send(tag + b" " + result + b"\r\n")
+        return True
+
+    def _capability(self, args: List[Any]) -> bytes:
+        self._send(b"* CAPABILITY IMAP4rev1 IDLE UIDPLUS LITERAL+\r\n")
+        return b"OK CAPABILITY completed"
+
+    def _login(self, args: List[Any]) -> bytes:
+        if len(args) != 2:
+            raise ValueError("LOGIN expects user and password")
+        return b"OK LOGIN completed"
+
+    def _exists_update(self) -> bytes:
+        """有新邮件时返回 EXISTS 推送"""
+        with self.mailbox.lock:
+            count = len(self.mailbox.messages)
+        if not self.selected or count == self.known:
+            return b""
+        self.known = count
+        return b"* %d EXISTS\r\n" % count
+
+    def _noop(self, args: List[Any]) -> bytes:
+        self._send(self._exists_update())
+        return b"OK NOOP completed"
+
+    def _select(self, args: List[Any]) -> bytes:
+        mailbox = self.mailbox
+        with mailbox.lock:
+            self.known = len(mailbox.messages)
+            uidnext = mailbox.next_uid
+        self.selected = True
+        self._send(
+            b"* FLAGS (\\Answered \\Flagged \\Deleted \\Seen \\Draft)\r\n"
+            b"* OK [PERMANENTFLAGS (\\Answered \\Flagged \\Deleted \\Seen \\Draft)] ok\r\n"
+            b"* %d EXISTS\r\n* 0 RECENT\r\n"
+            b"* OK [UIDVALIDITY %d] ok\r\n* OK [UIDNEXT %d] ok\r\n"
+            % (self.known, mailbox.uidvalidity, uidnext)
+        )
+        return b"OK [READ-WRITE] SELECT completed"
+
+    def _select_messages(self, spec: str, uid: bool) -> List[Tuple[int, StoredMessage]]:
+        """按集合选出 (序号, 邮件)"""
+        messages = self.mailbox.messages
+        if uid:
+            largest = messages[-1].uid if messages else 0
+            ranges = _parse_set(spec, largest)
+            return [
+                (seq, message)
+                for seq, message in enumerate(messages, 1)
+                if _in_set(message.uid, ranges)
+            ]
+        ranges = _parse_set(spec, len(messages))
+        return [
+            (seq, message)
+            for seq, message in enumerate(messages, 1)
+            if _in_set(seq, ranges)
+        ]
+
+    def _matches(
+        self, criteria: List[Any], seq: int, message: StoredMessage, total: int
+    ) -> Tuple[bool, List[Any]]:
+        """匹配第一个搜索条件，返回 (是否匹配, 剩余条件)"""
+        key = criteria[0]
+        rest = criteria[1:]
+        if isinstance(key, list):
+            return self._match_all(key, seq, message, total), rest
+        key = key.upper()
+        if key == "ALL":
+            return True, rest
+        if key in ("SEEN", "UNSEEN"):
+            return ("\\Seen" in message.flags) == (key == "SEEN"), rest
+        if key == "UID":
+            largest = self.mailbox.messages[-1].uid if self.mailbox.messages else 0
+            return _in_set(message.uid, _parse_set(rest[0], largest)), rest[1:]
+        if key == "NOT":
+            matched, rest = self._matches(rest, seq, message, total)
+            return not matched, rest
+        if key == "OR":
+            first, rest = self._matches(rest, seq, message, total)
+            second, rest = self._matches(rest, seq, message, total)
+            return first or second, rest
+        if re.fullmatch(r"[0-9*:,]+", key):
+            return _in_set(seq, _parse_set(key, total)), rest
+        raise ValueError(f"unsupported search key {key}")
+
+    def _match_all(
+        self, criteria: List[Any], seq: int, message: StoredMessage, total: int
+    ) -> bool:
+        matched = True
+        while criteria:
+            result, criteria = self._matches(criteria, seq, message, total)
+            matched = matched and result
+        return matched
+
+    def _search(self, args: List[Any], uid: bool) -> bytes:
+        if args and str(args[0]).upper() == "CHARSET":
+            args = args[2:]
+        with self.mailbox.lock:
+            messages = self.mailbox.messages
+            found = [
+                message.uid if uid else seq
+                for seq, message in enumerate(messages, 1)
+                if self._match_all(list(args) or ["ALL"], seq, message, len(messages))
+            ]
+        self.mailbox.searched.set()
+        self._send(b"* SEARCH" + b"".join(b" %d" % n for n in found) + b"\r\n")
+        return b"OK SEARCH completed"
+
+    def _fetch_item(self, item: str, message: StoredMessage) -> List[bytes]:
+        """一个数据项的响应，返回 [名称, 值]"""
+        name = item.upper()
+        if name == "UID":
+            return []
+        if name == "FLAGS":
+            return [b"FLAGS", b"(" + " ".join(sorted(message.flags)).encode() + b")"]
+        if name == "RFC822.SIZE":
+            return [name.encode(), str(len(message.raw)).encode()]
+        if name == "INTERNALDATE":
+            return [name.encode(), b'"01-Jan-2024 10:00:00 +0800"']
+        if name in ("BODYSTRUCTURE", "BODY"):
+            return [name.encode(), message.bodystructure]
+        if name in ("RFC822", "RFC822.HEADER", "RFC822.TEXT"):
+            data = {
+                "RFC822": message.raw,
+                "RFC822.HEADER": message.part.header,
+                "RFC822.TEXT": message.part.body,
+            }[name]
+            if name != "RFC822.HEADER":
+                message.flags.add("\\Seen")
+            return [name.encode(), b"{%d}\r\n" % len(data) + data]
+        match = _SECTION.match(item)
+        if match is None:
+            raise ValueError(f"unsupported fetch item {item}")
+        peek, path, text, start, length = match.groups()
+        numbers = [int(n) for n in path.split(".") if n]
+        part = message.part.find(numbers)
+        if part is None:
+            data = b""
+        elif text is None:
+            data = part.body if numbers else message.raw
+        elif text.upper() in ("HEADER", "MIME"):
+            data = part.header
+        else:
+            data = part.body
+        section = path.rstrip(".") + ("." if path and text else "") + (text or "")
+        label = f"BODY[{section.upper()}]"
+        if start is not None:
+            data = data[int(start) : int(start) + int(length)]
+            label += f"<{start}>"
+        if peek.upper() == "BODY":
+            message.flags.add("\\Seen")
+        return [label.encode(), b"{%d}\r\n" % len(data) + data]
+
+    def _fetch(self, args: List[Any], uid: bool) -> bytes:
+        spec, items = args[0], args[1]
+        if not isinstance(items, list):
+            items = {"FAST": ["FLAGS", "INTERNALDATE", "RFC822.SIZE"]}.get(
+                items.upper(), [items]
+            )
+        lines = []
+        with self.mailbox.lock:
+            for seq, message in self._select_messages(spec, uid):
+                fields = [b"UID", str(message.uid).encode()]
+                for item in items:
+                    fields += self._fetch_item(item, message)
+                lines.append(b"* %d FETCH (" % seq + _join(fields) + b")\r\n")
+        self._send(b"".join(lines))
+        return b"OK FETCH completed"
+
+    def _store(self, args: List[Any], uid: bool) -> bytes:
+        spec, action, flags = args[0], args[1].upper(), args[2]
+        flags = set(flags if isinstance(flags, list) else [flags])
+        lines = []
+        with self.mailbox.lock:
+            for seq, message in self._select_messages(spec, uid):
+                if action.startswith("+"):
+                    message.flags |= flags
+                elif action.startswith("-"):
+                    message.flags -= flags
+                else:
+                    message.flags = set(flags)
+                if not action.endswith(".SILENT"):
+                    lines.append(
+                        b"* %d FETCH (UID %d FLAGS (%s))\r\n"
+                        % (seq, message.uid, " ".join(sorted(message.flags)).encode())
+                    )
+        self._send(b"".join(lines))
+        return b"OK STORE completed"
+
+    def _idle(self, args: List[Any]) -> bytes:
+        """进入 IDLE，邮箱有新邮件时立即推送 EXISTS，直到客户端发送 DONE"""
+        waker, notifier = socket.socketpair()
+        self.mailbox.add_listener(notifier)
+        try:
+            self._send(b"+ idling\r\n")
+            while True:
+                self._send(self._exists_update())
+                if not self._readable(waker, None):
+                    continue
+                line = self._readline()
+                if line is None:
+                    raise OSError("connection closed during IDLE")
+                if line.strip().upper() == b"DONE":
+                    return b"OK IDLE terminated"
+        finally:
+            self.mailbox.remove_listener(notifier)
+            waker.close()
+            notifier.close()
+
+
+class _IMAPServer(_TLSServer):
+    mailbox: FakeMailbox
+
+
+class FakeIMAPServer(_BackgroundServer):
+    """在后台线程中运行的假 IMAP 服务器"""
+
+    def __init__(
+        self,
+        mailbox: Optional[FakeMailbox] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        ssl_context: Optional[ssl.SSLContext] = None,
+    ):
+        """
+        启动服务器
+
+        Args:
+            mailbox: 邮箱，默认新建空邮箱
+            host: 监听地址
+            port: 监听端口，0 表示由系统分配
+            ssl_context: TLS 上下文，默认使用测试证书
+        """
+        self.mailbox = mailbox or FakeMailbox()
+        server = _IMAPServer(
+            (host, port), _IMAPHandler, ssl_context or server_ssl_context()
+        )
+        server.mailbox = self.mailbox
+        self._serve(server, "fake-imap")
+
+
+# ---------------------------------------------------------------- SMTP
+
+
+class Delivery:
+    """SMTP 接收端收到的一封邮件"""
+
+    def __init__(self, mail_from: str, rcpt_to: List[str], data: bytes):
+        self.mail_from = mail_from
+        self.rcpt_to = rcpt_to
+        self.data = data
+        # 收到的时间（time.monotonic）
+        self.received = time.monotonic()
+
+    @property
+    def subject(self) -> str:
+        return BytesHeaderParser().parsebytes(self.data).get("Subject", "")
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """一个 SMTP 会话"""
+
+    server: "_SMTPServer"
+
+    def setup(self) -> None:
+        if self.server.ssl_context is not None:
+            self.request = self.server.ssl_context.wrap_socket(
+                self.request, server_side=True
+            )
+        super().setup()
+
+    def _reply(self, line: str) -> None:
+        self.wfile.write(line.encode() + b"\r\n")
+        self.wfile.flush()
+
+    def _line(self) -> Optional[str]:
+        line = self.rfile.readline()
+        return line.decode("utf-8", "replace").rstrip("\r\n") if line else None
+
+    def handle(self) -> None:
+        try:
+            self._session()
+        except (OSError, ssl.SSLError):
+            return
+
+    def _session(self) -> None:
+        self._reply("220 fake-smtp ESMTP ready")
+        mail_from = ""
+        rcpt_to: List[str] = []
+        while True:
+            line = self._line()
+            if line is None:
+                return
+            verb, _, arg = line.partition(" ")
+            verb = verb.upper()
+            if verb == "EHLO":
+                self.wfile.write(
+                    b"250-fake-smtp\r\n250-AUTH PLAIN LOGIN\r\n250-8BITMIME\r\n"
+                    b"250 SIZE 104857600\r\n"
+                )
+                self.wfile.flush()
+            elif verb == "HELO":
+                self._reply("250 fake-smtp")
+            elif verb == "AUTH":
+                mechanism, _, initial = arg.partition(" ")
+                if mechanism.upper() == "LOGIN":
+                    for prompt in ("Username:", "Password:"):
+                        self._reply("334 " + base64.b64encode(prompt.encode()).decode())
+                        if self._line() is None:
+                            return
+                elif not initial:
+                    self._reply("334 ")
+                    if self._line() is None:
+                        return
+                self._reply("235 Authentication successful")
+            elif verb == "MAIL":
+                mail_from, rcpt_to = arg.partition(":")[2].strip(" <>"), []
+                self._reply("250 OK")
+            elif verb == "RCPT":
+                rcpt_to.append(arg.partition(":")[2].strip(" <>"))
+                self._reply("250 OK")
+            elif verb == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                chunks = []
+                while True:
+                    data = self.rfile.readline()
+                    if not data:
+                        return
+                    if data in (b".\r\n", b".\n"):
+                        break
+                    chunks.append(data[1:] if data.startswith(b".") else data)
+                self.server.deliver(Delivery(mail_from, rcpt_to, b"".join(chunks)))
+                self._reply("250 OK queued")
+            elif verb in ("RSET", "NOOP"):
+                self._reply("250 OK")
+            elif verb == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+
+class _SMTPServer(_TLSServer):
+    deliver: Callable[[Delivery], None]
+
+
+class SMTPSink(_BackgroundServer):
+    """接受所有投递并记录在内存中的 SMTP 服务器（隐式 TLS，对应 SMTP_SSL）"""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        ssl_context: Optional[ssl.SSLContext] = None,
+    ):
+        """
+        启动服务器
+
+        Args:
+            host: 监听地址
+            port: 监听端口，0 表示由系统分配
+            ssl_context: TLS 上下文，默认使用测试证书
+        """
+        self.deliveries: List[Delivery] = []
+        self._cond = threading.Condition()
+        server = _SMTPServer(
+            (host, port), _SMTPHandler, ssl_context or server_ssl_context()
+        )
+        server.deliver = self._deliver
+        self._serve(server, "fake-smtp")
+
+    def _deliver(self, delivery: Delivery) -> None:
+        with self._cond:
+            self.deliveries.append(delivery)
+            self._cond.notify_all()
+
+    def wait_for(self, count: int, timeout: float) -> bool:
+        """
+        等待收到指定数量的邮件
+
+        Returns:
+            在超时前收到返回True
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: len(self.deliveries) >= count, timeout)
+
+
+# ---------------------------------------------------------------- LLM
+
+
+class _LLMHandler(BaseHTTPRequestHandler):
+    """OpenAI 兼容的 Chat Completions 接口"""
+
+    protocol_version = "HTTP/1.1"
+    server: "_LLMHTTPServer"
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        fake = self.server.fake
+        fake.count_request()
+        prompt_tokens = (
+            sum(
+                len(str(message.get("content") or ""))
+                for message in request.get("messages", [])
+            )
+            // 4
+        )
+        reply = fake.reply
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(reply) // 4,
+            "total_tokens": prompt_tokens + len(reply) // 4,
+        }
+        model = request.get("model", "fake")
+        time.sleep(fake.latency)
+        if request.get("stream"):
+            self._stream(model, reply, usage, fake.stream_chunks)
+            return
+        body = json.dumps(
+            {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": reply},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": usage,
+            },
+            ensure_ascii=False,
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(
+        self, model: str, reply: str, usage: Dict[str, int], chunks: int
+    ) -> None:
+        """以 SSE 分块返回，最后一块带用量"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        size = max(1, -(-len(reply) // max(1, chunks)))
+        pieces = [reply[i : i + size] for i in range(0, len(reply), size)]
+        for index, piece in enumerate(pieces + [""]):
+            last = index == len(pieces)
+            chunk = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "delta": {} if last else {"content": piece},
+                        "finish_reason": "stop" if last else None,
+                    }
+                ],
+            }
+            if last:
+                chunk["usage"] = usage
+            self.wfile.write(
+                b"data: " + json.dumps(chunk, ensure_ascii=False).encode() + b"\n\n"
+            )
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def log_message(self, format: str, *args: Any) -> None:
+        """不写访问日志"""
+
+
+class _LLMHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    fake: "FakeLLMServer"
+
+
+class FakeLLMServer(_BackgroundServer):
+    """延迟可配置的假 LLM 服务"""
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        reply: str = "【聊天总结】双方约定晚上一起吃饭。",
+        stream_chunks: int = 8,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        """
+        启动服务
+
+        Args:
+            latency: 每次请求返回前的等待时间（秒）
+            reply: 返回的内容
+            stream_chunks: 流式返回时分成的块数
+            host: 监听地址
+            port: 监听端口，0 表示由系统分配
+        """
+        self.latency = latency
+        self.reply = reply
+        self.stream_chunks = stream_chunks
+        self.requests = 0
+        self._lock = threading.Lock()
+        server = _LLMHTTPServer((host, port), _LLMHandler)
+        server.fake = self
+        self._serve(server, "fake-llm")
+        self.base_url = f"http://{host}:{self.port}/v1"
+
+    def count_request(self) -> None:
+        with self._lock:
+            self.requests += 1
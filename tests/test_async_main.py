@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+测试 asyncio 引擎
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, Mock
+
+from app.async_main import AsyncEmailForwarderBot
+from app.email_record import EmailRecord
+
+
+class TestAsyncEmailForwarderBot(unittest.IsolatedAsyncioTestCase):
+    """测试异步机器人的并发处理"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.bot = AsyncEmailForwarderBot()
+        self.bot.fetcher = Mock()
+        self.bot.fetcher.fetch_chunk_size = 50
+        self.bot.sender = Mock()
+        self.bot.processor = Mock()
+        self.bot.sender.send_email.return_value = True
+
+    async def test_emails_processed_as_concurrent_tasks(self):
+        """测试多封邮件的LLM调用在同一事件循环中并发进行"""
+        active = 0
+        peak = 0
+
+        async def process_async(email_info):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.05)
+            active -= 1
+            return email_info
+
+        self.bot.processor.process_async = AsyncMock(side_effect=process_async)
+        self.bot.fetcher.search_new_emails.return_value = [1, 2, 3, 4]
+        self.bot.fetcher.fetch_emails_by_uids.return_value = {
+            uid: b"raw" for uid in (1, 2, 3, 4)
+        }
+        self.bot.fetcher.parse_raw_email.side_effect = lambda raw, uid: EmailRecord(
+            raw_subject="hi", uid=uid
+        )
+
+        await self.bot._check_new_emails()
+        await asyncio.gather(*self.bot._tasks)
+
+        self.assertEqual(peak, 4)
+        self.assertEqual(self.bot.sender.send_email.call_count, 4)
+        self.assertEqual(self.bot.fetcher.mark_as_read.call_count, 4)
+
+    async def test_concurrency_limit(self):
+        """测试并发LLM调用数不超过上限"""
+        self.bot._slots = asyncio.Semaphore(2)
+        active = 0
+        peak = 0
+
+        async def process_async(email_info):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.02)
+            active -= 1
+            return email_info
+
+        self.bot.processor.process_async = AsyncMock(side_effect=process_async)
+        self.bot.fetcher.search_new_emails.return_value = [1, 2, 3, 4, 5]
+        self.bot.fetcher.fetch_emails_by_uids.return_value = {
+            uid: b"raw" for uid in range(1, 6)
+        }
+        self.bot.fetcher.parse_raw_email.side_effect = lambda raw, uid: EmailRecord(
+            raw_subject="hi", uid=uid
+        )
+
+        await self.bot._check_new_emails()
+        await asyncio.gather(*self.bot._tasks)
+
+        self.assertEqual(peak, 2)
+
+    async def test_backlog_fetched_in_chunks(self):
+        """测试积压邮件分批获取"""
+        self.bot.fetcher.fetch_chunk_size = 2
+        self.bot.processor.process_async = AsyncMock(side_effect=lambda e: e)
+        self.bot.fetcher.search_new_emails.return_value = [1, 2, 3, 4, 5]
+        self.bot.fetcher.fetch_emails_by_uids.side_effect = lambda uids: {
+            uid: b"raw" for uid in uids
+        }
+        self.bot.fetcher.parse_raw_email.side_effect = lambda raw, uid: EmailRecord(
+            raw_subject="hi", uid=uid
+        )
+
+        await self.bot._check_new_emails()
+        await asyncio.gather(*self.bot._tasks)
+
+        self.assertEqual(
+            [c.args[0] for c in self.bot.fetcher.fetch_emails_by_uids.call_args_list],
+            [[1, 2], [3, 4], [5]],
+        )
+        self.assertEqual(self.bot.sender.send_email.call_count, 5)
+
+    async def test_own_reply_is_skipped(self):
+        """测试以[EmailLLM]开头的邮件被跳过"""
+        self.bot.processor.process_async = AsyncMock()
+
+        await self.bot._handle_new_email(
+            EmailRecord(raw_subject="[EmailLLM] 回复", uid=1)
+        )
+
+        self.bot.processor.process_async.assert_not_called()
+        self.bot.sender.send_email.assert_not_called()
+
+    async def test_not_marked_read_when_send_fails(self):
+        """测试发送失败时不标记已读"""
+        self.bot.processor.process_async = AsyncMock(side_effect=lambda e: e)
+        self.bot.sender.send_email.return_value = False
+
+        await self.bot._handle_new_email(EmailRecord(raw_subject="普通邮件", uid=9))
+
+        self.bot.fetcher.mark_as_read.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+测试附件文本提取
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+from email.message import EmailMessage
+
+from app.attachment_text import (
+    TRUNCATED_NOTE,
+    attachment_kind,
+    encoded_size,
+    extract_attachment_text,
+)
+from app.mail_parser import parse_email
+
+LIMITS = {"txt": 4096, "csv": 4096, "html": 4096}
+
+
+def build_export_email(data: bytes, filename: str, subtype: str = "plain") -> bytes:
+    """构造一封正文为空、聊天记录作为附件的邮件"""
+    message = EmailMessage()
+    message["Subject"] = "聊天记录"
+    message["From"] = "a@example.com"
+    message["To"] = "b@example.com"
+    message.set_content("")
+    message.add_attachment(data, maintype="text", subtype=subtype, filename=filename)
+    return message.as_bytes()
+
+
+def attachment_part(data: bytes, filename: str = "chat.txt"):
+    """返回只含一个 base64 附件的 MIME 部分"""
+    message = EmailMessage()
+    message.add_attachment(
+        data, maintype="application", subtype="octet-stream", filename=filename
+    )
+    return next(message.iter_attachments())
+
+
+class TestAttachmentKind(unittest.TestCase):
+    """测试附件类型识别"""
+
+    def test_extension_takes_precedence(self):
+        """测试按扩展名识别，未知扩展名时按 Content-Type 识别"""
+        self.assertEqual(attachment_kind("聊天.TXT", "application/octet-stream"), "txt")
+        self.assertEqual(attachment_kind("export.csv", "text/plain"), "csv")
+        self.assertEqual(attachment_kind("chat", "text/html"), "html")
+        self.assertIsNone(attachment_kind("截图.png", "image/png"))
+
+
+class TestExtractAttachmentText(unittest.TestCase):
+    """测试单个附件的文本提取"""
+
+    def test_gbk_text_decoded(self):
+        """测试未声明字符集的 GBK 文件"""
+        part = attachment_part("小明: 在吗？\n".encode("gbk"))
+
+        text = extract_attachment_text(part, "chat.txt", "txt", 4096)
+
+        self.assertEqual(text, "[附件: chat.txt]\n小明: 在吗？")
+
+    def test_csv_rows_joined(self):
+        """测试 CSV 每行转换为一行文本"""
+        data = '时间,发送者,内容\n2024-01-01 10:00,小明,"在吗，吃了吗"\n'.encode()
+
+        text = extract_attachment_text(attachment_part(data), "a.csv", "csv", 4096)
+
+        self.assertEqual(
+            text, "[附件: a.csv]\n时间 发送者 内容\n2024-01-01 10:00 小明 在吗，吃了吗"
+        )
+
+    def test_html_converted(self):
+        """测试 HTML 附件转换为纯文本"""
+        data = "<html><body><p>小明: 在吗？</p></body></html>".encode()
+
+        text = extract_attachment_text(attachment_part(data), "a.html", "html", 4096)
+
+        self.assertEqual(text, "[附件: a.html]\n小明: 在吗？")
+
+    def test_truncated_at_limit(self):
+        """测试超过上限时只解码前缀，丢弃不完整的最后一行并注明截断"""
+        data = "".join(f"第{i}行: 你好\n" for i in range(5000)).encode()
+
+        text = extract_attachment_text(attachment_part(data), "a.txt", "txt", 1000)
+
+        self.assertTrue(text.endswith(TRUNCATED_NOTE))
+        lines = text.splitlines()[1:-1]
+        self.assertLessEqual(len("\n".join(lines).encode()), 1000)
+        self.assertTrue(all(line.endswith("你好") for line in lines))
+
+    def test_encoded_size_covers_limit(self):
+        """测试部分获取的编码字节数足够解码出上限字节"""
+        part = attachment_part(bytes(range(256)) * 40)
+        payload = part.get_payload()
+        self.assertGreaterEqual(
+            len(payload[: encoded_size(5000, "base64")].replace("\n", "")) // 4 * 3,
+            5000,
+        )
+
+
+class TestParseEmailAttachments(unittest.TestCase):
+    """测试解析邮件时提取附件文本"""
+
+    def test_attachment_text_appended_to_body(self):
+        """测试附件文本追加在正文之后"""
+        raw = build_export_email("小明: 在吗？\n".encode(), "chat.txt")
+
+        parsed = parse_email(raw, attachment_limits=LIMITS)
+
+        self.assertEqual(parsed.body_text, "[附件: chat.txt]\n小明: 在吗？")
+        self.assertEqual(parsed.attachments[0].filename, "chat.txt")
+
+    def test_disabled_without_limits(self):
+        """测试未传入上限或类型上限为空时不提取"""
+        raw = build_export_email("小明: 在吗？\n".encode(), "chat.txt")
+
+        self.assertEqual(parse_email(raw).body_text.strip(), "")
+        self.assertEqual(
+            parse_email(raw, attachment_limits={"csv": 4096}).body_text.strip(), ""
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
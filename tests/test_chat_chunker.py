@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+测试聊天记录分块和 map-reduce 分析
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import unittest
+from unittest.mock import Mock, patch
+
+from app.chat_chunker import (
+    REDUCE_HEADER,
+    chunk_text,
+    estimate_tokens,
+    map_reduce,
+    split_messages,
+)
+from app.email_record import EmailRecord
+from app.mail_processor import MailProcessor
+from app.rate_limiter import PRIORITY_MAP, PRIORITY_REDUCE, PRIORITY_SINGLE
+
+
+def build_log(count):
+    """构造带时间戳的聊天记录，每条消息两行"""
+    return "".join(
+        f"2024-01-01 10:{i % 60:02d}:00 小明\n第{i}条消息，内容比较长一些\n"
+        for i in range(count)
+    )
+
+
+class TestEstimateTokens(unittest.TestCase):
+    """测试 token 估算"""
+
+    def test_cjk_counts_per_character(self):
+        """测试中文按字计数，英文按字符数的四分之一计数"""
+        self.assertEqual(estimate_tokens(""), 0)
+        self.assertEqual(estimate_tokens("你好"), 2)
+        self.assertEqual(estimate_tokens("abcdefgh"), 2)
+
+
+class TestChunkText(unittest.TestCase):
+    """测试按消息边界分块"""
+
+    def test_split_messages_keeps_continuation_lines(self):
+        """测试续行归入上一条消息"""
+        messages = split_messages(build_log(3))
+        self.assertEqual(len(messages), 3)
+        self.assertIn("第1条消息", messages[1])
+        self.assertTrue(messages[1].startswith("2024-01-01 10:01:00"))
+
+    def test_short_log_is_one_chunk(self):
+        """测试短聊天记录不分块"""
+        text = build_log(3)
+        self.assertEqual(chunk_text(text, 10000), [text])
+
+    def test_long_log_splits_on_message_boundaries(self):
+        """测试长聊天记录在消息边界处切分且不丢内容"""
+        text = build_log(200)
+        chunks = chunk_text(text, 500)
+
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual("".join(chunks), text)
+        for chunk in chunks:
+            self.assertLessEqual(estimate_tokens(chunk), 500)
+            self.assertTrue(chunk.startswith("2024-01-01"))
+
+    def test_oversized_message_is_split(self):
+        """测试单条超长消息也会被切开"""
+        text = "2024-01-01 10:00 小明\n" + "哈" * 1000 + "\n"
+        chunks = chunk_text(text, 300)
+
+        self.assertEqual("".join(chunks), text)
+        for chunk in chunks:
+            self.assertLessEqual(estimate_tokens(chunk), 300)
+
+
+class TestMapReduce(unittest.TestCase):
+    """测试并发分析与合并"""
+
+    def test_single_chunk_calls_once(self):
+        """测试只有一块时直接调用一次"""
+        calls = []
+
+        async def run(text, priority):
+            calls.append((text, priority))
+            return "结果"
+
+        result = asyncio.run(map_reduce(["聊天记录"], run, 1000, 4))
+        self.assertEqual(result, "结果")
+        self.assertEqual(calls, [("聊天记录", PRIORITY_SINGLE)])
+
+    def test_maps_concurrently_then_reduces(self):
+        """测试各块并发分析（不超过并发上限），最后合并一次"""
+        active = 0
+        peak = 0
+        inputs = []
+        priorities = []
+
+        async def run(text, priority):
+            nonlocal active, peak
+            inputs.append(text)
+            priorities.append(priority)
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+            if text.startswith(REDUCE_HEADER):
+                return "合并结果"
+            return f"部分{len(inputs)}"
+
+        chunks = [f"块{i}" for i in range(6)]
+        result = asyncio.run(map_reduce(chunks, run, 1000, 3))
+
+        self.assertEqual(result, "合并结果")
+        self.assertEqual(len(inputs), 7)
+        self.assertEqual(peak, 3)
+        self.assertIn("第 1/6 部分", inputs[0])
+        self.assertTrue(inputs[-1].startswith(REDUCE_HEADER))
+        self.assertEqual(priorities, [PRIORITY_MAP] * 6 + [PRIORITY_REDUCE])
+
+    def test_large_partials_reduce_in_levels(self):
+        """测试部分结果过长时分层合并"""
+        reduce_calls = []
+
+        async def run(text, priority):
+            if text.startswith(REDUCE_HEADER):
+                reduce_calls.append(text)
+                return "合"
+            return "析" * 40
+
+        chunks = [f"块{i}" for i in range(8)]
+        result = asyncio.run(map_reduce(chunks, run, 100, 4))
+
+        self.assertEqual(result, "合")
+        self.assertGreater(len(reduce_calls), 1)
+        for text in reduce_calls:
+            self.assertLessEqual(
+                estimate_tokens(text), 100 + estimate_tokens(REDUCE_HEADER) + 40
+            )
+
+
+class TestMailProcessorChunking(unittest.TestCase):
+    """测试处理器对超长聊天记录分块"""
+
+    @patch("app.mail_processor.Runner")
+    def test_long_body_uses_map_reduce(self, mock_runner):
+        """测试超长正文分块调用LLM，短正文仍只调用一次"""
+
+        async def run(agent, text):
+            if text.startswith(REDUCE_HEADER):
+                return Mock(final_output="合并")
+            if text.startswith("以下是"):
+                return Mock(final_output="部分")
+            return Mock(final_output="单次")
+
+        mock_runner.run.side_effect = run
+        processor = MailProcessor()
+        self.addCleanup(processor.close)
+        processor.cache = None
+        processor.config = Mock(
+            LLM_STREAMING=False,
+            LLM_DEADLINE=0,
+            CHAT_PREPROCESS=False,
+            LLM_CHUNK_TOKENS=500,
+            LLM_MAP_CONCURRENCY=2,
+        )
+
+        self.assertEqual(
+            processor.process_with_llm(EmailRecord(body_text=build_log(2))), "单次"
+        )
+        self.assertEqual(mock_runner.run.call_count, 1)
+        self.assertEqual(
+            processor.process_with_llm(EmailRecord(body_text=build_log(200))), "合并"
+        )
+        self.assertGreater(mock_runner.run.call_count, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+测试聊天记录预处理
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+from unittest.mock import AsyncMock, Mock, patch
+
+from app.chat_preprocessor import preprocess_chat, preprocess_with_stats
+from app.email_record import EmailRecord
+from app.mail_processor import MailProcessor
+
+
+class TestPreprocessChat(unittest.TestCase):
+    """测试聊天记录压缩"""
+
+    def test_strips_quoted_email_and_signature(self):
+        """测试去掉引用的历史邮件、签名和客户端签名行"""
+        text = (
+            "小明: 明天开会\n"
+            "小红: 好的\n"
+            "发自我的iPhone\n"
+            "-- \n"
+            "张三 | 产品经理\n"
+            "在 2024年1月1日 10:00，张三 写道：\n"
+            "> 上一封邮件的内容\n"
+        )
+        self.assertEqual(preprocess_chat(text), "小明: 明天开会\n小红: 好的")
+
+    def test_fully_quoted_log_is_unquoted(self):
+        """测试整段被引用的聊天记录只去掉引用标记"""
+        text = "> 小明: 在吗？\n> 小红: 在的\n"
+        self.assertEqual(preprocess_chat(text), "小明: 在吗？\n小红: 在的")
+
+    def test_quoted_lines_dropped_when_own_text_exists(self):
+        """测试正文之外的引用行被去掉"""
+        text = "小明: 在吗？\n> 之前的回复\n小红: 在的\n"
+        self.assertEqual(preprocess_chat(text), "小明: 在吗？\n小红: 在的")
+
+    def test_outlook_forward_keeps_content(self):
+        """测试 Outlook 转发只去掉分隔行和原邮件头"""
+        text = (
+            "-----Original Message-----\n"
+            "From: 张三 <zs@example.com>\n"
+            "Sent: Monday, January 1, 2024 10:00 AM\n"
+            "To: bot@example.com\n"
+            "Subject: 聊天记录\n"
+            "\n"
+            "小明: 明天开会\n"
+            "小红: 好的\n"
+        )
+        self.assertEqual(preprocess_chat(text), "小明: 明天开会\n小红: 好的")
+
+    def test_qq_forward_keeps_note_and_content(self):
+        """测试 QQ 邮箱转发保留附言和分隔行之后的聊天记录"""
+        text = (
+            "请帮我分析一下\n"
+            "\n"
+            "------------------ 原始邮件 ------------------\n"
+            '发件人: "小明"<xm@qq.com>;\n'
+            "发送时间: 2024年1月1日(星期一) 上午10:00\n"
+            '收件人: "bot"<bot@example.com>;\n'
+            "主题: 聊天记录\n"
+            "\n"
+            "2024-01-01 10:00 小明\n"
+            "在吗\n"
+        )
+        self.assertEqual(
+            preprocess_chat(text), "请帮我分析一下\n\n2024-01-01 10:00 小明\n在吗"
+        )
+
+    def test_gmail_forward_keeps_content(self):
+        """测试 Gmail 转发和引用形式的转发都保留聊天记录"""
+        forwarded = (
+            "---------- Forwarded message ---------\n"
+            "From: 小明 <xm@gmail.com>\n"
+            "Date: Mon, Jan 1, 2024 at 10:00 AM\n"
+            "Subject: 聊天记录\n"
+            "To: <bot@example.com>\n"
+            "\n"
+            "\n"
+            "小明: 在吗？\n"
+            "小红: 在的\n"
+        )
+        quoted = (
+            "请帮我看看\n"
+            "\n"
+            "On Mon, Jan 1, 2024 at 10:00 AM 小明 <xm@gmail.com> wrote:\n"
+            "> 小明: 在吗？\n"
+            "> 小红: 在的\n"
+        )
+        self.assertEqual(preprocess_chat(forwarded), "小明: 在吗？\n小红: 在的")
+        self.assertEqual(
+            preprocess_chat(quoted), "请帮我看看\n\n小明: 在吗？\n小红: 在的"
+        )
+
+    def test_chat_with_dash_line_kept(self):
+        """测试聊天中的 -- 行不被当作签名分隔行"""
+        text = "2024-01-01 10:00 小明\n我们在聊\n--\n" + "小红: 好的\n" * 12
+        self.assertEqual(
+            preprocess_chat(text),
+            "2024-01-01 10:00 小明\n我们在聊\n--\n" + "\n".join(["小红: 好的"] * 12),
+        )
+
+    def test_signature_only_near_end(self):
+        """测试 "-- " 只在末尾若干行内才视为签名"""
+        chat = "".join(f"小明: 第{i}条\n" for i in range(12))
+        self.assertEqual(preprocess_chat("-- \n" + chat), "--\n" + chat.strip())
+
+    def test_dash_line_followed_by_chat_kept(self):
+        """测试 "-- " 之后有聊天内容时不视为签名"""
+        self.assertEqual(preprocess_chat("-- \n张三: hi\n"), "--\n张三: hi")
+        self.assertEqual(
+            preprocess_chat("-- \n2024-01-01 10:00 张三\nhi\n"),
+            "--\n2024-01-01 10:00 张三\nhi",
+        )
+
+    def test_drops_base64_and_system_lines(self):
+        """测试去掉 base64 残留、data URI 和系统消息"""
+        text = (
+            "小明: 看图\n" + "iVBORw0KGgoAAAANSUhEUgAA" * 4 + "\n小红 撤回了一条消息\n"
+            '小红: <img src="data:image/png;base64,iVBORw0KGgoAAAANSUhEUg==">\n'
+        )
+        self.assertEqual(preprocess_chat(text), '小明: 看图\n小红: <img src="[数据]">')
+
+    def test_chat_mentioning_system_phrases_kept(self):
+        """测试只删除整行的系统消息，聊天中提到相同词语的消息保留"""
+        text = (
+            "2024-01-01 10:00 张三\n"
+            "他拍了拍我的肩膀说明天见\n"
+            '"李四" 拍了拍 "张三"\n'
+            "2024-01-01 10:01 李四\n"
+            "好的，我会加入了群聊再说\n"
+            "王五邀请赵六加入了群聊\n"
+            "我刚才看到，他撤回了一条消息吗\n"
+            "张三撤回了一条消息\n"
+        )
+        self.assertEqual(
+            preprocess_chat(text),
+            "2024-01-01 10:00 张三\n"
+            "他拍了拍我的肩膀说明天见\n"
+            "10:01 李四\n"
+            "好的，我会加入了群聊再说\n"
+            "我刚才看到，他撤回了一条消息吗",
+        )
+
+    def test_compresses_repeated_headers(self):
+        """测试省略重复的日期、合并同一发言人的连续消息、缩短发言人标识"""
+        text = (
+            "2024-01-01 10:00:00 小明(wxid_abc123)\n"
+            "在吗\n"
+            "2024-01-01 10:00:05 小明(wxid_abc123)\n"
+            "明天开会\n"
+            "2024-01-01 10:01:00 小红(wxid_def456)\n"
+            "好的\n"
+            "2024-01-01 10:02:00 小明(wxid_abc123)\n"
+            "几点？\n"
+            "2024-01-02 09:00:00 小明(wxid_abc123)\n"
+            "早\n"
+        )
+        self.assertEqual(
+            preprocess_chat(text),
+            "2024-01-01 10:00:00 小明(wxid_abc123)\n"
+            "在吗\n"
+            "明天开会\n"
+            "10:01:00 小红(wxid_def456)\n"
+            "好的\n"
+            "10:02:00 小明\n"
+            "几点？\n"
+            "2024-01-02 09:00:00 小明\n"
+            "早",
+        )
+
+    def test_reports_token_counts(self):
+        """测试返回预处理前后的 token 估算"""
+        result = preprocess_with_stats("小明: 你好\n\n\n发自我的iPhone\n")
+        self.assertEqual(result.text, "小明: 你好")
+        self.assertLess(result.tokens_out, result.tokens_in)
+        self.assertGreater(result.saved_ratio, 0)
+
+
+class TestMailProcessorPreprocess(unittest.TestCase):
+    """测试处理器在调用LLM前预处理正文"""
+
+    @patch("app.mail_processor.Runner")
+    def test_llm_receives_preprocessed_text(self, mock_runner):
+        """测试LLM收到压缩后的文本并累计 token 统计"""
+        mock_runner.run = AsyncMock(return_value=Mock(final_output="分析结果"))
+        processor = MailProcessor()
+        processor.cache = None
+        processor.config = Mock(
+            LLM_STREAMING=False,
+            LLM_DEADLINE=0,
+            CHAT_PREPROCESS=True,
+            LLM_CHUNK_TOKENS=10000,
+            LLM_MAP_CONCURRENCY=2,
+        )
+
+        processor.process_with_llm(
+            EmailRecord(body_text="小明: 在吗？\n-- \n张三 | 产品经理\n")
+        )
+
+        self.assertEqual(mock_runner.run.call_args[0][1], "小明: 在吗？")
+        self.assertEqual(processor.stats["emails"], 1)
+        self.assertLess(processor.stats["tokens_out"], processor.stats["tokens_in"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -9,6 +9,7 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.main import EmailForwarderBot
+from app.email_record import EmailRecord
 import unittest
 from unittest.mock import Mock
 
@@ -29,7 +30,7 @@ class TestEmailFilter(unittest.TestCase):
     def test_email_with_emailllm_prefix_should_be_skipped(self):
         """测试以[EmailLLM]开头的邮件应该被跳过"""
         # 准备测试数据
-        email_info = {"subject": "[EmailLLM] 测试邮件", "uid": "12345"}
+        email_info = EmailRecord(raw_subject="[EmailLLM] 测试邮件", uid=12345)
 
         # 执行测试
         self.bot._handle_new_email(email_info)
@@ -41,13 +42,10 @@ class TestEmailFilter(unittest.TestCase):
     def test_email_without_emailllm_prefix_should_be_processed(self):
         """测试不以[EmailLLM]开头的邮件应该被处理"""
         # 准备测试数据
-        email_info = {"subject": "普通测试邮件", "uid": "12346"}
+        email_info = EmailRecord(raw_subject="普通测试邮件", uid=12346)
 
         # 模拟processor.process返回处理后的邮件
-        processed_email = {
-            "subject": "[EmailLLM] 普通测试邮件",
-            "body_text": "处理后的内容",
-        }
+        processed_email = email_info.with_body("处理后的内容")
         self.bot.processor.process.return_value = processed_email
 
         # 模拟sender.send_email返回成功
@@ -10,6 +10,7 @@ from unittest.mock import patch, MagicMock
 # 导入应用模块
 try:
     from app.config import config
+    from app.email_record import EmailRecord
     from app.mail_sender import MailSender
     from app.utils.logger import setup_logger
 except ImportError:
@@ -17,6 +18,7 @@ except ImportError:
     project_root = Path(__file__).parent.parent
     sys.path.insert(0, str(project_root))
     from app.config import config
+    from app.email_record import EmailRecord
     from app.mail_sender import MailSender
     from app.utils.logger import setup_logger
 
@@ -58,13 +60,12 @@ def test_email_sending(mock_smtp):
         sender = MailSender()
 
         # 创建测试邮件，不包含HTML内容
-        test_email = {
-            "subject": "Test Email from Email Forwarder Bot",
-            "sender": config.SOURCE_EMAIL,
-            "receiver": config.TARGET_EMAIL,
-            "body_text": "This is a test email sent from the Email Forwarder Bot.\n\n测试邮件内容。",
-            "body_html": "",  # 不再使用HTML内容
-        }
+        test_email = EmailRecord(
+            body_text="This is a test email sent from the Email Forwarder Bot.\n\n测试邮件内容。",
+            raw_subject="Test Email from Email Forwarder Bot",
+            raw_sender=config.SOURCE_EMAIL or "",
+            raw_receiver=config.TARGET_EMAIL or "",
+        )
 
         result = sender.send_email(test_email)
 
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+测试 HTML 转纯文本
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+
+from app.html_text import html_to_text, iter_html_text
+
+
+class TestHtmlToText(unittest.TestCase):
+    """测试 HTML 转文本的标签处理"""
+
+    def test_block_elements_become_lines(self):
+        """测试块级元素和换行标签各自成行，行内元素不换行"""
+        html = "<div>我：<b>在吗</b>？</div><div>她：在的<br>刚下班</div>"
+
+        self.assertEqual(html_to_text(html), "我：在吗？\n她：在的\n刚下班")
+
+    def test_scripts_and_styles_removed(self):
+        """测试去掉脚本、样式和标题"""
+        html = (
+            "<html><head><title>聊天记录</title><style>p{color:red}</style>"
+            "<script>alert('x')</script></head><body><p>你好</p></body></html>"
+        )
+
+        self.assertEqual(html_to_text(html), "你好")
+
+    def test_whitespace_collapsed_and_entities_decoded(self):
+        """测试合并空白并解码字符引用"""
+        html = "<p>  小明 \n\t &amp;&nbsp;小红  </p>\n\n<p></p>"
+
+        self.assertEqual(html_to_text(html), "小明 & 小红")
+
+    def test_streaming_yields_lines_before_end(self):
+        """测试分块输入时已完成的行立即输出"""
+
+        consumed = []
+
+        def chunks():
+            for chunk in ("<p>第一行</p><p>第", "二行</p>"):
+                consumed.append(chunk)
+                yield chunk
+
+        lines = iter_html_text(chunks())
+
+        # 第一行在第二块输入之前就已经输出
+        self.assertEqual(next(lines), "第一行")
+        self.assertEqual(len(consumed), 1)
+        self.assertEqual(list(lines), ["第二行"])
+
+
+if __name__ == "__main__":
+    unittest.main()
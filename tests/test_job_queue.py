@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+测试持久化任务队列和基于任务队列的邮件处理流水线
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from app.email_record import Attachment, EmailRecord
+from app.job_queue import DEAD, LEASED, READY, JobQueue
+from app.mail_pipeline import LLM_STAGE, SEND_STAGE, DurablePipeline
+
+
+class FakeClock:
+    """可手动推进的时钟"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestJobQueue(unittest.TestCase):
+    """测试任务队列"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.jobs = JobQueue(
+            ":memory:", visibility_timeout=60, max_attempts=2, clock=self.clock
+        )
+        self.addCleanup(self.jobs.close)
+
+    def test_enqueue_ignores_duplicates(self):
+        """测试同一队列中相同键的任务只添加一次"""
+        self.assertTrue(self.jobs.enqueue(LLM_STAGE, "a/1", {"uid": 1}))
+        self.assertFalse(self.jobs.enqueue(LLM_STAGE, "a/1", {"uid": 1}))
+        self.assertTrue(self.jobs.contains("a/1"))
+        self.assertEqual(self.jobs.counts()[READY], 1)
+
+    def test_complete_hands_off_to_next_stage(self):
+        """测试完成任务时把结果交给下一阶段"""
+        self.jobs.enqueue(LLM_STAGE, "a/1", {"uid": 1})
+        job = self.jobs.lease(LLM_STAGE)
+        self.assertEqual(job.payload, {"uid": 1})
+        self.assertEqual(job.attempts, 1)
+        self.assertIsNone(self.jobs.lease(LLM_STAGE))
+
+        self.jobs.complete(job, SEND_STAGE, {"uid": 1, "reply": "ok"})
+        self.assertIsNone(self.jobs.lease(LLM_STAGE))
+        sent = self.jobs.lease(SEND_STAGE)
+        self.assertEqual(sent.payload["reply"], "ok")
+
+        self.jobs.complete(sent)
+        self.assertFalse(self.jobs.contains("a/1"))
+
+    def test_expired_lease_becomes_visible(self):
+        """测试可见性超时后未完成的任务重新可见"""
+        self.jobs.enqueue(LLM_STAGE, "a/1", {})
+        self.jobs.lease(LLM_STAGE)
+        self.assertEqual(self.jobs.counts()[LEASED], 1)
+
+        self.clock.now += 30
+        self.assertIsNone(self.jobs.lease(LLM_STAGE))
+        self.clock.now += 31
+        job = self.jobs.lease(LLM_STAGE)
+        self.assertEqual(job.attempts, 2)
+
+        # 尝试次数用完后再次超时，进入死信状态
+        self.clock.now += 61
+        self.assertIsNone(self.jobs.lease(LLM_STAGE))
+        self.assertEqual(self.jobs.counts()[DEAD], 1)
+
+    def test_fail_retries_then_dead_letters(self):
+        """测试失败的任务延迟后重试，超过最大次数进入死信，可手动重新入队"""
+        self.jobs.enqueue(LLM_STAGE, "a/1", {})
+        job = self.jobs.lease(LLM_STAGE)
+        self.assertFalse(self.jobs.fail(job, "boom", retry_delay=10))
+        self.assertIsNone(self.jobs.lease(LLM_STAGE))
+
+        self.clock.now += 10
+        job = self.jobs.lease(LLM_STAGE)
+        self.assertTrue(self.jobs.fail(job, "boom again", retry_delay=10))
+        self.clock.now += 10
+        self.assertIsNone(self.jobs.lease(LLM_STAGE))
+
+        dead = self.jobs.dead_letters()
+        self.assertEqual(len(dead), 1)
+        self.assertEqual(dead[0]["error"], "boom again")
+        # 死信仍算作已在队列中，避免轮询时重复获取
+        self.assertTrue(self.jobs.contains("a/1"))
+
+        self.assertTrue(self.jobs.retry_dead(dead[0]["id"]))
+        self.assertEqual(self.jobs.lease(LLM_STAGE).attempts, 1)
+
+    def test_lease_round_robins_accounts(self):
+        """测试按账户轮转取出任务，繁忙邮箱不会饿死其他邮箱"""
+        for uid in range(4):
+            self.jobs.enqueue(LLM_STAGE, f"busy/{uid}", {"uid": uid}, account="busy")
+        self.jobs.enqueue(LLM_STAGE, "quiet/0", {"uid": 0}, account="quiet")
+
+        keys = [self.jobs.lease(LLM_STAGE).key for _ in range(3)]
+
+        self.assertEqual(keys, ["busy/0", "quiet/0", "busy/1"])
+        self.assertEqual(self.jobs.pending(LLM_STAGE, "busy"), 2)
+        self.assertEqual(self.jobs.pending(LLM_STAGE, "quiet"), 0)
+
+    def test_account_carried_to_next_stage(self):
+        """测试交给下一阶段的任务保留所属账户"""
+        self.jobs.enqueue(LLM_STAGE, "a/1", {"uid": 1}, account="a")
+        self.jobs.complete(self.jobs.lease(LLM_STAGE), SEND_STAGE, {"uid": 1})
+
+        self.assertEqual(self.jobs.lease(SEND_STAGE).account, "a")
+
+    def test_migrates_table_without_account(self):
+        """测试旧版本的数据库自动添加 account 列"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "jobs.sqlite3")
+            conn = sqlite3.connect(path)
+            conn.execute(
+                "CREATE TABLE jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "queue TEXT NOT NULL, key TEXT NOT NULL, payload TEXT NOT NULL, "
+                "state TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+                "visible_at REAL NOT NULL, last_error TEXT, "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL, "
+                "UNIQUE (queue, key))"
+            )
+            conn.execute(
+                "INSERT INTO jobs (queue, key, payload, state, visible_at, "
+                "created_at, updated_at) VALUES (?, '/1', '{}', ?, 0, 0, 0)",
+                (LLM_STAGE, READY),
+            )
+            conn.commit()
+            conn.close()
+
+            jobs = JobQueue(path)
+            self.addCleanup(jobs.close)
+            self.assertEqual(jobs.lease(LLM_STAGE).account, "")
+
+    def test_survives_restart(self):
+        """测试任务持久化到文件，重新打开后继续处理"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "jobs.sqlite3")
+            jobs = JobQueue(path)
+            jobs.enqueue(LLM_STAGE, "a/1", {"uid": 1})
+            jobs.close()
+
+            jobs = JobQueue(path)
+            self.addCleanup(jobs.close)
+            self.assertEqual(jobs.lease(LLM_STAGE).payload, {"uid": 1})
+
+
+class TestEmailRecordSerialization(unittest.TestCase):
+    """测试邮件记录的序列化"""
+
+    def test_round_trip(self):
+        """测试转换为字典再还原后内容不变"""
+        record = EmailRecord(
+            uid=7,
+            account="work",
+            raw_subject="聊天记录",
+            body_text="小明: 在吗？",
+            attachments=(Attachment(filename="a.txt", content_type="text/plain"),),
+        )
+        self.assertEqual(EmailRecord.from_dict(record.to_dict()), record)
+
+
+class TestDurablePipeline(unittest.TestCase):
+    """测试基于任务队列的流水线"""
+
+    def setUp(self):
+        self.jobs = JobQueue(":memory:")
+        self.addCleanup(self.jobs.close)
+
+    def test_processes_both_stages(self):
+        """测试邮件依次经过LLM阶段和发送阶段"""
+        delivered = []
+
+        def prepare(email_info):
+            return email_info.with_body(f"分析 {email_info.uid}")
+
+        def deliver(email_info):
+            delivered.append((email_info.uid, email_info.body_text))
+            return True
+
+        pipeline = DurablePipeline(
+            self.jobs, prepare, deliver, workers=2, poll_interval=0.01
+        )
+        for uid in range(3):
+            self.assertTrue(pipeline.submit(EmailRecord(uid=uid, account="a")))
+        self.assertFalse(pipeline.submit(EmailRecord(uid=0, account="a")))
+        self.assertTrue(pipeline.is_in_flight(0, "a"))
+        pipeline.start()
+        self.addCleanup(pipeline.stop)
+        pipeline.join()
+
+        self.assertEqual(sorted(delivered), [(i, f"分析 {i}") for i in range(3)])
+        self.assertFalse(pipeline.is_in_flight(0, "a"))
+
+    def test_send_failure_retries_without_rerunning_llm(self):
+        """测试发送失败只重试发送阶段，不重新调用LLM"""
+        prepared = []
+        attempts = []
+        done = threading.Event()
+
+        def prepare(email_info):
+            prepared.append(email_info.uid)
+            return email_info
+
+        def deliver(email_info):
+            attempts.append(email_info.uid)
+            if len(attempts) == 1:
+                return False
+            done.set()
+            return True
+
+        pipeline = DurablePipeline(
+            self.jobs, prepare, deliver, workers=1, retry_delay=0, poll_interval=0.01
+        )
+        pipeline.start()
+        self.addCleanup(pipeline.stop)
+        pipeline.submit(EmailRecord(uid=1))
+
+        self.assertTrue(done.wait(5))
+        pipeline.join()
+        self.assertEqual(prepared, [1])
+        self.assertEqual(attempts, [1, 1])
+
+    def test_submit_blocks_when_account_queue_full(self):
+        """测试账户排队的任务已满时阻塞该账户的提交，不影响其他账户"""
+        pipeline = DurablePipeline(
+            self.jobs, lambda e: None, lambda e: True, workers=1, queue_size=1
+        )
+        self.addCleanup(pipeline.stop)
+        self.assertTrue(pipeline.submit(EmailRecord(uid=1, account="busy")))
+        self.assertTrue(pipeline.submit(EmailRecord(uid=1, account="quiet")))
+
+        result = []
+        blocked = threading.Thread(
+            target=lambda: result.append(
+                pipeline.submit(EmailRecord(uid=2, account="busy"))
+            )
+        )
+        blocked.start()
+        blocked.join(0.2)
+        self.assertTrue(blocked.is_alive())
+
+        self.jobs.lease(LLM_STAGE)
+        blocked.join(5)
+        self.assertEqual(result, [True])
+
+    def test_stop_releases_blocked_submit(self):
+        """测试停止流水线时阻塞中的提交返回False"""
+        pipeline = DurablePipeline(
+            self.jobs, lambda e: None, lambda e: True, workers=1, queue_size=1
+        )
+        pipeline.submit(EmailRecord(uid=1, account="a"))
+        result = []
+        blocked = threading.Thread(
+            target=lambda: result.append(
+                pipeline.submit(EmailRecord(uid=2, account="a"))
+            )
+        )
+        blocked.start()
+        blocked.join(0.1)
+
+        pipeline.stop()
+        blocked.join(5)
+        self.assertEqual(result, [False])
+
+    def test_skipped_mail_completes(self):
+        """测试无需回复的邮件直接完成"""
+        pipeline = DurablePipeline(
+            self.jobs, lambda e: None, lambda e: True, workers=1, poll_interval=0.01
+        )
+        pipeline.start()
+        self.addCleanup(pipeline.stop)
+        pipeline.submit(EmailRecord(uid=1))
+        pipeline.join()
+        self.assertFalse(self.jobs.contains("/1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
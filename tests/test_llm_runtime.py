@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+测试LLM运行时：常驻事件循环和带计时的模型封装
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, Mock, patch
+
+from app.email_record import EmailRecord
+from app.llm_runtime import BackgroundLoop, TimedModel, mark_call_start
+from app.mail_processor import MailProcessor
+
+
+class FakeModel:
+    """本地假模型，记录调用次数"""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = 0
+
+    async def get_response(self, *args, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        if self.fail:
+            raise RuntimeError("backend down")
+        return "response"
+
+    async def stream_response(self, *args, **kwargs):
+        self.calls += 1
+        for event in ("a", "b"):
+            yield event
+
+
+class TestBackgroundLoop(unittest.TestCase):
+    """测试常驻事件循环"""
+
+    def test_calls_share_one_loop(self):
+        """测试多次调用在同一个事件循环中执行"""
+        loop = BackgroundLoop()
+        self.addCleanup(loop.close)
+
+        async def current_loop():
+            return asyncio.get_running_loop()
+
+        self.assertIs(loop.run(current_loop()), loop.run(current_loop()))
+
+    def test_exception_is_propagated(self):
+        """测试协程中的异常抛给调用方"""
+        loop = BackgroundLoop()
+        self.addCleanup(loop.close)
+
+        async def fail():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            loop.run(fail())
+
+
+class TestTimedModel(unittest.TestCase):
+    """测试模型封装的创建和计时"""
+
+    def test_model_created_once_and_timed(self):
+        """测试底层模型只创建一次，并记录准备耗时和响应耗时"""
+        fake = FakeModel()
+        provider = Mock()
+        provider.get_model.return_value = fake
+        model = TimedModel("fake-model", provider=provider)
+
+        async def call():
+            mark_call_start()
+            await asyncio.sleep(0.02)
+            return await model.get_response()
+
+        asyncio.run(call())
+        asyncio.run(call())
+
+        provider.get_model.assert_called_once_with("fake-model")
+        self.assertEqual(fake.calls, 2)
+        summary = model.summary()
+        self.assertEqual(summary["calls"], 2)
+        self.assertGreaterEqual(summary["avg_setup_seconds"], 0.02)
+        self.assertGreaterEqual(summary["avg_response_seconds"], 0.01)
+
+    def test_errors_counted(self):
+        """测试底层模型出错时计数并抛出"""
+        provider = Mock()
+        provider.get_model.return_value = FakeModel(fail=True)
+        model = TimedModel(None, provider=provider)
+
+        with self.assertRaises(RuntimeError):
+            asyncio.run(model.get_response())
+        self.assertEqual(model.summary()["errors"], 1)
+
+    def test_stream_response_forwards_events(self):
+        """测试流式接口原样转发事件"""
+        provider = Mock()
+        provider.get_model.return_value = FakeModel()
+        model = TimedModel(None, provider=provider)
+
+        async def collect():
+            return [event async for event in model.stream_response()]
+
+        self.assertEqual(asyncio.run(collect()), ["a", "b"])
+        self.assertEqual(model.summary()["calls"], 1)
+
+
+class TestMailProcessorReuse(unittest.TestCase):
+    """测试处理器在多封邮件之间复用Agent"""
+
+    @patch("app.mail_processor.Runner")
+    def test_agent_reused_across_emails(self, mock_runner):
+        """测试每封邮件使用同一个Agent，且在同一个事件循环中执行"""
+        loops = []
+
+        async def run(agent, text):
+            loops.append(asyncio.get_running_loop())
+            return Mock(final_output="结果")
+
+        mock_runner.run = AsyncMock(side_effect=run)
+        processor = MailProcessor()
+        self.addCleanup(processor.close)
+        processor.cache = None
+
+        processor.process_with_llm(EmailRecord(body_text="小明: 在吗？"))
+        processor.process_with_llm(EmailRecord(body_text="小红: 在的"))
+
+        agents = [call.args[0] for call in mock_runner.run.call_args_list]
+        self.assertIs(agents[0], processor.agent)
+        self.assertIs(agents[1], processor.agent)
+        self.assertIs(loops[0], loops[1])
+
+    @patch("app.mail_processor.Runner")
+    def test_close_closes_model_on_loop(self, mock_runner):
+        """测试关闭处理器时先在常驻事件循环中关闭模型客户端"""
+        mock_runner.run = AsyncMock(return_value=Mock(final_output="结果"))
+        loops = []
+
+        async def close():
+            loops.append(asyncio.get_running_loop())
+
+        processor = MailProcessor()
+        processor.cache = None
+        processor.model._model = Mock(close=close)
+        processor.process_with_llm(EmailRecord(body_text="小明: 在吗？"))
+
+        processor.close()
+        processor.close()
+
+        self.assertEqual(len(loops), 1)
+        self.assertIs(loops[0], processor._loop._loop)
+        self.assertTrue(processor._loop.closed)
+
+    @patch("app.mail_processor.Runner")
+    def test_async_use_closes_model_on_running_loop(self, mock_runner):
+        """测试异步调用不创建常驻事件循环，模型在调用方的事件循环中关闭"""
+        mock_runner.run = AsyncMock(return_value=Mock(final_output="结果"))
+        loops = []
+
+        async def close():
+            loops.append(asyncio.get_running_loop())
+
+        processor = MailProcessor()
+        processor.cache = None
+        processor.model._model = Mock(close=close)
+
+        async def run():
+            await processor.process_async(EmailRecord(body_text="小明: 在吗？"))
+            await processor.aclose()
+            return asyncio.get_running_loop()
+
+        running_loop = asyncio.run(run())
+
+        self.assertIsNone(processor._loop)
+        self.assertEqual(loops, [running_loop])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+测试流式LLM调用、截止时间和部分结果
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+from app.email_record import EmailRecord
+from app.mail_processor import MailProcessor
+
+
+def delta_event(text):
+    """构造一个文本增量事件"""
+    return SimpleNamespace(
+        type="raw_response_event",
+        data=SimpleNamespace(type="response.output_text.delta", delta=text),
+    )
+
+
+class FakeStreamedRun:
+    """模拟 Runner.run_streamed 的返回值，每个增量之间间隔 interval 秒"""
+
+    def __init__(self, deltas, interval=0.0):
+        self.deltas = deltas
+        self.interval = interval
+        self.final_output = None
+        self.cancelled = False
+
+    async def stream_events(self):
+        yield SimpleNamespace(type="agent_updated_stream_event")
+        for text in self.deltas:
+            await asyncio.sleep(self.interval)
+            yield delta_event(text)
+        self.final_output = "".join(self.deltas)
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TestStreaming(unittest.TestCase):
+    """测试流式模式"""
+
+    def setUp(self):
+        self.processor = MailProcessor()
+        self.addCleanup(self.processor.close)
+        self.processor.cache = Mock()
+        self.processor.cache.get.return_value = None
+        self.processor.config = Mock(
+            LLM_STREAMING=True,
+            LLM_DEADLINE=1,
+            CHAT_PREPROCESS=False,
+            LLM_CHUNK_TOKENS=10000,
+            LLM_MAP_CONCURRENCY=2,
+        )
+
+    @patch("app.mail_processor.Runner")
+    def test_complete_stream_returns_full_output(self, mock_runner):
+        """测试流式调用完成时返回完整结果，写入缓存并记录首个token耗时"""
+        mock_runner.run_streamed.return_value = FakeStreamedRun(["分析", "结果"])
+
+        result = self.processor.process_with_llm(EmailRecord(body_text="小明: 在吗？"))
+
+        self.assertEqual(result, "分析结果")
+        self.processor.cache.set.assert_called_once()
+        self.assertGreaterEqual(self.processor.llm_stats()["last_ttft_seconds"], 0)
+        self.assertEqual(self.processor.ttft["streams"], 1)
+
+    @patch("app.mail_processor.Runner")
+    def test_deadline_returns_partial_with_note(self, mock_runner):
+        """测试超过截止时间时返回部分结果并注明，且不写入缓存"""
+        run = FakeStreamedRun(["第一段。", "第二段。", "第三段。"], interval=0.4)
+        mock_runner.run_streamed.return_value = run
+
+        result = self.processor.process_with_llm(EmailRecord(body_text="小明: 在吗？"))
+
+        self.assertTrue(result.startswith("第一段。第二段。"))
+        self.assertNotIn("第三段", result)
+        self.assertIn("以上为部分结果", result)
+        self.assertTrue(run.cancelled)
+        self.processor.cache.set.assert_not_called()
+
+    @patch("app.mail_processor.Runner")
+    def test_deadline_without_output_raises(self, mock_runner):
+        """测试超时前没有任何输出时抛出超时错误（稍后重试，不转发原始正文）"""
+        mock_runner.run_streamed.return_value = FakeStreamedRun(["太慢了"], interval=2)
+
+        with self.assertRaises(TimeoutError):
+            self.processor.process_with_llm(EmailRecord(body_text="小明: 在吗？"))
+        self.processor.cache.set.assert_not_called()
+
+    @patch("app.mail_processor.Runner")
+    def test_slow_non_streaming_call_raises(self, mock_runner):
+        """测试非流式调用超时不会返回None而转发原始正文"""
+
+        async def slow_run(agent, text):
+            await asyncio.sleep(2)
+            return Mock(final_output="分析结果")
+
+        mock_runner.run = slow_run
+        self.processor.config.LLM_STREAMING = False
+
+        with self.assertRaises(TimeoutError):
+            self.processor.process(EmailRecord(body_text="小明: 在吗？"))
+
+    @patch("app.mail_processor.Runner")
+    def test_async_path_sends_partial(self, mock_runner):
+        """测试异步处理同样在超时后返回部分结果"""
+        mock_runner.run_streamed.return_value = FakeStreamedRun(
+            ["部分", "内容", "未完"], interval=0.4
+        )
+
+        record = asyncio.run(
+            self.processor.process_async(EmailRecord(body_text="小明: 在吗？"))
+        )
+
+        self.assertTrue(record.body_text.startswith("部分内容"))
+        self.assertIn("以上为部分结果", record.body_text)
+
+
+if __name__ == "__main__":
+    unittest.main()
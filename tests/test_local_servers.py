@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+测试邮件获取器和发送器与本地假服务器的交互（端到端基准测试使用的同一组假服务器）
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dataclasses
+import json
+import threading
+import time
+import unittest
+import urllib.request
+from email.message import EmailMessage
+
+from app.accounts import AccountConfig
+from app.email_record import EmailRecord
+from app.mail_fetcher import MailFetcher
+from app.mail_sender import MailSender
+from tests.fake_servers import (
+    FakeIMAPServer,
+    FakeLLMServer,
+    SMTPSink,
+    client_ssl_context,
+)
+
+
+def chat_email(subject: str, attachment: bool = False) -> bytes:
+    """构造聊天记录邮件，可选把聊天记录作为 .txt 附件"""
+    message = EmailMessage()
+    message["Subject"] = subject
+    message["From"] = "friend@localhost"
+    message["To"] = "bench@localhost"
+    chat = "小明: 在吗？\n" * 3
+    if attachment:
+        message.set_content("见附件")
+        message.add_attachment(
+            chat.encode(), maintype="text", subtype="plain", filename="chat.txt"
+        )
+    else:
+        message.set_content(chat)
+    return message.as_bytes()
+
+
+class TestFetcherWithFakeIMAP(unittest.TestCase):
+    """测试邮件获取器与假 IMAP 服务器"""
+
+    def setUp(self):
+        self.imap = FakeIMAPServer()
+        self.addCleanup(self.imap.close)
+        account = dataclasses.replace(
+            AccountConfig.from_config(),
+            imap_server="localhost",
+            imap_port=self.imap.port,
+        )
+        self.fetcher = MailFetcher(account=account)
+        self.fetcher._ssl_context = client_ssl_context()
+        self.addCleanup(self.fetcher.disconnect)
+
+    def test_peek_fetch_and_mark_read(self):
+        """测试部分获取（含附件文本）不改变已读状态，标记已读后不再搜索到"""
+        mailbox = self.imap.mailbox
+        mailbox.append(chat_email("正文"))
+        mailbox.append(chat_email("附件", attachment=True))
+
+        uids = self.fetcher.search_unseen_emails()
+        raw_emails = self.fetcher.fetch_emails_by_uids(uids)
+        records = [
+            self.fetcher.parse_raw_email(raw, uid) for uid, raw in raw_emails.items()
+        ]
+
+        self.assertEqual(uids, [1, 2])
+        self.assertEqual(records[0].body_text, "小明: 在吗？\n" * 3)
+        self.assertIn("[附件: chat.txt]\n小明: 在吗？", records[1].body_text)
+        self.assertEqual(mailbox.seen_count(), 0)
+
+        self.assertTrue(self.fetcher.mark_as_read(1))
+        self.assertEqual(self.fetcher.search_unseen_emails(), [2])
+
+    def test_idle_wakes_on_new_mail(self):
+        """测试 IDLE 期间放入新邮件时立即唤醒"""
+        result = {}
+        waiter = threading.Thread(
+            target=lambda: result.update(woke=self.fetcher.wait_for_new_mail(10))
+        )
+        self.fetcher.search_unseen_emails()
+        waiter.start()
+        time.sleep(0.2)
+        started = time.monotonic()
+        self.imap.mailbox.append(chat_email("新邮件"))
+        waiter.join(10)
+
+        self.assertTrue(result["woke"])
+        self.assertLess(time.monotonic() - started, 2)
+
+
+class TestSenderWithSMTPSink(unittest.TestCase):
+    """测试邮件发送器与 SMTP 接收端"""
+
+    def test_send_through_pool(self):
+        """测试经连接池发送的邮件到达接收端"""
+        sink = SMTPSink()
+        self.addCleanup(sink.close)
+        account = dataclasses.replace(
+            AccountConfig.from_config(), smtp_server="localhost", smtp_port=sink.port
+        )
+        sender = MailSender(account=account)
+        sender.pool._ssl_context = client_ssl_context()
+        self.addCleanup(sender.close)
+
+        results = sender.send_many(
+            [
+                EmailRecord(uid=i, raw_subject=f"bench-{i}", body_text="总结")
+                for i in range(3)
+            ]
+        )
+
+        self.assertEqual(results, [True] * 3)
+        self.assertTrue(sink.wait_for(3, 5))
+        self.assertEqual(sink.deliveries[2].subject, "[EmailLLM] bench-2")
+        self.assertEqual(sender.pool.stats["connects"], 1)
+
+
+class TestFakeLLM(unittest.TestCase):
+    """测试假 LLM 接口"""
+
+    def test_chat_completion(self):
+        """测试返回 OpenAI 格式的结果和用量"""
+        llm = FakeLLMServer(reply="总结")
+        self.addCleanup(llm.close)
+        request = urllib.request.Request(
+            f"{llm.base_url}/chat/completions",
+            data=json.dumps(
+                {"model": "bench", "messages": [{"role": "user", "content": "x" * 400}]}
+            ).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+
+        with urllib.request.urlopen(request, timeout=5) as response:
+            body = json.load(response)
+
+        self.assertEqual(body["choices"][0]["message"]["content"], "总结")
+        self.assertEqual(body["usage"]["prompt_tokens"], 100)
+        self.assertEqual(llm.requests, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+测试日志策略：负载摘要和高频日志采样
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+from unittest.mock import AsyncMock, Mock, patch
+
+from loguru import logger
+
+from app.config import config
+from app.email_record import EmailRecord
+from app.log_policy import LogSampler, describe_payload, summarize_text
+from app.mail_processor import MailProcessor
+
+
+class TestSummarizeText(unittest.TestCase):
+    """测试文本摘要"""
+
+    def test_size_bounded_with_preview(self):
+        """测试摘要长度与原文无关，带字节数、哈希和转义后的预览"""
+        text = "小明: 在吗？\n" * 100000
+
+        summary = summarize_text(text, preview_chars=8)
+
+        self.assertLess(len(summary), 200)
+        self.assertIn(f"bytes={len(text.encode('utf-8'))}", summary)
+        self.assertIn('preview="小明: 在吗？\\n"…', summary)
+        self.assertNotIn("\n", summary)
+
+    def test_hash_identifies_content(self):
+        """测试相同内容的哈希相同，不同内容不同"""
+
+        def sha1(text):
+            return summarize_text(text, 0).split("sha1=")[1]
+
+        self.assertEqual(sha1("聊天记录"), sha1("聊天记录"))
+        self.assertNotEqual(sha1("聊天记录"), sha1("聊天记录。"))
+        self.assertNotIn("preview", summarize_text("聊天记录", 0))
+
+    def test_full_mode_keeps_payload(self):
+        """测试 full 模式记录原文"""
+        with patch.object(config, "LOG_PAYLOADS", "full"):
+            self.assertEqual(describe_payload("小明: 在吗？"), "小明: 在吗？")
+        self.assertTrue(describe_payload("小明: 在吗？").startswith("chars=7 "))
+
+
+class TestLogSampler(unittest.TestCase):
+    """测试日志采样"""
+
+    def test_one_in_n_per_key(self):
+        """测试每个键的第1、N+1…… 次放行，各键独立计数"""
+        sampler = LogSampler(3)
+
+        allowed = [sampler.allow("poll") for _ in range(7)]
+
+        self.assertEqual(allowed, [True, False, False, True, False, False, True])
+        self.assertTrue(sampler.allow("fetch"))
+
+    def test_disabled_allows_all(self):
+        """测试 N 小于等于1时全部放行"""
+        sampler = LogSampler(1)
+        self.assertTrue(all(sampler.allow("poll") for _ in range(5)))
+
+
+class TestProcessorLogging(unittest.TestCase):
+    """测试处理器不在日志中写入完整正文和输出"""
+
+    @patch("app.mail_processor.Runner")
+    def test_payloads_summarized(self, mock_runner):
+        """测试LLM输入和输出只记录摘要"""
+        body = "小明: 在吗？" + "今天过得怎么样" * 1000
+        output = "总结" * 1000
+        mock_runner.run = AsyncMock(return_value=Mock(final_output=output))
+        processor = MailProcessor()
+        processor.cache = None
+        messages = []
+        sink = logger.add(messages.append, level="INFO", format="{message}")
+        self.addCleanup(logger.remove, sink)
+
+        processor.process_with_llm(EmailRecord(uid=5, body_text=body))
+
+        logged = "".join(messages)
+        self.assertIn("LLM input for UID 5: chars=", logged)
+        self.assertIn("LLM output for UID 5: chars=2000 ", logged)
+        self.assertNotIn(body, logged)
+        self.assertNotIn(output, logged)
+
+
+if __name__ == "__main__":
+    unittest.main()
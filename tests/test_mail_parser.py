@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+测试邮件解析模块
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+from email.message import EmailMessage
+
+from app.email_record import Attachment, EmailRecord
+from app.mail_parser import parse_email
+
+
+def build_chat_email() -> bytes:
+    """构造一封包含纯文本、HTML 和附件的聊天记录邮件"""
+    message = EmailMessage()
+    message["Subject"] = "聊天记录"
+    message["From"] = "小明 <a@example.com>"
+    message["To"] = "b@example.com"
+    message["Date"] = "Mon, 01 Jan 2024 10:00:00 +0800"
+    message.set_content("我：在吗？\n她：在的。\n")
+    message.add_alternative("<p>我：在吗？</p>", subtype="html")
+    message.add_attachment(
+        b"\x89PNG", maintype="image", subtype="png", filename="截图.png"
+    )
+    return message.as_bytes()
+
+
+class TestParseEmail(unittest.TestCase):
+    """测试单次遍历的邮件解析"""
+
+    def test_multipart_email(self):
+        """测试解析多部分邮件的头部、正文和附件"""
+        parsed = parse_email(build_chat_email())
+
+        self.assertEqual(parsed.subject, "聊天记录")
+        self.assertEqual(parsed.sender, "小明 <a@example.com>")
+        self.assertEqual(parsed.receiver, "b@example.com")
+        self.assertEqual(parsed.date, "Mon, 01 Jan 2024 10:00:00 +0800")
+        self.assertEqual(parsed.body_text, "我：在吗？\n她：在的。\n")
+        self.assertEqual(parsed.attachments, (Attachment("截图.png", "image/png"),))
+
+    def test_single_part_gbk_email(self):
+        """测试按声明的字符集解码单部分邮件"""
+        raw = (
+            b"Subject: =?gbk?b?suLK1A==?=\r\n"
+            b"Content-Type: text/plain; charset=gbk\r\n"
+            b"Content-Transfer-Encoding: 8bit\r\n\r\n"
+        ) + "你好".encode("gbk")
+
+        parsed = parse_email(raw)
+
+        self.assertEqual(parsed.subject, "测试")
+        self.assertEqual(parsed.body_text, "你好")
+
+    def test_unknown_charset_falls_back_to_utf8(self):
+        """测试未知字符集按 UTF-8 解码"""
+        raw = (
+            b"Subject: x\r\nContent-Type: text/plain; charset=x-unknown\r\n\r\n"
+            + "你好".encode()
+        )
+
+        self.assertEqual(parse_email(raw).body_text, "你好")
+
+    def test_rfc2047_attachment_filename(self):
+        """测试客户端常用的 RFC 2047 编码附件文件名"""
+        raw = (
+            b'Content-Type: multipart/mixed; boundary="b"\r\n\r\n'
+            b"--b\r\nContent-Type: text/plain\r\n\r\nhi\r\n"
+            b"--b\r\nContent-Type: image/png\r\n"
+            b'Content-Disposition: attachment; filename="=?UTF-8?B?5oiq5Zu+LnBuZw==?="\r\n'
+            b"\r\nxx\r\n--b--\r\n"
+        )
+
+        parsed = parse_email(raw)
+
+        self.assertEqual(parsed.body_text, "hi")
+        self.assertEqual(parsed.attachments, (Attachment("截图.png", "image/png"),))
+
+    def test_html_only_email_converted_to_text(self):
+        """测试只有 HTML 正文的邮件转换为纯文本"""
+        message = EmailMessage()
+        message["Subject"] = "微信聊天记录"
+        message.set_content(
+            "<html><body><div>我：在吗？</div><div>她：在的。</div></body></html>",
+            subtype="html",
+        )
+
+        self.assertEqual(
+            parse_email(message.as_bytes()).body_text, "我：在吗？\n她：在的。"
+        )
+
+    def test_plain_text_preferred_over_html(self):
+        """测试有纯文本正文时不使用 HTML 正文"""
+        self.assertEqual(
+            parse_email(build_chat_email()).body_text, "我：在吗？\n她：在的。\n"
+        )
+
+    def test_envelope_fields(self):
+        """测试 UID、UIDVALIDITY 和账户写入记录"""
+        parsed = parse_email(build_chat_email(), uid=7, uidvalidity=3, account="bob")
+
+        self.assertEqual(
+            (parsed.uid, parsed.uidvalidity, parsed.account), (7, 3, "bob")
+        )
+
+
+class TestEmailRecord(unittest.TestCase):
+    """测试邮件记录的延迟解码和不可变性"""
+
+    def test_headers_decoded_on_first_access(self):
+        """测试头部在首次访问时才解码并缓存"""
+        record = EmailRecord(raw_subject="=?utf-8?b?6IGK5aSp6K6w5b2V?=")
+
+        self.assertIsNone(record._subject)
+        self.assertEqual(record.subject, "聊天记录")
+        self.assertEqual(record._subject, "聊天记录")
+
+    def test_with_body_returns_copy(self):
+        """测试替换正文返回新记录，原记录不变"""
+        record = EmailRecord(body_text="原文", raw_subject="s", uid=1)
+
+        processed = record.with_body("结果")
+
+        self.assertEqual(record.body_text, "原文")
+        self.assertEqual(processed.body_text, "结果")
+        self.assertEqual(processed.uid, 1)
+        with self.assertRaises(AttributeError):
+            record.body_text = "x"  # type: ignore[misc]
+
+    def test_decode_cache_does_not_affect_equality(self):
+        """测试解码缓存不影响记录比较"""
+        decoded = EmailRecord(raw_subject="hi")
+        self.assertEqual(decoded.subject, "hi")
+
+        self.assertEqual(decoded, EmailRecord(raw_subject="hi"))
+
+    def test_record_has_no_instance_dict(self):
+        """测试记录使用 __slots__，不为每封邮件分配实例字典"""
+        self.assertFalse(hasattr(EmailRecord(), "__dict__"))
+
+
+if __name__ == "__main__":
+    unittest.main()
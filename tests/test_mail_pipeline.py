@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+测试邮件处理流水线
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import threading
+import time
+import unittest
+from unittest.mock import Mock
+
+from app.email_record import EmailRecord
+from app.mail_pipeline import MailPipeline
+from app.mail_poller import MailPoller
+
+
+class TestMailPipeline(unittest.TestCase):
+    """测试流水线并发、背压与去重"""
+
+    def test_emails_processed_concurrently(self):
+        """测试多封邮件在工作线程中并发处理"""
+        barrier = threading.Barrier(3, timeout=5)
+        handled = []
+
+        def handler(email_info):
+            # 三封邮件必须同时处于处理中才能通过屏障
+            barrier.wait()
+            handled.append(email_info.uid)
+
+        pipeline = MailPipeline(handler, workers=3, queue_size=3)
+        pipeline.start()
+        for uid in (1, 2, 3):
+            self.assertTrue(pipeline.submit(EmailRecord(uid=uid)))
+        pipeline.join()
+        pipeline.stop()
+
+        self.assertEqual(sorted(handled), [1, 2, 3])
+
+    def test_submit_blocks_when_saturated(self):
+        """测试LLM阶段饱和时提交被阻塞（背压）"""
+        release = threading.Event()
+        pipeline = MailPipeline(lambda email_info: release.wait(5), 1, 1)
+        pipeline.start()
+        pipeline.submit(EmailRecord(uid=1))
+        # 等待第一封邮件被工作线程取走
+        while pipeline._queue.qsize():
+            time.sleep(0.01)
+        pipeline.submit(EmailRecord(uid=2))
+
+        blocked = threading.Thread(target=pipeline.submit, args=(EmailRecord(uid=3),))
+        blocked.start()
+        blocked.join(0.2)
+        self.assertTrue(blocked.is_alive())
+
+        release.set()
+        blocked.join(5)
+        self.assertFalse(blocked.is_alive())
+        pipeline.join()
+        pipeline.stop()
+
+    def test_duplicate_uid_is_rejected(self):
+        """测试处理中的邮件不会被重复提交"""
+        release = threading.Event()
+        handler = Mock(side_effect=lambda email_info: release.wait(5))
+        pipeline = MailPipeline(handler, workers=1, queue_size=2)
+        pipeline.start()
+
+        self.assertTrue(pipeline.submit(EmailRecord(uid=1)))
+        self.assertTrue(pipeline.is_in_flight(1))
+        self.assertFalse(pipeline.submit(EmailRecord(uid=1)))
+
+        release.set()
+        pipeline.join()
+        pipeline.stop()
+        self.assertFalse(pipeline.is_in_flight(1))
+        handler.assert_called_once()
+
+    def test_handler_error_does_not_stop_worker(self):
+        """测试单封邮件处理异常不影响后续邮件"""
+        handled = []
+
+        def handler(email_info):
+            if email_info.uid == 1:
+                raise RuntimeError("LLM failed")
+            handled.append(email_info.uid)
+
+        pipeline = MailPipeline(handler, workers=1, queue_size=2)
+        pipeline.start()
+        pipeline.submit(EmailRecord(uid=1))
+        pipeline.submit(EmailRecord(uid=2))
+        pipeline.join()
+        pipeline.stop()
+
+        self.assertEqual(handled, [2])
+
+    def test_poller_skips_in_flight_uids(self):
+        """测试轮询器不再获取仍在处理中的邮件"""
+        fetcher = Mock()
+        fetcher.search_new_emails.return_value = [1, 2]
+        fetcher.iter_emails_by_uids.return_value = iter([])
+        pipeline = Mock()
+        pipeline.is_in_flight.side_effect = lambda uid, account: uid == 1
+        poller = MailPoller(fetcher, pipeline)
+
+        poller._check_new_emails(Mock())
+
+        fetcher.iter_emails_by_uids.assert_called_once_with([2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+"""
+测试邮件接收功能（MailFetcher / MailPoller）
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import base64
+import re
+import threading
+import time
+import unittest
+from unittest.mock import Mock, patch
+
+from imapclient.response_parser import parse_fetch_response  # type: ignore[import-untyped]
+
+from app.mail_fetcher import MailFetcher, _plan_sections
+from app.mail_poller import MailPoller
+
+
+class TestMailFetcherIdle(unittest.TestCase):
+    """测试 IMAP IDLE 等待逻辑"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.fetcher = MailFetcher()
+        self.fetcher.imap_conn = Mock()
+
+    def test_exists_response_wakes_up(self):
+        """测试收到EXISTS推送时立即返回True"""
+        self.fetcher.imap_conn.idle_check.side_effect = [
+            [(b"OK", b"Still here")],
+            [(3, b"EXISTS")],
+        ]
+
+        self.assertTrue(self.fetcher.wait_for_new_mail(60))
+        self.fetcher.imap_conn.idle.assert_called_once()
+        self.fetcher.imap_conn.idle_done.assert_called_once()
+
+    def test_timeout_returns_false(self):
+        """测试IDLE超时后退出并结束IDLE"""
+        self.fetcher.imap_conn.idle_check.return_value = []
+
+        self.assertFalse(self.fetcher.wait_for_new_mail(0.01))
+        self.fetcher.imap_conn.idle_done.assert_called_once()
+
+    def test_stop_event_interrupts_idle(self):
+        """测试停止信号可以打断IDLE"""
+        stop_event = threading.Event()
+        stop_event.set()
+
+        self.assertFalse(self.fetcher.wait_for_new_mail(60, stop_event))
+        self.fetcher.imap_conn.idle_check.assert_not_called()
+        self.fetcher.imap_conn.idle_done.assert_called_once()
+
+    def test_waiting_command_interrupts_idle(self):
+        """测试其他线程需要使用连接时IDLE提前退出并让出连接"""
+        marked = threading.Event()
+
+        def mark_read():
+            self.fetcher.mark_as_read(1)
+            marked.set()
+
+        self.fetcher.imap_conn.idle_check.side_effect = lambda timeout: (
+            threading.Thread(target=mark_read).start() or time.sleep(0.05) or []
+        )
+
+        self.assertTrue(self.fetcher.wait_for_new_mail(60))
+        self.assertTrue(marked.wait(5))
+        self.fetcher.imap_conn.add_flags.assert_called_once_with([1], [b"\\Seen"])
+
+
+@patch("app.mail_fetcher.IMAPClient")
+class TestMailFetcherSession(unittest.TestCase):
+    """测试 IMAP 长连接会话"""
+
+    def test_session_is_reused_across_operations(self, mock_client_cls):
+        """测试多次操作复用同一连接且只SELECT一次"""
+        conn = mock_client_cls.return_value
+        conn.search.return_value = [1, 2]
+        fetcher = MailFetcher()
+
+        fetcher.search_unseen_emails()
+        fetcher.search_unseen_emails()
+        fetcher.mark_as_read(1)
+
+        mock_client_cls.assert_called_once()
+        conn.login.assert_called_once()
+        conn.select_folder.assert_called_once_with("INBOX")
+        self.assertEqual(fetcher.stats["handshakes"], 1)
+        self.assertEqual(fetcher.stats["reconnects"], 0)
+
+    def test_dead_connection_detected_by_noop(self, mock_client_cls):
+        """测试空闲连接NOOP失败后自动重连"""
+        dead_conn, new_conn = Mock(), Mock()
+        dead_conn.noop.side_effect = OSError("connection reset")
+        mock_client_cls.side_effect = [dead_conn, new_conn]
+        fetcher = MailFetcher()
+        fetcher.noop_interval = 0
+
+        fetcher.search_unseen_emails()
+        fetcher.search_unseen_emails()
+
+        new_conn.search.assert_called_once_with(["UNSEEN"])
+        self.assertEqual(fetcher.stats["handshakes"], 2)
+        self.assertEqual(fetcher.stats["reconnects"], 1)
+
+    def test_dropped_connection_is_retried(self, mock_client_cls):
+        """测试命令执行中断线后重连并重试一次"""
+        dead_conn, new_conn = Mock(), Mock()
+        dead_conn.search.side_effect = OSError("broken pipe")
+        new_conn.search.return_value = [7]
+        mock_client_cls.side_effect = [dead_conn, new_conn]
+        mock_client_cls.AbortError = OSError
+        fetcher = MailFetcher()
+
+        self.assertEqual(fetcher.search_unseen_emails(), [7])
+        self.assertEqual(fetcher.stats["reconnects"], 1)
+        new_conn.select_folder.assert_called_once_with("INBOX")
+
+    @patch("app.mail_fetcher.time.sleep")
+    def test_reconnect_backs_off(self, mock_sleep, mock_client_cls):
+        """测试重连失败时按指数退避重试"""
+        conn = Mock()
+        conn.search.side_effect = [OSError("broken pipe"), [3]]
+        mock_client_cls.side_effect = [
+            conn,
+            OSError("refused"),
+            OSError("refused"),
+            conn,
+        ]
+        mock_client_cls.AbortError = OSError
+        fetcher = MailFetcher()
+        fetcher.reconnect_backoff = 1
+
+        self.assertEqual(fetcher.search_unseen_emails(), [3])
+        self.assertEqual(
+            [c.args[0] for c in mock_sleep.call_args_list],
+            [1, 2],
+        )
+
+
+HEADER = (
+    b"From: a@example.com\r\nTo: b@example.com\r\nSubject: chat\r\n"
+    b"MIME-Version: 1.0\r\n"
+    b'Content-Type: multipart/mixed; boundary="b1"\r\n\r\n'
+)
+TEXT_MIME = (
+    b'Content-Type: text/plain; charset="utf-8"\r\n'
+    b"Content-Transfer-Encoding: base64\r\n\r\n"
+)
+TEXT = "我：在吗？\n她：在的，刚下班。\n" * 200
+TEXT_BODY = base64.encodebytes(TEXT.encode("utf-8")).replace(b"\n", b"\r\n")
+IMAGE_MIME = (
+    b'Content-Type: image/png; name="shot.png"\r\n'
+    b'Content-Disposition: attachment; filename="shot.png"\r\n'
+    b"Content-Transfer-Encoding: base64\r\n\r\n"
+)
+IMAGE_BODY = base64.encodebytes(bytes(range(256)) * 400).replace(b"\n", b"\r\n")
+RAW = (
+    HEADER
+    + b"--b1\r\n"
+    + TEXT_MIME
+    + TEXT_BODY
+    + b"\r\n--b1\r\n"
+    + IMAGE_MIME
+    + IMAGE_BODY
+    + b"\r\n--b1--\r\n"
+)
+STRUCTURE = parse_fetch_response(
+    [
+        b'1 (UID 7 BODYSTRUCTURE (("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "BASE64" '
+        + str(len(TEXT_BODY)).encode()
+        + b' 40 NIL NIL NIL)("IMAGE" "PNG" ("NAME" "shot.png") NIL NIL "BASE64" '
+        + str(len(IMAGE_BODY)).encode()
+        + b' NIL ("ATTACHMENT" ("FILENAME" "shot.png")) NIL) "MIXED" ("BOUNDARY" "b1") NIL NIL))'
+    ]
+)[7][b"BODYSTRUCTURE"]
+
+
+class FakeFetchConnection:
+    """按请求的数据项返回上面那封邮件对应部分的假 IMAP 连接"""
+
+    def __init__(self):
+        self.requests = []
+        self.sections = {
+            "HEADER": HEADER,
+            "1.MIME": TEXT_MIME,
+            "1": TEXT_BODY,
+            "2.MIME": IMAGE_MIME,
+            "2": IMAGE_BODY,
+            "": RAW,
+        }
+
+    def fetch(self, uids, items):
+        self.requests.append(list(items))
+        data = {}
+        for item in items:
+            if item == "BODYSTRUCTURE":
+                data[b"BODYSTRUCTURE"] = STRUCTURE
+                continue
+            match = re.fullmatch(r"BODY\.PEEK\[([^\]]*)\](?:<0\.(\d+)>)?", item)
+            section, limit = match.group(1), match.group(2)
+            content = self.sections[section]
+            if limit is None:
+                data[f"BODY[{section}]".encode()] = content
+            else:
+                data[f"BODY[{section}]<0>".encode()] = content[: int(limit)]
+        return {uid: dict(data) for uid in uids}
+
+
+class TestMailFetcherPeek(unittest.TestCase):
+    """测试 BODY.PEEK 部分获取策略"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.conn = FakeFetchConnection()
+        self.fetcher = MailFetcher()
+        self.fetcher._ensure_connection = Mock(return_value=self.conn)
+
+    def test_peek_skips_attachment_content(self):
+        """测试只下载正文文本，附件只保留文件名"""
+        self.fetcher.fetch_strategy = "peek"
+
+        raw = self.fetcher.fetch_emails_by_uids([7])[7]
+
+        requested = [item for request in self.conn.requests for item in request]
+        self.assertNotIn("BODY.PEEK[2]", " ".join(requested))
+        self.assertFalse(any(item.startswith("RFC822") for item in requested))
+        self.assertLess(len(raw), len(RAW) // 4)
+        self.assertEqual(
+            self.fetcher.parse_raw_email(raw), self.fetcher.parse_raw_email(RAW)
+        )
+        self.assertEqual(self.fetcher.stats["bytes_fetched"], len(raw))
+
+    def test_peek_caps_text_bytes(self):
+        """测试正文超过字节上限时截断在完整的行上，仍能正常解码"""
+        self.fetcher.fetch_strategy = "peek"
+        self.fetcher.fetch_max_bytes = 1000
+
+        raw = self.fetcher.fetch_emails_by_uids([7])[7]
+        body_text = self.fetcher.parse_raw_email(raw).body_text
+
+        self.assertTrue(body_text)
+        self.assertLess(len(body_text), len(TEXT))
+        self.assertTrue(TEXT.startswith(body_text.rstrip("\ufffd")))
+
+    def test_full_strategy_does_not_set_seen(self):
+        """测试完整获取使用 BODY.PEEK[] 而不是 RFC822"""
+        self.fetcher.fetch_strategy = "full"
+
+        raw = self.fetcher.fetch_emails_by_uids([7])[7]
+
+        self.assertEqual(raw, RAW)
+        self.assertEqual(self.conn.requests, [["BODY.PEEK[]"]])
+
+
+def parse_structure(structure: bytes):
+    """把 BODYSTRUCTURE 响应文本解析为 IMAPClient 的 BodyData"""
+    return parse_fetch_response([b"1 (UID 1 BODYSTRUCTURE " + structure + b")"])[1][
+        b"BODYSTRUCTURE"
+    ]
+
+
+class TestPlanSections(unittest.TestCase):
+    """测试部分获取时选择下载哪些正文"""
+
+    PLAIN = b'("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" 10 1 NIL NIL NIL)'
+    HTML = b'("TEXT" "HTML" ("CHARSET" "utf-8") NIL NIL "7BIT" 50 1 NIL NIL NIL)'
+    IMAGE = b'("IMAGE" "PNG" NIL NIL NIL "BASE64" 9000 NIL ("ATTACHMENT" NIL) NIL)'
+
+    def test_html_skipped_when_plain_text_exists(self):
+        """测试 multipart/alternative 中只下载纯文本正文"""
+        structure = parse_structure(
+            b"(("
+            + self.PLAIN
+            + self.HTML
+            + b' "ALTERNATIVE")'
+            + self.IMAGE
+            + b' "MIXED")'
+        )
+
+        self.assertEqual(
+            _plan_sections(structure, 1000), [("1.1", 1000), ("1.2", 0), ("2", 0)]
+        )
+
+    def test_html_downloaded_when_only_body(self):
+        """测试只有 HTML 正文时下载 HTML"""
+        structure = parse_structure(b"(" + self.HTML + self.IMAGE + b' "MIXED")')
+
+        self.assertEqual(_plan_sections(structure, 1000), [("1", 1000), ("2", 0)])
+
+    def test_chat_export_attachment_downloaded_up_to_limit(self):
+        """测试支持提取文本的附件按解码上限下载前缀，按文件名识别类型"""
+        export = (
+            b'("APPLICATION" "OCTET-STREAM" NIL NIL NIL "BASE64" 90000 NIL '
+            b'("ATTACHMENT" ("FILENAME" "chat.csv")) NIL)'
+        )
+        structure = parse_structure(
+            b"(" + self.PLAIN + export + self.IMAGE + b' "MIXED")'
+        )
+
+        self.assertEqual(
+            _plan_sections(structure, 1000, {"csv": 570}),
+            [("1", 1000), ("2", 780), ("3", 0)],
+        )
+        self.assertEqual(
+            _plan_sections(structure, 1000), [("1", 1000), ("2", 0), ("3", 0)]
+        )
+
+
+class TestMailFetcherChunks(unittest.TestCase):
+    """测试积压邮件的分批获取"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.fetcher = MailFetcher()
+        self.fetcher.fetch_emails_by_uids = Mock(
+            side_effect=lambda uids: {uid: b"raw" for uid in uids}
+        )
+
+    def test_uids_fetched_in_chunks(self):
+        """测试按批大小分批请求"""
+        uids = [uid for uid, _ in self.fetcher.iter_emails_by_uids(list(range(7)), 3)]
+
+        self.assertEqual(uids, list(range(7)))
+        self.assertEqual(
+            [c.args[0] for c in self.fetcher.fetch_emails_by_uids.call_args_list],
+            [[0, 1, 2], [3, 4, 5], [6]],
+        )
+
+    def test_first_chunk_available_before_rest_downloaded(self):
+        """测试第一批返回时后面的批次尚未下载"""
+        emails = self.fetcher.iter_emails_by_uids(list(range(100)), 10)
+
+        self.assertEqual(next(emails)[0], 0)
+        self.fetcher.fetch_emails_by_uids.assert_called_once_with(list(range(10)))
+
+
+class TestMailPollerIdle(unittest.TestCase):
+    """测试轮询器的 IDLE 与回退逻辑"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.fetcher = Mock()
+        self.fetcher.search_new_emails.return_value = []
+        self.poller = MailPoller(self.fetcher)
+
+    def test_falls_back_to_polling_without_idle(self):
+        """测试服务器不支持IDLE时回退到定时轮询"""
+        self.fetcher.supports_idle.return_value = False
+        self.poller._stop_event = Mock()
+        self.poller._stop_event.is_set.return_value = False
+        # 第一次等待后停止轮询
+        self.poller._stop_event.wait.side_effect = lambda timeout: (
+            self.poller.stop_polling()
+        )
+
+        with patch("app.mail_poller.config.IMAP_IDLE", True):
+            self.poller.start_polling(Mock())
+
+        self.fetcher.wait_for_new_mail.assert_not_called()
+        self.poller._stop_event.wait.assert_called_with(self.poller.check_interval)
+
+    def test_idle_wakes_check(self):
+        """测试IDLE推送新邮件后立即重新检查"""
+        self.fetcher.supports_idle.return_value = True
+
+        def notify(timeout, stop_event):
+            # 第二次进入IDLE时停止
+            if self.fetcher.wait_for_new_mail.call_count >= 2:
+                self.poller.stop_polling()
+                return False
+            return True
+
+        self.fetcher.wait_for_new_mail.side_effect = notify
+
+        with patch("app.mail_poller.config.IMAP_IDLE", True):
+            self.poller.start_polling(Mock())
+
+        self.assertEqual(self.fetcher.search_new_emails.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
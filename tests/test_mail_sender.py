@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+测试邮件发送功能（MailSender / SMTP连接池）
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import smtplib
+import unittest
+from unittest.mock import MagicMock, patch
+
+from app.email_record import EmailRecord
+from app.mail_sender import MailSender
+from app.smtp_pool import SMTPConnectionPool
+
+
+def _email(subject: str) -> EmailRecord:
+    return EmailRecord(body_text=f"{subject} 内容", raw_subject=subject)
+
+
+@patch("app.smtp_pool.smtplib.SMTP_SSL")
+class TestMailSenderPool(unittest.TestCase):
+    """测试SMTP连接复用"""
+
+    def test_send_many_uses_one_session(self, mock_smtp):
+        """测试批量发送只建立一次连接和登录"""
+        server = mock_smtp.return_value
+        sender = MailSender()
+
+        results = sender.send_many([_email("a"), _email("b"), _email("c")])
+
+        self.assertEqual(results, [True, True, True])
+        mock_smtp.assert_called_once()
+        server.login.assert_called_once()
+        self.assertEqual(server.send_message.call_count, 3)
+
+    def test_connection_reused_after_test_connection(self, mock_smtp):
+        """测试启动时的连接测试所建立的连接会被后续发送复用"""
+        server = mock_smtp.return_value
+        server.noop.return_value = (250, b"OK")
+        sender = MailSender()
+
+        self.assertTrue(sender.test_connection())
+        self.assertTrue(sender.send_email(_email("a")))
+        self.assertTrue(sender.send_email(_email("b")))
+
+        mock_smtp.assert_called_once()
+        self.assertEqual(sender.pool.stats["reuses"], 2)
+
+    def test_dead_connection_is_replaced(self, mock_smtp):
+        """测试NOOP健康检查失败的连接被丢弃并重新建立"""
+        dead, fresh = MagicMock(), MagicMock()
+        dead.noop.side_effect = smtplib.SMTPServerDisconnected("gone")
+        mock_smtp.side_effect = [dead, fresh]
+        sender = MailSender()
+
+        sender.test_connection()
+        self.assertTrue(sender.send_email(_email("a")))
+
+        fresh.send_message.assert_called_once()
+        self.assertEqual(sender.pool.stats["connects"], 2)
+
+    def test_idle_connection_expires(self, mock_smtp):
+        """测试空闲超时的连接不再复用"""
+        sender = MailSender()
+        sender.pool.idle_timeout = -1
+
+        sender.send_email(_email("a"))
+        sender.send_email(_email("b"))
+
+        self.assertEqual(mock_smtp.call_count, 2)
+        mock_smtp.return_value.noop.assert_not_called()
+
+    def test_recovers_from_server_disconnect(self, mock_smtp):
+        """测试发送中途断线后使用新连接重试当前邮件"""
+        broken, fresh = MagicMock(), MagicMock()
+        broken.send_message.side_effect = [
+            None,
+            smtplib.SMTPServerDisconnected("closed"),
+        ]
+        mock_smtp.side_effect = [broken, fresh]
+        sender = MailSender()
+
+        results = sender.send_many([_email("a"), _email("b"), _email("c")])
+
+        self.assertEqual(results, [True, True, True])
+        self.assertEqual(fresh.send_message.call_count, 2)
+        self.assertEqual(sender.pool.stats["discards"], 1)
+
+    def test_rejected_message_keeps_session(self, mock_smtp):
+        """测试单封邮件被拒绝不影响同一会话中的其他邮件"""
+        server = mock_smtp.return_value
+        server.send_message.side_effect = [
+            smtplib.SMTPDataError(550, b"rejected"),
+            None,
+        ]
+        sender = MailSender()
+
+        self.assertEqual(sender.send_many([_email("a"), _email("b")]), [False, True])
+        mock_smtp.assert_called_once()
+
+    def test_authentication_failure(self, mock_smtp):
+        """测试认证失败时返回False"""
+        mock_smtp.return_value.login.side_effect = smtplib.SMTPAuthenticationError(
+            535, b"auth failed"
+        )
+        sender = MailSender()
+
+        self.assertFalse(sender.test_connection())
+        self.assertFalse(sender.send_email(_email("a")))
+
+    def test_missing_credentials_rejected(self, mock_smtp):
+        """测试缺少用户名或密码时创建连接池即报错"""
+        with self.assertRaisesRegex(ValueError, "username and password"):
+            SMTPConnectionPool("smtp.qq.com", 465, "a@qq.com", None)
+        mock_smtp.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
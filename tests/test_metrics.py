@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+测试运行指标：注册表、/metrics 输出和各阶段埋点
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import unittest
+import urllib.error
+import urllib.request
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+from app.email_record import EmailRecord
+from app.llm_runtime import TimedModel
+from app.mail_handler import handle_email
+from app.mail_sender import REPLY_SUBJECT_PREFIX
+from app.metrics import (
+    EMAILS_FAILED,
+    EMAILS_PROCESSED,
+    EMAILS_SKIPPED,
+    LLM_TOKENS,
+    STAGE_LLM,
+    Metrics,
+    MetricsServer,
+    metrics,
+)
+
+
+class UsageModel:
+    """返回带用量信息的假模型"""
+
+    async def get_response(self, *args, **kwargs):
+        return SimpleNamespace(
+            usage=SimpleNamespace(input_tokens=120, output_tokens=30)
+        )
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    """测试指标注册表"""
+
+    def test_disabled_records_nothing(self):
+        """测试未启用时埋点不记录任何数据"""
+        registry = Metrics()
+        registry.inc(EMAILS_PROCESSED)
+        with registry.time(STAGE_LLM):
+            pass
+
+        self.assertEqual(registry.value(EMAILS_PROCESSED), 0)
+        self.assertIsNone(registry.histogram(STAGE_LLM))
+        self.assertEqual(registry.render(), "\n")
+
+    def test_histogram_buckets_are_cumulative(self):
+        """测试直方图按累积桶输出"""
+        registry = Metrics(enabled=True, buckets=(0.1, 1))
+        for seconds in (0.05, 0.5, 5):
+            registry.observe(STAGE_LLM, seconds)
+
+        text = registry.render()
+
+        self.assertIn(
+            'emailllm_stage_duration_seconds_bucket{stage="llm",le="0.1"} 1', text
+        )
+        self.assertIn(
+            'emailllm_stage_duration_seconds_bucket{stage="llm",le="1"} 2', text
+        )
+        self.assertIn(
+            'emailllm_stage_duration_seconds_bucket{stage="llm",le="+Inf"} 3', text
+        )
+        self.assertIn('emailllm_stage_duration_seconds_count{stage="llm"} 3', text)
+
+    def test_counters_with_labels(self):
+        """测试带标签的计数器"""
+        registry = Metrics(enabled=True)
+        registry.inc(LLM_TOKENS, 100, direction="in")
+        registry.inc(LLM_TOKENS, 20, direction="out")
+        registry.inc(LLM_TOKENS, 50, direction="in")
+
+        self.assertEqual(registry.value(LLM_TOKENS, direction="in"), 150)
+        self.assertIn("# TYPE emailllm_llm_tokens_total counter", registry.render())
+        self.assertIn(
+            'emailllm_llm_tokens_total{direction="out"} 20', registry.render()
+        )
+
+
+class TestMetricsServer(unittest.TestCase):
+    """测试 /metrics HTTP 服务"""
+
+    def test_serves_metrics(self):
+        """测试 GET /metrics 返回文本格式的指标，其他路径返回404"""
+        registry = Metrics()
+        server = MetricsServer("127.0.0.1", 0, registry)
+        self.addCleanup(server.close)
+        self.assertTrue(registry.enabled)
+        registry.inc(EMAILS_PROCESSED, 3)
+
+        url = f"http://127.0.0.1:{server.port}"
+        with urllib.request.urlopen(f"{url}/metrics", timeout=5) as response:
+            body = response.read().decode()
+            content_type = response.headers["Content-Type"]
+
+        self.assertIn("emailllm_emails_processed_total 3", body)
+        self.assertTrue(content_type.startswith("text/plain"))
+        with self.assertRaises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"{url}/other", timeout=5)
+
+
+class TestStageInstrumentation(unittest.TestCase):
+    """测试各阶段的埋点"""
+
+    def setUp(self):
+        metrics.reset()
+        metrics.enabled = True
+
+    def tearDown(self):
+        metrics.enabled = False
+        metrics.reset()
+
+    def test_llm_call_latency_and_tokens(self):
+        """测试LLM调用记录耗时和token用量"""
+        model = TimedModel("fake", model=UsageModel())
+
+        asyncio.run(model.get_response())
+
+        self.assertEqual(metrics.histogram(STAGE_LLM).count, 1)
+        self.assertEqual(metrics.value(LLM_TOKENS, direction="in"), 120)
+        self.assertEqual(metrics.value(LLM_TOKENS, direction="out"), 30)
+
+    def test_loop_guard_counts_skipped(self):
+        """测试机器人自己发出的邮件计入跳过数"""
+        fetcher = Mock()
+        fetcher.get_state.return_value = None
+        processor = Mock()
+        email_info = EmailRecord(raw_subject=f"{REPLY_SUBJECT_PREFIX} 回复", uid=1)
+
+        handle_email(email_info, processor, Mock(), fetcher)
+
+        self.assertEqual(metrics.value(EMAILS_SKIPPED), 1)
+        processor.process.assert_not_called()
+
+    def test_processed_and_failed_counted(self):
+        """测试发送成功计入处理数，发送失败计入失败数"""
+        fetcher = Mock()
+        fetcher.get_state.return_value = None
+        processor = Mock()
+        processor.process.side_effect = lambda e: e
+        sender = Mock()
+
+        sender.send_email.return_value = True
+        handle_email(EmailRecord(uid=1), processor, sender, fetcher)
+        sender.send_email.return_value = False
+        handle_email(EmailRecord(uid=2), processor, sender, fetcher)
+
+        self.assertEqual(metrics.value(EMAILS_PROCESSED), 1)
+        self.assertEqual(metrics.value(EMAILS_FAILED), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
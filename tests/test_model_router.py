@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+测试多模型路由：故障切换、延迟对冲和熔断
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import unittest
+
+from app.model_router import ModelRouter
+
+
+class FakeModel:
+    """本地假模型：固定延迟后返回结果或抛出异常"""
+
+    def __init__(self, name, delay=0.0, fail=False):
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+        self.cancelled = 0
+
+    async def get_response(self, *args, **kwargs):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.fail:
+            raise RuntimeError(f"{self.name} failed")
+        return f"{self.name} response"
+
+    async def stream_response(self, *args, **kwargs):
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError(f"{self.name} failed")
+        for event in ("a", "b"):
+            yield f"{self.name}:{event}"
+
+
+class FakeProvider:
+    """按名称返回假模型"""
+
+    def __init__(self, models):
+        self.models = {model.name: model for model in models}
+
+    def get_model(self, name):
+        return self.models[name]
+
+
+class FakeClock:
+    """可手动推进的时钟"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_router(models, **kwargs):
+    return ModelRouter(
+        [model.name for model in models], provider=FakeProvider(models), **kwargs
+    )
+
+
+class TestModelRouter(unittest.TestCase):
+    """测试路由策略"""
+
+    def test_primary_used_when_healthy(self):
+        """测试主模型正常时只调用主模型"""
+        primary, backup = FakeModel("primary"), FakeModel("backup")
+        router = make_router([primary, backup], latency_budget=1)
+
+        self.assertEqual(asyncio.run(router.get_response()), "primary response")
+        self.assertEqual(backup.calls, 0)
+        self.assertEqual(router.stats()["primary"]["calls"], 1)
+
+    def test_failover_on_error(self):
+        """测试主模型出错时切换到下一个模型"""
+        primary = FakeModel("primary", fail=True)
+        backup = FakeModel("backup")
+        router = make_router([primary, backup], latency_budget=1)
+
+        self.assertEqual(asyncio.run(router.get_response()), "backup response")
+        self.assertEqual(router.stats()["primary"]["error_rate"], 1.0)
+
+    def test_all_failing_raises_last_error(self):
+        """测试所有模型都失败时抛出异常"""
+        router = make_router(
+            [FakeModel("a", fail=True), FakeModel("b", fail=True)], latency_budget=1
+        )
+        with self.assertRaisesRegex(RuntimeError, "b failed"):
+            asyncio.run(router.get_response())
+
+    def test_hedges_when_primary_exceeds_budget(self):
+        """测试主模型超过延迟预算时对冲请求备用模型，采用先返回的结果并取消主模型"""
+        primary = FakeModel("primary", delay=1.0)
+        backup = FakeModel("backup", delay=0.01)
+        router = make_router([primary, backup], latency_budget=0.05)
+
+        self.assertEqual(asyncio.run(router.get_response()), "backup response")
+        self.assertEqual(primary.cancelled, 1)
+        # 被取消的请求不计入统计
+        self.assertEqual(router.stats()["primary"]["calls"], 0)
+
+    def test_auto_budget_uses_p95(self):
+        """测试延迟预算为0时，样本足够后按主模型的p95对冲"""
+        primary = FakeModel("primary")
+        backup = FakeModel("backup")
+        router = make_router([primary, backup], latency_budget=0)
+        self.assertIsNone(router._hedge_delay(router.backends[0]))
+
+        for _ in range(20):
+            router.backends[0].record_success(0.5)
+        self.assertEqual(router._hedge_delay(router.backends[0]), 0.5)
+        self.assertEqual(router.stats()["primary"]["p50_seconds"], 0.5)
+
+    def test_circuit_breaker_skips_failing_backend(self):
+        """测试连续失败后熔断，冷却期间跳过该模型，冷却结束后重新尝试"""
+        clock = FakeClock()
+        primary = FakeModel("primary", fail=True)
+        backup = FakeModel("backup")
+        router = make_router(
+            [primary, backup],
+            latency_budget=1,
+            failure_threshold=2,
+            cooldown=60,
+            clock=clock,
+        )
+
+        for _ in range(2):
+            asyncio.run(router.get_response())
+        self.assertEqual(primary.calls, 2)
+        self.assertTrue(router.stats()["primary"]["circuit_open"])
+
+        asyncio.run(router.get_response())
+        self.assertEqual(primary.calls, 2)
+
+        clock.now += 61
+        primary.fail = False
+        self.assertEqual(asyncio.run(router.get_response()), "primary response")
+        self.assertFalse(router.stats()["primary"]["circuit_open"])
+
+    def test_open_circuit_not_called_while_healthy_backend_exists(self):
+        """测试有未熔断的模型时，即使它失败也不再调用熔断的模型"""
+        clock = FakeClock()
+        primary = FakeModel("primary", fail=True)
+        backup = FakeModel("backup")
+        router = make_router(
+            [primary, backup], latency_budget=1, failure_threshold=1, clock=clock
+        )
+        asyncio.run(router.get_response())
+        self.assertTrue(router.stats()["primary"]["circuit_open"])
+
+        backup.fail = True
+        with self.assertRaisesRegex(RuntimeError, "backup failed"):
+            asyncio.run(router.get_response())
+        self.assertEqual(primary.calls, 1)
+        self.assertEqual(backup.calls, 2)
+
+    def test_stream_fails_over_before_first_event(self):
+        """测试流式请求在收到事件前出错时切换模型"""
+        router = make_router(
+            [FakeModel("primary", fail=True), FakeModel("backup")], latency_budget=1
+        )
+
+        async def collect():
+            return [event async for event in router.stream_response()]
+
+        self.assertEqual(asyncio.run(collect()), ["backup:a", "backup:b"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+测试LLM调用限流：令牌桶、优先级排队和限流重试
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import time
+import unittest
+from unittest.mock import AsyncMock, Mock, patch
+
+from app.email_record import EmailRecord
+from app.mail_processor import MailProcessor
+from app.rate_limiter import (
+    PRIORITY_MAP,
+    PRIORITY_REDUCE,
+    PRIORITY_SINGLE,
+    RateLimiter,
+    TokenBucket,
+    backoff_delay,
+    is_rate_limit_error,
+)
+
+
+class FakeClock:
+    """可手动推进的时钟"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class RateLimitError(Exception):
+    """模拟提供方的429错误"""
+
+    status_code = 429
+
+
+class TestTokenBucket(unittest.TestCase):
+    """测试令牌桶"""
+
+    def test_refills_at_rate(self):
+        """测试取空后按速率补充"""
+        clock = FakeClock()
+        bucket = TokenBucket(60, clock=clock)
+
+        self.assertEqual(bucket.wait_time(60), 0)
+        bucket.take(60)
+        self.assertAlmostEqual(bucket.wait_time(1), 1.0)
+
+        clock.now += 0.5
+        self.assertAlmostEqual(bucket.wait_time(1), 0.5)
+        clock.now += 0.5
+        self.assertEqual(bucket.wait_time(1), 0)
+
+    def test_oversized_request_capped_at_capacity(self):
+        """测试超过容量的请求按容量计算，不会永远等待"""
+        clock = FakeClock()
+        bucket = TokenBucket(100, clock=clock)
+        self.assertEqual(bucket.wait_time(1000), 0)
+
+
+class TestBackoff(unittest.TestCase):
+    """测试退避时间"""
+
+    def test_exponential_with_cap(self):
+        """测试退避上限按指数增长并受最大值限制"""
+
+        def upper(low, high):
+            return high
+
+        self.assertEqual(backoff_delay(0, 1, 60, rng=upper), 1)
+        self.assertEqual(backoff_delay(3, 1, 60, rng=upper), 8)
+        self.assertEqual(backoff_delay(10, 1, 60, rng=upper), 60)
+        self.assertLessEqual(backoff_delay(2, 1, 60), 4)
+
+    def test_detects_rate_limit_errors(self):
+        """测试识别429错误"""
+        self.assertTrue(is_rate_limit_error(RateLimitError()))
+        self.assertFalse(is_rate_limit_error(ValueError()))
+
+
+class TestRateLimiter(unittest.TestCase):
+    """测试准入控制"""
+
+    def test_unlimited_admits_immediately(self):
+        """测试未配置限流时直接放行"""
+        limiter = RateLimiter()
+        asyncio.run(limiter.acquire(100000))
+        self.assertEqual(limiter.stats["admitted"], 1)
+
+    def test_tokens_per_minute_spreads_calls(self):
+        """测试token桶耗尽后按补充速度放行"""
+        limiter = RateLimiter(tpm=6000)
+
+        async def run():
+            await limiter.acquire(6000)
+            start = time.monotonic()
+            await limiter.acquire(10)
+            return time.monotonic() - start
+
+        self.assertGreaterEqual(asyncio.run(run()), 0.08)
+
+    def test_priority_order_after_pause(self):
+        """测试暂停结束后按优先级依次放行，同优先级先到先放行"""
+        limiter = RateLimiter()
+        order = []
+
+        async def call(name, priority):
+            await limiter.acquire(1, priority)
+            order.append(name)
+
+        async def run():
+            limiter.pause(0.05)
+            await asyncio.gather(
+                call("map", PRIORITY_MAP),
+                call("single1", PRIORITY_SINGLE),
+                call("reduce", PRIORITY_REDUCE),
+                call("single2", PRIORITY_SINGLE),
+            )
+
+        asyncio.run(run())
+        self.assertEqual(order, ["reduce", "single1", "single2", "map"])
+        self.assertEqual(limiter.stats["rate_limited"], 1)
+
+    def test_cancelled_waiter_leaves_queue(self):
+        """测试取消的等待者离开队列，不阻塞后面的调用"""
+        limiter = RateLimiter()
+
+        async def run():
+            limiter.pause(0.05)
+            waiter = asyncio.ensure_future(limiter.acquire(1))
+            await asyncio.sleep(0.01)
+            waiter.cancel()
+            await asyncio.wait_for(limiter.acquire(1), timeout=1)
+
+        asyncio.run(run())
+        self.assertEqual(limiter._waiters, [])
+
+
+class TestMailProcessorRateLimit(unittest.TestCase):
+    """测试处理器遇到限流错误时重试"""
+
+    @patch("app.mail_processor.Runner")
+    def test_retries_after_rate_limit(self, mock_runner):
+        """测试429后退避重试成功，不丢弃邮件"""
+        mock_runner.run = AsyncMock(
+            side_effect=[RateLimitError("429"), Mock(final_output="分析结果")]
+        )
+        processor = MailProcessor()
+        self.addCleanup(processor.close)
+        processor.cache = None
+        processor.backoff_base = 0.01
+
+        result = processor.process_with_llm(EmailRecord(body_text="小明: 在吗？"))
+
+        self.assertEqual(result, "分析结果")
+        self.assertEqual(mock_runner.run.call_count, 2)
+        self.assertEqual(processor.llm_stats()["rate_limiter"]["rate_limited"], 1)
+
+    @patch("app.mail_processor.Runner")
+    def test_other_errors_not_retried(self, mock_runner):
+        """测试非限流错误不重试"""
+        mock_runner.run = AsyncMock(side_effect=ValueError("bad request"))
+        processor = MailProcessor()
+        self.addCleanup(processor.close)
+        processor.cache = None
+
+        with self.assertRaises(ValueError):
+            processor.process_with_llm(EmailRecord(body_text="小明: 在吗？"))
+        self.assertEqual(mock_runner.run.call_count, 1)
+
+    @patch("app.mail_processor.Runner")
+    def test_limiter_wait_excluded_from_deadline(self, mock_runner):
+        """测试限流排队的等待不计入LLM截止时间"""
+        mock_runner.run = AsyncMock(return_value=Mock(final_output="分析结果"))
+        processor = MailProcessor()
+        self.addCleanup(processor.close)
+        processor.cache = None
+        processor.config = Mock(
+            LLM_STREAMING=False,
+            LLM_DEADLINE=0.2,
+            CHAT_PREPROCESS=False,
+            LLM_CHUNK_TOKENS=10000,
+            LLM_MAP_CONCURRENCY=2,
+        )
+        processor.limiter.pause(0.5)
+
+        result = processor.process_with_llm(EmailRecord(body_text="小明: 在吗？"))
+
+        self.assertEqual(result, "分析结果")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+测试LLM响应缓存
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, Mock, patch
+
+from app.email_record import EmailRecord
+from app.mail_processor import MailProcessor
+from app.response_cache import ResponseCache, cache_key
+
+
+class TestCacheKey(unittest.TestCase):
+    """测试缓存键的规范化"""
+
+    def test_resent_chat_log_has_same_key(self):
+        """测试重新转发的相同聊天记录得到相同的键"""
+        original = "小明: 在吗？\n小红: 在的\n"
+        forwarded = (
+            "---------- Forwarded message ----------\r\n"
+            "> 小明:  在吗？\r\n\r\n"
+            "> 小红: 在的   \r\n"
+        )
+
+        self.assertEqual(
+            cache_key(original, "prompt", "model"),
+            cache_key(forwarded, "prompt", "model"),
+        )
+
+    def test_prompt_and_model_change_key(self):
+        """测试提示词或模型变化时缓存键不同"""
+        key = cache_key("聊天记录", "prompt", "model-a")
+
+        self.assertNotEqual(key, cache_key("聊天记录", "prompt", "model-b"))
+        self.assertNotEqual(key, cache_key("聊天记录", "new prompt", "model-a"))
+
+
+class TestResponseCache(unittest.TestCase):
+    """测试缓存读写、过期与淘汰"""
+
+    def test_hit_and_miss_counters(self):
+        """测试命中与未命中计数"""
+        cache = ResponseCache(":memory:", ttl=60, max_entries=10)
+
+        self.assertIsNone(cache.get("k"))
+        cache.set("k", "分析结果")
+        self.assertEqual(cache.get("k"), "分析结果")
+
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+        self.assertEqual(stats["entries"], 1)
+
+    def test_expired_entry_is_a_miss(self):
+        """测试过期条目视为未命中并被删除"""
+        cache = ResponseCache(":memory:", ttl=60, max_entries=10)
+        with patch("app.response_cache.time.time", return_value=1000):
+            cache.set("k", "v")
+        with patch("app.response_cache.time.time", return_value=1061):
+            self.assertIsNone(cache.get("k"))
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_least_recently_used_evicted(self):
+        """测试超出容量时淘汰最久未访问的条目"""
+        cache = ResponseCache(":memory:", ttl=float("inf"), max_entries=2)
+        with patch("app.response_cache.time.time", side_effect=[1, 2, 3, 4]):
+            cache.set("a", "1")
+            cache.set("b", "2")
+            cache.get("a")
+            cache.set("c", "3")
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), "1")
+        self.assertEqual(cache.get("c"), "3")
+
+    def test_persists_across_restarts(self):
+        """测试缓存写入磁盘后重启仍然可用"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "cache", "responses.sqlite3")
+            cache = ResponseCache(path, ttl=600, max_entries=10)
+            cache.set("k", "v")
+            cache.close()
+
+            reopened = ResponseCache(path, ttl=600, max_entries=10)
+            self.assertEqual(reopened.get("k"), "v")
+            reopened.close()
+
+
+class TestMailProcessorCache(unittest.TestCase):
+    """测试处理器复用缓存结果"""
+
+    @patch("app.mail_processor.Runner")
+    def test_duplicate_submission_skips_llm(self, mock_runner):
+        """测试重复提交的聊天记录不再调用LLM"""
+        mock_runner.run = AsyncMock(return_value=Mock(final_output="分析结果"))
+        processor = MailProcessor()
+        processor.cache = ResponseCache(":memory:", ttl=600, max_entries=10)
+
+        first = processor.process_with_llm(EmailRecord(body_text="小明: 在吗？"))
+        second = processor.process_with_llm(EmailRecord(body_text="> 小明: 在吗？\n"))
+
+        self.assertEqual(first, second)
+        mock_runner.run.assert_called_once()
+        self.assertEqual(processor.cache.hits, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
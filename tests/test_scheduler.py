@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+测试多账户调度
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+import queue
+import tempfile
+import unittest
+from unittest.mock import Mock
+
+from app.accounts import AccountConfig, load_accounts
+from app.email_record import EmailRecord
+from app.mail_pipeline import FairQueue
+from app.scheduler import MultiAccountScheduler
+
+
+def _account(name: str, source_email: str) -> AccountConfig:
+    return AccountConfig(
+        name=name,
+        source_email=source_email,
+        source_password="secret",
+        target_email=f"{name}@example.com",
+    )
+
+
+class TestFairQueue(unittest.TestCase):
+    """测试按账户轮转的公平队列"""
+
+    def test_round_robin_between_accounts(self):
+        """测试繁忙邮箱不会饿死其他邮箱"""
+        fair_queue = FairQueue(per_key_size=10)
+        for index in range(5):
+            fair_queue.put("busy", f"busy-{index}")
+        fair_queue.put("quiet", "quiet-0")
+
+        order = [fair_queue.get() for _ in range(6)]
+
+        self.assertEqual(order[:3], ["busy-0", "quiet-0", "busy-1"])
+
+    def test_capacity_is_per_account(self):
+        """测试一个邮箱队列满时不影响其他邮箱入队"""
+        fair_queue = FairQueue(per_key_size=1)
+        fair_queue.put("busy", 1)
+
+        with self.assertRaises(queue.Full):
+            fair_queue.put("busy", 2, timeout=0.01)
+        fair_queue.put("quiet", 3, timeout=0.01)
+        self.assertEqual(fair_queue.qsize(), 2)
+
+
+class TestLoadAccounts(unittest.TestCase):
+    """测试多账户配置文件读取"""
+
+    def _write(self, data) -> str:
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+            json.dump(data, f)
+        self.addCleanup(os.unlink, f.name)
+        return f.name
+
+    def test_defaults_and_overrides(self):
+        """测试未填写的服务器配置沿用全局默认值"""
+        path = self._write(
+            {
+                "accounts": [
+                    {
+                        "source_email": "a@qq.com",
+                        "source_password": "x",
+                        "target_email": "t@example.com",
+                    },
+                    {
+                        "name": "b",
+                        "source_email": "b@163.com",
+                        "source_password": "y",
+                        "target_email": "t@example.com",
+                        "imap_server": "imap.163.com",
+                        "imap_port": "993",
+                    },
+                ]
+            }
+        )
+
+        first, second = load_accounts(path)
+
+        self.assertEqual(first.name, "a@qq.com")
+        self.assertEqual(second.imap_server, "imap.163.com")
+        self.assertEqual(second.imap_port, 993)
+        self.assertEqual(second.sender_password, "y")
+
+    def test_missing_fields_rejected(self):
+        """测试缺少必要字段时报错"""
+        path = self._write([{"source_email": "a@qq.com"}])
+
+        with self.assertRaises(ValueError):
+            load_accounts(path)
+
+
+class TestMultiAccountScheduler(unittest.TestCase):
+    """测试调度器的资源共享与邮件路由"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.scheduler = MultiAccountScheduler(
+            [
+                _account("alice", "shared@qq.com"),
+                _account("bob", "shared@qq.com"),
+                _account("carol", "carol@qq.com"),
+            ]
+        )
+        self.scheduler.processor = Mock()
+        self.scheduler.processor.process.side_effect = lambda email_info: email_info
+        for mailbox in self.scheduler.mailboxes.values():
+            mailbox.fetcher = Mock()
+            mailbox.sender = Mock()
+            mailbox.sender.send_email.return_value = True
+
+    def test_smtp_pools_shared_by_credentials(self):
+        """测试相同SMTP账号的邮箱共享连接池"""
+        self.assertEqual(len(self.scheduler._pools), 2)
+
+    def test_email_routed_to_its_mailbox(self):
+        """测试邮件通过所属账户的连接发送和标记已读"""
+        mailboxes = self.scheduler.mailboxes
+
+        self.scheduler._handle_new_email(
+            EmailRecord(raw_subject="聊天记录", uid=5, account="bob")
+        )
+
+        mailboxes["bob"].sender.send_email.assert_called_once()
+        mailboxes["bob"].fetcher.mark_as_read.assert_called_once_with(5)
+        mailboxes["alice"].sender.send_email.assert_not_called()
+
+    def test_email_without_account_rejected(self):
+        """测试没有账户的邮件明确报错，而不是按 None 查找邮箱"""
+        with self.assertRaisesRegex(ValueError, "unknown account None"):
+            self.scheduler._handle_new_email(EmailRecord(uid=5))
+
+    def test_pollers_tag_account(self):
+        """测试每个邮箱的轮询器带有账户名称"""
+        self.assertEqual(self.scheduler.mailboxes["carol"].poller.account, "carol")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+测试邮件处理链路追踪
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+import tempfile
+import unittest
+from email.message import EmailMessage
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+from app.email_record import EmailRecord
+from app.llm_runtime import BackgroundLoop, TimedModel
+from app.mail_fetcher import MailFetcher
+from app.mail_handler import deliver_reply
+from app.tracing import JsonlExporter, SpanExporter, Tracer, load_exporter, tracer
+
+
+class MemoryExporter(SpanExporter):
+    """把 span 保存在列表中"""
+
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span):
+        self.spans.append(span)
+
+    def by_name(self, name):
+        return [span for span in self.spans if span["name"] == name]
+
+
+class UsageModel:
+    """返回带用量信息的假模型"""
+
+    async def get_response(self, *args, **kwargs):
+        return SimpleNamespace(
+            usage=SimpleNamespace(input_tokens=100, output_tokens=20)
+        )
+
+
+class TestTracer(unittest.TestCase):
+    """测试 span 的创建和导出"""
+
+    def setUp(self):
+        self.exporter = MemoryExporter()
+        self.tracer = Tracer(self.exporter)
+
+    def test_nested_spans_share_trace(self):
+        """测试嵌套的 span 属于同一 trace，子 span 记录上级 id，计数累加到上级"""
+        with self.tracer.span("llm", "t1", uid=7) as parent:
+            with self.tracer.span("llm_call") as child:
+                child.add(tokens_in=10)
+            child = self.tracer.start_span("llm_call")
+            child.add(tokens_in=5)
+            child.end()
+
+        llm = self.exporter.by_name("llm")[0]
+        calls = self.exporter.by_name("llm_call")
+        self.assertEqual(llm["trace_id"], "t1")
+        self.assertEqual(llm["attributes"], {"uid": 7, "tokens_in": 15})
+        self.assertEqual([c["parent_id"] for c in calls], [parent.span_id] * 2)
+        self.assertEqual({c["trace_id"] for c in calls}, {"t1"})
+
+    def test_error_recorded(self):
+        """测试代码块抛出异常时 span 标记为错误，异常继续抛出"""
+        with self.assertRaises(ValueError):
+            with self.tracer.span("send", "t1"):
+                raise ValueError("boom")
+
+        span = self.exporter.spans[0]
+        self.assertEqual(span["status"], "error")
+        self.assertEqual(span["error"], "ValueError: boom")
+
+    def test_disabled_is_noop(self):
+        """测试未启用时不导出也不分配 trace_id"""
+        disabled = Tracer()
+        with disabled.span("llm", "t1") as span:
+            span.set(a=1)
+        self.assertIsNone(span.trace_id)
+
+    def test_jsonl_exporter(self):
+        """测试 JSONL 导出器每个 span 写一行"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "traces", "spans.jsonl")
+            jsonl = Tracer(JsonlExporter(path))
+            jsonl.record("fetch", "t1", 1000.0, 0.25, uid=1, bytes=2048)
+            with jsonl.span("parse", "t1"):
+                pass
+            jsonl.close()
+
+            with open(path, encoding="utf-8") as f:
+                spans = [json.loads(line) for line in f]
+        self.assertEqual([s["name"] for s in spans], ["fetch", "parse"])
+        self.assertEqual(spans[0]["duration_ms"], 250.0)
+        self.assertEqual(spans[0]["attributes"]["bytes"], 2048)
+
+    def test_custom_exporter_loaded_by_path(self):
+        """测试按 模块:工厂 加载自定义导出器"""
+        exporter = load_exporter("tests.test_tracing:MemoryExporter", "unused")
+        self.assertIsInstance(exporter, MemoryExporter)
+
+
+class TestEmailTrace(unittest.TestCase):
+    """测试一封邮件在各阶段的 span"""
+
+    def setUp(self):
+        self.exporter = MemoryExporter()
+        tracer.exporter = self.exporter
+
+    def tearDown(self):
+        tracer.exporter = None
+
+    def test_fetch_and_parse_spans(self):
+        """测试解析时分配 trace_id，并记录所在批次的获取耗时"""
+        message = EmailMessage()
+        message["Subject"] = "聊天记录"
+        message.set_content("小明: 在吗？")
+        raw = message.as_bytes()
+        fetcher = MailFetcher()
+        fetcher._last_fetch = (1000.0, 0.5, 3)
+
+        record = fetcher.parse_raw_email(raw, uid=9)
+
+        self.assertIsNotNone(record.trace_id)
+        fetch = self.exporter.by_name("fetch")[0]
+        parse = self.exporter.by_name("parse")[0]
+        self.assertEqual(fetch["trace_id"], record.trace_id)
+        self.assertEqual(parse["trace_id"], record.trace_id)
+        self.assertEqual(fetch["attributes"]["batch_size"], 3)
+        self.assertEqual(parse["attributes"]["bytes"], len(raw))
+        # trace_id 随邮件进入持久化队列
+        self.assertEqual(
+            EmailRecord.from_dict(record.to_dict()).trace_id, record.trace_id
+        )
+
+    def test_model_calls_inherit_span_across_loop(self):
+        """测试在常驻事件循环中执行的模型调用记录为 LLM span 的子 span"""
+        model = TimedModel("fake", model=UsageModel())
+        loop = BackgroundLoop()
+        self.addCleanup(loop.close)
+
+        with tracer.span("llm", "t1") as span:
+            loop.run(model.get_response())
+
+        call = self.exporter.by_name("llm_call")[0]
+        self.assertEqual(call["parent_id"], span.span_id)
+        self.assertEqual(call["attributes"]["tokens_out"], 20)
+        self.assertEqual(
+            self.exporter.by_name("llm")[0]["attributes"]["tokens_in"], 100
+        )
+
+    def test_send_and_mark_read_spans(self):
+        """测试发送和标记已读记录在邮件的 trace 中"""
+        fetcher = Mock()
+        fetcher.get_state.return_value = None
+        fetcher.mark_as_read.return_value = True
+        sender = Mock()
+        sender.send_email.return_value = True
+
+        deliver_reply(
+            EmailRecord(uid=3, body_text="结果", trace_id="t9"), sender, fetcher
+        )
+
+        self.assertEqual(
+            [(s["name"], s["trace_id"]) for s in self.exporter.spans],
+            [("send", "t9"), ("mark_read", "t9")],
+        )
+        self.assertEqual(self.exporter.spans[0]["attributes"]["bytes"], 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
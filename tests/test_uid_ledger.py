@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+测试已处理邮件台账（UidLedger）及增量搜索、断点续处理
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+
+from app.mail_fetcher import MailFetcher
+from app.email_record import EmailRecord
+from app.mail_handler import handle_email
+from app.uid_ledger import DONE, FAILED, PENDING, SENT, SKIPPED, UidLedger
+
+
+class TestUidLedger(unittest.TestCase):
+    """测试台账的基本读写"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.ledger = UidLedger(":memory:")
+
+    def tearDown(self):
+        """清理测试环境"""
+        self.ledger.close()
+
+    def test_high_water_mark_only_moves_forward(self):
+        """测试高水位只增不减"""
+        self.assertIsNone(self.ledger.high_water_mark("a/INBOX", 1))
+        self.ledger.add_pending("a/INBOX", 1, [5], 10)
+        self.ledger.add_pending("a/INBOX", 1, [], 8)
+
+        self.assertEqual(self.ledger.high_water_mark("a/INBOX", 1), 10)
+
+    def test_unfinished_excludes_done_and_skipped(self):
+        """测试未完成列表只包含待处理和已发送未标记的邮件"""
+        self.ledger.add_pending("a/INBOX", 1, [1, 2, 3, 4], 4)
+        self.ledger.set_state("a/INBOX", 1, 2, SENT)
+        self.ledger.set_state("a/INBOX", 1, 3, DONE)
+        self.ledger.set_state("a/INBOX", 1, 4, SKIPPED)
+
+        self.assertEqual(self.ledger.unfinished("a/INBOX", 1), [1, 2])
+        self.assertEqual(self.ledger.get_state("a/INBOX", 1, 1), PENDING)
+
+    def test_add_pending_keeps_existing_state(self):
+        """测试重复登记不会覆盖已有状态"""
+        self.ledger.add_pending("a/INBOX", 1, [1], 1)
+        self.ledger.set_state("a/INBOX", 1, 1, DONE)
+        self.ledger.add_pending("a/INBOX", 1, [1], 1)
+
+        self.assertEqual(self.ledger.get_state("a/INBOX", 1, 1), DONE)
+
+    def test_state_survives_reopen(self):
+        """测试状态持久化到文件，重启后仍然存在"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "ledger.sqlite3")
+            ledger = UidLedger(path)
+            ledger.add_pending("a/INBOX", 1, [7], 7)
+            ledger.set_state("a/INBOX", 1, 7, SENT)
+            ledger.close()
+
+            reopened = UidLedger(path)
+            self.assertEqual(reopened.get_state("a/INBOX", 1, 7), SENT)
+            self.assertEqual(reopened.high_water_mark("a/INBOX", 1), 7)
+            reopened.close()
+
+
+class TestRetryBackoff(unittest.TestCase):
+    """测试处理失败的邮件按指数退避重试，超过次数后不再处理"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.now = 1000.0
+        self.ledger = UidLedger(
+            ":memory:", max_attempts=3, retry_delay=10, clock=lambda: self.now
+        )
+        self.ledger.add_pending("a/INBOX", 1, [1, 2], 2)
+
+    def tearDown(self):
+        """清理测试环境"""
+        self.ledger.close()
+
+    def test_failed_email_waits_until_due(self):
+        """测试失败的邮件在重试时间之前不会再被返回"""
+        self.assertFalse(self.ledger.record_failure("a/INBOX", 1, 1))
+
+        self.assertEqual(self.ledger.unfinished("a/INBOX", 1), [2])
+        self.now += 10
+        self.assertEqual(self.ledger.unfinished("a/INBOX", 1), [1, 2])
+
+    def test_retry_delay_doubles(self):
+        """测试每次失败后重试等待时间翻倍"""
+        self.ledger.record_failure("a/INBOX", 1, 1)
+        self.now += 10
+        self.ledger.record_failure("a/INBOX", 1, 1)
+
+        self.now += 19
+        self.assertEqual(self.ledger.unfinished("a/INBOX", 1), [2])
+        self.now += 1
+        self.assertEqual(self.ledger.unfinished("a/INBOX", 1), [1, 2])
+
+    def test_gives_up_after_max_attempts(self):
+        """测试超过最大尝试次数后进入失败状态，不再返回"""
+        results = [self.ledger.record_failure("a/INBOX", 1, 1) for _ in range(3)]
+
+        self.assertEqual(results, [False, False, True])
+        self.assertEqual(self.ledger.get_state("a/INBOX", 1, 1), FAILED)
+        self.now += 1000
+        self.assertEqual(self.ledger.unfinished("a/INBOX", 1), [2])
+
+    def test_migrates_old_table(self):
+        """测试旧版本的台账文件自动补充重试相关的列"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "ledger.sqlite3")
+            conn = sqlite3.connect(path)
+            conn.execute(
+                "CREATE TABLE messages (mailbox TEXT NOT NULL, "
+                "uidvalidity INTEGER NOT NULL, uid INTEGER NOT NULL, "
+                "state TEXT NOT NULL, updated_at REAL NOT NULL, "
+                "PRIMARY KEY (mailbox, uidvalidity, uid))"
+            )
+            conn.execute("INSERT INTO messages VALUES ('a/INBOX', 1, 7, 'pending', 0)")
+            conn.commit()
+            conn.close()
+
+            ledger = UidLedger(path)
+            try:
+                self.assertEqual(ledger.unfinished("a/INBOX", 1), [7])
+                self.assertFalse(ledger.record_failure("a/INBOX", 1, 7))
+            finally:
+                ledger.close()
+
+
+@patch("app.mail_fetcher.IMAPClient")
+class TestIncrementalSearch(unittest.TestCase):
+    """测试基于高水位的增量搜索"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.ledger = UidLedger(":memory:")
+
+    def tearDown(self):
+        """清理测试环境"""
+        self.ledger.close()
+
+    def _fetcher(self, mock_client_cls, uidvalidity=1, uidnext=11):
+        conn = mock_client_cls.return_value
+        conn.select_folder.return_value = {
+            b"UIDVALIDITY": uidvalidity,
+            b"UIDNEXT": uidnext,
+        }
+        return MailFetcher(ledger=self.ledger), conn
+
+    def test_first_run_bootstraps_from_unseen(self, mock_client_cls):
+        """测试首次运行以未读邮件建立高水位"""
+        fetcher, conn = self._fetcher(mock_client_cls)
+        conn.search.return_value = [4, 9]
+
+        self.assertEqual(fetcher.search_new_emails(), [4, 9])
+        conn.search.assert_called_once_with(["UNSEEN"])
+        self.assertEqual(self.ledger.high_water_mark("default/INBOX", 1), 10)
+
+    def test_later_runs_search_above_high_water(self, mock_client_cls):
+        """测试之后只搜索高水位以上的UID，并带上未完成的邮件"""
+        self.ledger.add_pending("default/INBOX", 1, [3], 10)
+        fetcher, conn = self._fetcher(mock_client_cls)
+        # UID 11:* 在没有新邮件时仍会返回最后一封邮件
+        conn.search.return_value = [10, 12]
+
+        self.assertEqual(fetcher.search_new_emails(), [3, 12])
+        conn.search.assert_called_once_with(["UID", "11:*"])
+        self.assertEqual(self.ledger.high_water_mark("default/INBOX", 1), 12)
+
+    def test_uidvalidity_change_starts_over(self, mock_client_cls):
+        """测试UIDVALIDITY变化后旧记录失效，重新建立高水位"""
+        self.ledger.add_pending("default/INBOX", 1, [3], 10)
+        fetcher, conn = self._fetcher(mock_client_cls, uidvalidity=2, uidnext=5)
+        conn.search.return_value = [2]
+
+        self.assertEqual(fetcher.search_new_emails(), [2])
+        conn.search.assert_called_once_with(["UNSEEN"])
+        self.assertEqual(fetcher.uidvalidity, 2)
+
+
+class TestResumableHandling(unittest.TestCase):
+    """测试处理流程按台账状态断点续处理"""
+
+    def setUp(self):
+        """设置测试环境"""
+        self.ledger = UidLedger(":memory:")
+        self.fetcher = MailFetcher(ledger=self.ledger)
+        self.fetcher.mark_as_read = Mock(return_value=True)
+        self.processor = Mock()
+        self.processor.process.side_effect = lambda email_info: email_info
+        self.sender = Mock()
+        self.sender.send_email.return_value = True
+        self.ledger.add_pending(self.fetcher.mailbox_id, 1, [5], 5)
+        self.email_info = EmailRecord(raw_subject="聊天记录", uid=5, uidvalidity=1)
+
+    def tearDown(self):
+        """清理测试环境"""
+        self.ledger.close()
+
+    def _state(self):
+        return self.ledger.get_state(self.fetcher.mailbox_id, 1, 5)
+
+    def test_successful_email_is_done(self):
+        """测试发送并标记已读后状态为完成"""
+        handle_email(self.email_info, self.processor, self.sender, self.fetcher)
+
+        self.sender.send_email.assert_called_once()
+        self.assertEqual(self._state(), DONE)
+
+    def test_sent_email_is_not_resent(self):
+        """测试已发送但未标记已读的邮件重启后只补标记，不重复发送"""
+        self.ledger.set_state(self.fetcher.mailbox_id, 1, 5, SENT)
+
+        handle_email(self.email_info, self.processor, self.sender, self.fetcher)
+
+        self.processor.process.assert_not_called()
+        self.sender.send_email.assert_not_called()
+        self.fetcher.mark_as_read.assert_called_once_with(5)
+        self.assertEqual(self._state(), DONE)
+
+    def test_mark_failure_keeps_sent_state(self):
+        """测试标记已读失败时保留已发送状态，下次重试标记"""
+        self.fetcher.mark_as_read.return_value = False
+
+        handle_email(self.email_info, self.processor, self.sender, self.fetcher)
+
+        self.assertEqual(self._state(), SENT)
+
+    def test_done_email_is_skipped(self):
+        """测试已完成的邮件不会再次处理"""
+        self.ledger.set_state(self.fetcher.mailbox_id, 1, 5, DONE)
+
+        handle_email(self.email_info, self.processor, self.sender, self.fetcher)
+
+        self.sender.send_email.assert_not_called()
+
+    def test_own_reply_is_recorded_as_skipped(self):
+        """测试机器人自己发出的邮件被记录为跳过"""
+        self.email_info = EmailRecord(
+            raw_subject="[EmailLLM] 回复", uid=5, uidvalidity=1
+        )
+
+        handle_email(self.email_info, self.processor, self.sender, self.fetcher)
+
+        self.assertEqual(self._state(), SKIPPED)
+
+    def test_send_failure_is_retried_later(self):
+        """测试发送失败时记录失败次数，邮件延迟后再重试"""
+        self.sender.send_email.return_value = False
+
+        handle_email(self.email_info, self.processor, self.sender, self.fetcher)
+
+        self.assertEqual(self._state(), PENDING)
+        self.assertEqual(self.ledger.unfinished(self.fetcher.mailbox_id, 1), [])
+
+    def test_repeated_errors_give_up(self):
+        """测试LLM处理反复出错的邮件超过次数后不再处理"""
+        self.processor.process.side_effect = RuntimeError("LLM error")
+
+        for _ in range(self.ledger.max_attempts):
+            handle_email(self.email_info, self.processor, self.sender, self.fetcher)
+        handle_email(self.email_info, self.processor, self.sender, self.fetcher)
+
+        self.assertEqual(self._state(), FAILED)
+        self.assertEqual(self.processor.process.call_count, self.ledger.max_attempts)
+
+
+if __name__ == "__main__":
+    unittest.main()